@@ -1,19 +1,20 @@
 import argparse
+import hashlib
+import json
 import os
 import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 # Add parent directory to path to import MicrocodeConfig
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Microcode'))
-from MicrocodeConfig import ParseConfig, GetAllInstructionOpcodes, GetAllInstructionSizes
-
-try:
-    import hexdump
-except ModuleNotFoundError:
-    hexdump = None
-
+from MicrocodeConfig import ParseConfig, GetAllInstructionOpcodes, GetAllInstructionSizes, GetAllInstructionMasks
+from Preprocessor import INCLUDE_DIRECTIVE, Preprocessor
+from Optimizer import PeepholeOptimizer, Rewrite
 
 startupCode =  os.path.join(os.path.dirname(__file__), "..", "Bootloader", "Init.S")
 programEntry = "__app_main"
+configPath   = os.path.join(os.path.dirname(__file__), "..", "Microcode", "MicroCodeConfig.yaml")
 
 MAX_VAL_UNSIGNED_8_BIT = 255
 MIN_VAL_UNSIGNED_8_BIT = 0
@@ -24,6 +25,25 @@ MAX_MEM_ADDRESS        = 0x80
 
 PADDING_CHAR           = 0xFF
 
+OBJECT_FORMAT          = "8bit-asm-object-2"
+EXPORT_DIRECTIVE       = ".EXPORT"
+IMPORT_DIRECTIVE       = ".IMPORT"
+LINK_DIRECTIVES        = (EXPORT_DIRECTIVE, IMPORT_DIRECTIVE)
+
+# Operand kinds of the encoding table
+OPERAND_REGISTER         = "register"
+OPERAND_SPECIAL_REGISTER = "special register"
+OPERAND_IMMEDIATE        = "immediate"
+OPERAND_MEMORY_ADDRESS   = "memory address"
+OPERAND_ROM_ADDRESS      = "ROM address"
+
+# The opcode masks only tell where operands go, not what they are
+SPECIAL_REGISTER_INSTRUCTIONS = ('WTSR', 'RDSR')
+MEMORY_ADDRESS_INSTRUCTIONS   = ('LDM', 'SAV')
+
+REGISTERS         = {'A': 0b00, 'B': 0b01, 'C': 0b10, 'D': 0b11}
+SPECIAL_REGISTERS = {'SP': 0b00, 'MDR': 0b01}
+
 def isInt(s):
     try:
         int(s)
@@ -52,601 +72,648 @@ def isBinary(s):
         return False
 
 
+def parseNumber(s):
+    if isInt(s):
+        return int(s)
+    if isBinary(s):
+        return int(s, 2)
+    if isHex(s):
+        return int(s, 16)
+    return None
+
+
 def get2sComplement(value):
     if value < 0:
         value = (1 << 8) + value
     return value
 
 
-class Compiler:
-    def __init__(self, assemblyFile, outFile, silent, padding, unsigned, noBootloader):
-        if not os.path.exists(assemblyFile):
-            print(f"{assemblyFile} not found!!!")
-            exit(-1)
-
-        try:
-            f = open(assemblyFile, 'r')
-            assembly = f.read()
-            f.close()
-        except Exception as e:
-            print(f"Not able to open the {assemblyFile}!!!")
-            exit(-1)
-
-        if not noBootloader:
-            try:
-                f = open(startupCode, 'r')
-                startup = f.read()
-                self.bootloaderLineNum = len(startup.split("\n"))
-                f.close()
-            except Exception as e:
-                print(f"Not able to open the {startupCode}!!!")
-                exit(-1)
-
-            self.assemblyMain       = str(startup) + f"\n{programEntry}:\n" + str(assembly)
+class InstructionEncoding(NamedTuple):
+    opcode: int
+    size: int
+    registerKind: Optional[str]     # OPERAND_REGISTER or OPERAND_SPECIAL_REGISTER
+    registerShifts: Tuple[int, ...] # Bit position of each 2-bit register field, in operand order
+    valueKind: Optional[str]        # Operand stored in the bytes after the opcode
+
+
+def buildEncodingTable(config):
+    # Register fields are the 'x' pairs of the opcode mask, first operand in
+    # the high pair; the instruction size gives the trailing value operand.
+    opcodes = GetAllInstructionOpcodes(config)
+    sizes   = GetAllInstructionSizes(config)
+    table   = {}
+
+    for mnemonic, mask in GetAllInstructionMasks(config).items():
+        fieldBits = [7 - position for position, bit in enumerate(mask) if bit == 'x']
+        registerShifts = tuple(fieldBits[1::2])
+
+        registerKind = None
+        if registerShifts:
+            registerKind = OPERAND_SPECIAL_REGISTER if mnemonic in SPECIAL_REGISTER_INSTRUCTIONS else OPERAND_REGISTER
+
+        size = sizes[mnemonic]
+        if size == 1:
+            valueKind = None
+        elif size == 2:
+            valueKind = OPERAND_MEMORY_ADDRESS if mnemonic in MEMORY_ADDRESS_INSTRUCTIONS else OPERAND_IMMEDIATE
+        elif size == 3:
+            valueKind = OPERAND_ROM_ADDRESS
         else:
-            self.assemblyMain       = assembly
-
-        self.assemblyFile       = assemblyFile
-        self.outFile            = outFile
-        self.silent             = silent
-        self.paddingEnabled     = padding
-        self.unsigned           = unsigned
-        self.noBootloader       = noBootloader
-        self.tagDict            = dict()
-        self.binArr             = bytearray()
-        self.sourceMaxLength    = 0
-        self.tagMaxLength       = 0
-        self.addressIndex       = 0
-        self.logBuffer          = []
-        self.registerList       = ['A', 'B', 'C', 'D']
-        self.registerDict       = {
-            'A': 0b00,
-            'B': 0b01,
-            'C': 0b10,
-            'D': 0b11
+            raise ValueError(f"{mnemonic}: unsupported instruction size {size}")
+
+        table[mnemonic] = InstructionEncoding(opcodes[mnemonic], size, registerKind, registerShifts, valueKind)
+    return table
+
+
+class Diagnostic(NamedTuple):
+    location: str   # Source name, or "bootloader"
+    line: int       # 1-based line number within location
+    text: str       # The offending source line as written
+    message: str
+
+    def __str__(self):
+        return f"'{self.text}' at line no {self.line} of {self.location} is not able to compile!!!\nERROR: {self.message}"
+
+
+class SourceMapEntry(NamedTuple):
+    address: int
+    size: int
+    location: str
+    line: int
+    text: str       # Source line after comment stripping and upper-casing
+
+
+class Relocation(NamedTuple):
+    offset: int     # Of the high address byte, within its object
+    tag: str
+    location: str   # Source position of the referencing line, for diagnostics
+    line: int
+    text: str
+
+
+@dataclass
+class AssemblyResult:
+    binary: bytes                  # Incomplete when there are diagnostics
+    symbols: Dict[str, int]        # Tag -> ROM address, in definition order
+    sourceMap: List[SourceMapEntry]
+    diagnostics: List[Diagnostic]
+    lines: List[str]               # Preprocessed source lines, bootloader included
+    rewrites: List[Rewrite] = field(default_factory=list)   # Peephole changes, with -O
+
+    @property
+    def success(self):
+        return not self.diagnostics
+
+
+@dataclass
+class ObjectFile:
+    # Relocatable output of one source: addresses are relative to the start
+    # of the object and every tag operand is a Relocation until link()
+    name: str
+    binary: bytes
+    symbols: Dict[str, int]        # Tag -> offset
+    exports: List[str]             # Tags other objects may reference (.export)
+    imports: List[str]             # Tags expected from other objects (.import)
+    relocations: List[Relocation]
+    sourceMap: List[SourceMapEntry]
+    diagnostics: List[Diagnostic]
+    lines: List[str]
+    dependencies: Dict[str, str]   # Included file -> sha256 of its content
+    rewrites: List[Rewrite] = field(default_factory=list)
+
+    def toJson(self):
+        return {
+            'format'      : OBJECT_FORMAT,
+            'name'        : self.name,
+            'binary'      : self.binary.hex(),
+            'symbols'     : self.symbols,
+            'exports'     : self.exports,
+            'imports'     : self.imports,
+            'relocations' : self.relocations,
+            'sourceMap'   : self.sourceMap,
+            'diagnostics' : self.diagnostics,
+            'lines'       : self.lines,
+            'dependencies': self.dependencies,
+            'rewrites'    : self.rewrites,
         }
-        self.specialRegisterList= ['SP', 'MDR']
-        self.specialRegisterDict= {
-            'SP' : 0b00,
-            'MDR': 0b01
-        }
-        self.allowedGpRegStr    = ', '.join(self.registerList)
-        self.allowedSpRegStr    = ', '.join(self.specialRegisterList)
-
-        # Load instruction opcodes and sizes from centralized config
-        configPath = os.path.join(os.path.dirname(__file__), '..', 'Microcode', 'MicroCodeConfig.yaml')
-        config = ParseConfig(configPath)
-        self.instructionDict = GetAllInstructionOpcodes(config)
-        self.instructionSizeDict = GetAllInstructionSizes(config)
-
-        self.preProcess()
-        self.compile()
 
-        if not self.silent:
-            print()
-            for item in self.logBuffer:
-                print(item)
-
-            print("\nTAGs")
-            for key, value in self.tagDict.items():
-                print(f"0x{value:04X}: {key}")
-
-            print("\n\n  Binary  ", end = "")
-            for col in range(0x8):
-                print(f"{col:02X} ", end = "")
-            print(" ", end = "")
-            for col in range(0x8, 0x10):
-                print(f"{col:02X} ", end = "")
-            print("\n          ------------------------------------------------")
-
-            if self.paddingEnabled:
-                originalLen = len(self.binArr)
-                tmpArr = self.binArr.copy()
-                align16andOneLine = ((originalLen + 15) // 16 * 16) + 16
-                paddingBytes = bytearray([PADDING_CHAR] * (align16andOneLine - originalLen))
-                tmpArr.extend(paddingBytes)
-                if hexdump is not None:
-                    hexdump.hexdump(tmpArr)
-                print()
-                print(".... .... [elided middle padding bytes] .... ....")
-                print()
-                # Print the last full 16-byte line of the ROM space as padding
-                last_line_addr = ((MAX_ROM_ADDRESS_11_BIT + 1 - 16) // 16) * 16  # e.g., 0x07F0 for 2KB
-                # Hex groups (8 + 8) and ASCII column (dots for non-printables)
-                hex_left  = " ".join(f"{PADDING_CHAR:02X}" for _ in range(8))
-                hex_right = " ".join(f"{PADDING_CHAR:02X}" for _ in range(8))
-                ascii_col = "." * 16
-                print(f"{last_line_addr:08X}: {hex_left}  {hex_right}  {ascii_col}")
+    @classmethod
+    def fromJson(cls, data):
+        if data.get('format') != OBJECT_FORMAT:
+            raise ValueError(f"not an {OBJECT_FORMAT} object")
+        return cls(
+            name         = data['name'],
+            binary       = bytes.fromhex(data['binary']),
+            symbols      = data['symbols'],
+            exports      = data['exports'],
+            imports      = data['imports'],
+            relocations  = [Relocation(*item) for item in data['relocations']],
+            sourceMap    = [SourceMapEntry(*item) for item in data['sourceMap']],
+            diagnostics  = [Diagnostic(*item) for item in data['diagnostics']],
+            lines        = data['lines'],
+            dependencies = data['dependencies'],
+            rewrites     = [Rewrite(*item) for item in data.get('rewrites', [])],
+        )
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.toJson(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls.fromJson(json.load(f))
+
+
+class Chunk(NamedTuple):
+    # Position independent encoding of the lines from one tag up to the next.
+    # Offsets are relative to the chunk's first byte, line offsets to its
+    # first line; every tag operand is left to the link step as a fixup.
+    binary: bytes
+    tags: Tuple[Tuple[str, int, int], ...]          # (tag, offset, lineOffset)
+    fixups: Tuple[Tuple[int, str, int], ...]        # (offset, tag, lineOffset)
+    sourceMap: Tuple[Tuple[int, int, int], ...]     # (offset, size, lineOffset)
+    diagnostics: Tuple[Tuple[int, str], ...]        # (lineOffset, message)
+    exports: Tuple[Tuple[str, int], ...]            # (tag, lineOffset)
+    imports: Tuple[Tuple[str, int], ...]            # (tag, lineOffset)
+
+
+class AssemblyError(Exception):
+    pass
+
+
+_encodingTable = None
+_bootloaderSource = None
+
+
+def getEncodingTable():
+    global _encodingTable
+    if _encodingTable is None:
+        _encodingTable = buildEncodingTable(ParseConfig(configPath))
+    return _encodingTable
+
+
+def getBootloaderSource():
+    global _bootloaderSource
+    if _bootloaderSource is None:
+        with open(startupCode, 'r') as f:
+            _bootloaderSource = f.read()
+    return _bootloaderSource
+
+
+def preProcess(source):
+    # Strip, drop ';' and '@' comments and upper-case; one entry per source line
+    lines = [line.strip() for line in source.split("\n")]
+    lines = [line.split(";")[0] for line in lines]
+    lines = [line.split("@")[0] for line in lines]
+    return [line.upper() for line in lines]
+
+
+def isTagLine(line):
+    return line[-1:] == ":" and len(line.replace(",", " ").split()) == 1
+
+
+def assembleObject(source, *, unsigned = False, bootloader = False, name = "<source>", includePaths = (), cache = None,
+                   optimize = False):
+    # Assembles source text into a relocatable ObjectFile. With an
+    # AssemblyCache, an unchanged input (included files too) is answered from
+    # the cache and only edited chunks (see Chunk) are encoded again.
+    # optimize runs the PeepholeOptimizer; its changes are in .rewrites.
+    includePaths = tuple(includePaths)
+    if cache is None:
+        return Assembler(source, unsigned, bootloader, name, includePaths, optimize=optimize).run()
+
+    key = cache.key(source, unsigned, bootloader, name, includePaths, optimize)
+    objectFile = cache.load(key)
+    if objectFile is None:
+        objectFile = Assembler(source, unsigned, bootloader, name, includePaths, cache.chunks, optimize).run()
+        cache.store(key, objectFile)
+    return objectFile
+
+
+def assemble(source, *, unsigned = False, bootloader = True, name = "<source>", includePaths = (),
+             libraries = (), cache = None, optimize = False):
+    # Assembles source text in memory and links it, followed by the library
+    # ObjectFiles, into a ROM image. Nothing is printed, written or exited;
+    # errors come back as result.diagnostics.
+    objectFile = assembleObject(source, unsigned=unsigned, bootloader=bootloader, name=name,
+                                includePaths=includePaths, cache=cache, optimize=optimize)
+    return link([objectFile] + list(libraries))
+
+
+def link(objects):
+    # Lays the objects out one after another from address 0 and resolves
+    # every relocation, to a tag of the same object first, else to an export.
+    binArr      = bytearray()
+    symbols     = dict()
+    exports     = dict()
+    sourceMap   = []
+    diagnostics = []
+    lines       = []
+    rewrites    = []
+    bases       = []
+
+    for objectFile in objects:
+        base = len(binArr)
+        bases.append(base)
+        binArr += objectFile.binary
+        diagnostics.extend(objectFile.diagnostics)
+        lines.extend(objectFile.lines)
+        rewrites.extend(objectFile.rewrites)
+        sourceMap.extend(entry._replace(address=base + entry.address) for entry in objectFile.sourceMap)
+
+        for tag, offset in objectFile.symbols.items():
+            # Tags local to a later object may repeat a name already in use
+            symbols[tag if tag not in symbols else f"{objectFile.name}:{tag}"] = base + offset
+        for tag in objectFile.exports:
+            if tag in exports:
+                diagnostics.append(Diagnostic(objectFile.name, 0, f".EXPORT {tag}",
+                                              f"Tag '{tag}' is already exported at address 0x{exports[tag]:04X}"))
+            elif tag in objectFile.symbols:
+                exports[tag] = base + objectFile.symbols[tag]
+
+    for objectFile, base in zip(objects, bases):
+        for offset, tag, location, line, text in objectFile.relocations:
+            if tag in objectFile.symbols:
+                address = base + objectFile.symbols[tag]
+            elif tag in exports:
+                address = exports[tag]
             else:
-                if hexdump is not None:
-                    hexdump.hexdump(self.binArr)
-
-
-    def preProcess(self):
-        # split each line
-        self.assemblyMain = str(self.assemblyMain).split("\n")
-        self.assemblyLine = [line.strip() for line in self.assemblyMain]
-
-        # remove comments
-        self.assemblyLine = [line.split(";")[0] for line in self.assemblyLine]
-        self.assemblyLine = [line.split("@")[0] for line in self.assemblyLine]
-
-        # make all upper case
-        self.assemblyLine = [line.upper() for line in self.assemblyLine]
-
-        # get max size of lines
-        for line in self.assemblyLine:
-            length = len(line)
-            if length > self.sourceMaxLength:
-                self.sourceMaxLength = length
-
-        # write intermediate file for debug
-        if not self.silent:
-            tempName = ".".join((self.assemblyFile).split(".")[:-1])
-            tempName = f"{tempName}.i"
-            f = open(tempName, "w")
-            tagFound = False
-            for line in self.assemblyLine:
-                lineStripped = line.strip()
-                if lineStripped:  # Only write non-empty lines
-                    if lineStripped[-1] == ":":
-                        tagFound = True
-                        f.write(f"\n{lineStripped}\n")
-                    elif tagFound:
-                        f.write(f"    {lineStripped}\n")
-                    else:
-                        f.write(f"{lineStripped}\n")
-            f.close()
-
-
-    def printCompiledLine(self, line, instruc, value1 = None, value2 = None):
-        binary  = f"{instruc:08b}"
-        addr_binary = f"{self.addressIndex:011b}"
-        tags    = [key for key, instruc in self.tagDict.items() if instruc == self.addressIndex]
-
-        if not tags:
-            tagStr = " "*(self.tagMaxLength + 1)
-            printLine = ""
-        elif len(tags) == 1:
-            tagStr = f"{tags[0]+':':>{self.tagMaxLength + 1}}"
-            printLine = ""
-        else:
-            # Multiple tags - add all but last with newlines (right-aligned)
-            printLine = "\n".join(f"{tag+':':>{self.tagMaxLength + 1}}" for tag in tags[:-1]) + "\n"
-            tagStr = f"{tags[-1]+':':>{self.tagMaxLength + 1}}"
-
-        printLine += f"{tagStr} 0x{self.addressIndex:04X} [{addr_binary[:3]}_{addr_binary[3:7]}_{addr_binary[7:]}]: "
-        printLine += f"{line:{self.sourceMaxLength}} | Code: "
-        printLine += f"{binary[:4]}_{binary[4:]} "
-
-        if value1 == None: # Value2 ofcourse null
-            printLine += f"                     // 0x{instruc:02X}"
-
-
-        if value1 != None and value2 == None: # Only one value send
-            binary = f"{value1:08b}"
-            printLine += f" {binary[:4]}_{binary[4:]} "
-            printLine += f"          // 0x{instruc:02X} 0x{value1:02X}"
-
-        if value1 != None and value2 != None: # Both high and low address send
-            binary1 = f"{value1:08b}"
-            binary2 = f"{value2:08b}"
-            printLine += f" {binary1[:4]}_{binary1[4:]} {binary2[:4]}_{binary2[4:]} "
-            printLine += f"// 0x{instruc:02X} 0x{value1:02X} 0x{value2:02X}"
-
-        self.logBuffer.append(printLine)
-
-
-    def compile(self):
-        def errorPrint(index, error=None):
-            isInsideBootloader = not self.noBootloader and index < self.bootloaderLineNum
-            errorLine = self.assemblyMain[index]
-
-            if not self.noBootloader and not isInsideBootloader:
-                index -= self.bootloaderLineNum + 1
-
-            location = "bootloader" if isInsideBootloader else self.assemblyFile
-            errorString = f"'{errorLine}' at line no {index + 1} of {location} is not able to compile!!!"
-            if error is not None:
-                errorString += f"\nERROR: {error}"
-
-            print(errorString)
-            exit(-1)
-
-
-        ## Parsing logic the tags first
-        self.addressIndex = 0
-        for index, line in enumerate(self.assemblyLine):
-            if not line:
+                diagnostics.append(Diagnostic(location, line, text, f"Imported tag '{tag}' is not exported by any linked object!!"))
                 continue
-
-            splitData         = line.split()
-            splitData         = [element for item in splitData for element in item.split(',') if element]
-            opcode            = splitData[0]
-
-            if len(splitData) == 1 and line[-1] == ":":
-                tag = line[:-1].upper()
-                if tag in self.tagDict:
-                    errorPrint(index, f"Tag '{tag}' is already defined at address 0x{self.tagDict[tag]:04X}")
-                self.tagDict[tag] = self.addressIndex
-                if len(tag) > self.tagMaxLength:
-                    self.tagMaxLength = len(tag)
+            if address > MAX_ROM_ADDRESS_11_BIT:
+                diagnostics.append(Diagnostic(location, line, text, "Max ROM address limit cross!!"))
                 continue
-            if opcode in self.instructionSizeDict:
-                self.addressIndex += self.instructionSizeDict[opcode]
-            else:
-                errorPrint(index, f"'{opcode}' is not supported instruction!!")
+            binArr[base + offset]     = address >> 8
+            binArr[base + offset + 1] = address & 0xff
+
+    return AssemblyResult(bytes(binArr), symbols, sourceMap, diagnostics, lines, rewrites)
+
+
+class Assembler:
+    def __init__(self, source, unsigned, bootloader, name, includePaths = (), chunkCache = None, optimize = False):
+        self.name           = name
+        self.unsigned       = unsigned
+        self.includePaths   = includePaths
+        self.chunkCache     = chunkCache
+        self.encodingTable  = getEncodingTable()
+        self.binArr         = bytearray()
+        self.fixups         = []
+        self.rawLines       = []
+        self.origins        = []    # (location, 1-based line) of each entry of rawLines
+        self.includeLines   = []    # Indexes of the .include lines themselves
+        self.badIncludes    = []    # (line index, message), reported unless the .include is in a dropped branch
+        self.dependencies   = dict()
+        self.problems       = []    # (line index, message), reported in source order
+        self.allowedRegStr  = {
+            OPERAND_REGISTER        : ', '.join(REGISTERS),
+            OPERAND_SPECIAL_REGISTER: ', '.join(SPECIAL_REGISTERS)
+        }
 
+        if bootloader:
+            self.expandSource(getBootloaderSource(), "bootloader", [os.path.abspath(startupCode)])
+            # The program entry tag counts as line 0 of the program
+            self.rawLines.append(f"{programEntry}:")
+            self.origins.append((name, 0))
+        self.expandSource(source, name, [os.path.abspath(name)])
+        self.strippedLines = preProcess("\n".join(self.rawLines))
+        for index in self.includeLines:
+            self.strippedLines[index] = INCLUDE_DIRECTIVE
+
+        reservedNames = list(REGISTERS) + list(SPECIAL_REGISTERS) + list(self.encodingTable) + list(LINK_DIRECTIVES)
+        self.preprocessor = Preprocessor(reservedNames)
+        self.lines        = []  # Preprocessor output, what the encoder sees
+        self.lineSources  = []  # Index into rawLines of each entry of lines
+        self.optimizer    = PeepholeOptimizer(self.encodingTable, LINK_DIRECTIVES) if optimize else None
+
+
+    def findInclude(self, fileName, location):
+        includingFile = startupCode if location == "bootloader" else location
+        searchPaths = [os.path.dirname(includingFile)] + list(self.includePaths)
+        for directory in searchPaths:
+            path = os.path.join(directory, fileName)
+            if os.path.isfile(path):
+                return path
+        return None
+
+
+    def expandSource(self, source, location, includeStack):
+        # Copies source into rawLines, replacing each .include line by the
+        # lines of the named file, searched next to the including file first
+        for lineNumber, rawLine in enumerate(source.split("\n"), 1):
+            index = len(self.rawLines)
+            self.rawLines.append(rawLine)
+            self.origins.append((location, lineNumber))
+
+            statement = rawLine.strip().split(";")[0].split("@")[0].strip()
+            if statement[:8].upper() != INCLUDE_DIRECTIVE or statement[8:9] not in ("", " ", "\t", '"', "'"):
+                continue
 
-        ## Parsing for each line
-        self.addressIndex = 0
-        for index, line in enumerate(self.assemblyLine):
+            self.includeLines.append(index)
+            fileName = statement[8:].strip().strip("\"'")
+            path = self.findInclude(fileName, location) if fileName else None
+            if path is None:
+                self.badIncludes.append((index, f"Included file '{fileName}' not found!!"))
+            elif os.path.abspath(path) in includeStack:
+                self.badIncludes.append((index, f"'{fileName}' includes itself!!"))
+            else:
+                with open(path, 'rb') as f:
+                    content = f.read()
+                self.dependencies[path] = hashlib.sha256(content).hexdigest()
+                self.expandSource(content.decode(), path, includeStack + [os.path.abspath(path)])
+
+
+    def location(self, index):
+        return self.origins[index]
+
+
+    def diagnostic(self, index, message):
+        location, line = self.location(index)
+        return Diagnostic(location, line, self.rawLines[index], message)
+
+
+    def encodeValue(self, kind, payload, lineOffset):
+        # Returns the operand bytes, or None for a tag left to the link step
+        if kind == OPERAND_ROM_ADDRESS:
+            address = parseNumber(payload)
+            if address is None:
+                self.fixups.append((len(self.binArr), payload, lineOffset))
+                return None
+            if not 0 <= address <= MAX_ROM_ADDRESS_11_BIT:
+                raise AssemblyError("Max ROM address limit cross!!")
+            return (address >> 8, address & 0xff)
+
+        value = parseNumber(payload)
+        if value is None:
+            raise AssemblyError(f"{payload} is not a valid value!! for Binary or Hex, use 0b or 0x prefix respectively.")
+
+        if kind == OPERAND_MEMORY_ADDRESS:
+            if not 0 <= value < MAX_MEM_ADDRESS:
+                raise AssemblyError("Max memory address limit cross!!")
+        elif self.unsigned:
+            if not (MIN_VAL_UNSIGNED_8_BIT <= value <= MAX_VAL_UNSIGNED_8_BIT):
+                raise AssemblyError("Value out of unsigned 8-bit range!")
+        elif not (MIN_VAL_SIGNED_8_BIT <= value <= MAX_VAL_UNSIGNED_8_BIT):
+            # Positive values up to 255 are taken as already 2's complement
+            raise AssemblyError(f"Value '{value}' out of signed 8-bit range!")
+        return (get2sComplement(value),)
+
+
+    def encodeInstruction(self, encoding, payloadList, lineOffset):
+        payloadLen = len(payloadList)
+        expected   = len(encoding.registerShifts) + (encoding.valueKind is not None)
+        if payloadLen != expected:
+            if expected == 0:
+                raise AssemblyError(f"No payload expected!! but found {payloadLen}")
+            if encoding.valueKind == OPERAND_MEMORY_ADDRESS:
+                raise AssemblyError(f"{expected} payload expected!! but found {payloadLen}")
+            raise AssemblyError(f"{expected} payload expected!!, but found {payloadLen}")
+
+        bitVal = encoding.opcode
+        if encoding.registerKind is not None:
+            registers = SPECIAL_REGISTERS if encoding.registerKind == OPERAND_SPECIAL_REGISTER else REGISTERS
+            for payload, shift in zip(payloadList, encoding.registerShifts):
+                if payload not in registers:
+                    allowed = self.allowedRegStr[encoding.registerKind]
+                    if encoding.valueKind is not None:
+                        raise AssemblyError(f"Destination register not found!! allowed registers are {allowed}")
+                    raise AssemblyError(f"'{payload}' is not a register!! allowed registers are {allowed}")
+                bitVal |= registers[payload] << shift
+
+        self.binArr.append(bitVal)
+        if encoding.valueKind is not None:
+            valueBytes = self.encodeValue(encoding.valueKind, payloadList[-1], lineOffset)
+            self.binArr.extend(valueBytes or bytes(encoding.size - 1))
+
+
+    def encodeChunk(self, lines):
+        # A line in error is reported and still takes its size, so the
+        # addresses after it stay right
+        self.binArr = bytearray()
+        self.fixups = []
+        tags        = []
+        sourceMap   = []
+        diagnostics = []
+        exports     = []
+        imports     = []
+
+        for lineOffset, line in enumerate(lines):
             if not line:
                 continue
 
-            splitData   = line.split()
-            splitData   = [element for item in splitData for element in item.split(',') if element]
-            opcode      = splitData[0]
-            payloadList = splitData[1:]
-            payloadLen  = len(payloadList)
-            bitVal      = 0
-
-            # remove if any ',' in the instruction
-            payloadList = [part.replace(",", "") for part in payloadList]
-
-            ## Parse ADD, SUB, MOV command | Format: SSDD_0001, SSDD_0010, SSDD_0110
-            if opcode == "ADD" or opcode == "SUB" or opcode == "MOV":
-                if payloadLen != 2:
-                    errorPrint(index, f"2 payload expected!!, but found {payloadLen}")
-
-                for payload in payloadList:
-                    if payload not in self.registerList:
-                        errorPrint(index, f"'{payload}' is not a register!! allowed registers are {self.allowedGpRegStr}")
-
-                if payloadList[0] == payloadList[1]: # Ignore the 'mov a a' or 'mov b b'; its NOP ..
-                    pass
-
-                if payloadLen == 2:
-                    for payload in payloadList:
-                        bitVal = bitVal << 2
-                        bitVal = bitVal | self.registerDict[payload]
-
-                    bitVal = bitVal << 4
-                    bitVal = bitVal | self.instructionDict[opcode]
-
-                if not self.silent:
-                    self.printCompiledLine(line, bitVal)
-
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
-
-
-            ## Parse SHL, SHR, INC, DEC, NOT commands  | Format: RRTT_0011, RR00_1010
-            elif opcode == "SHL" or opcode == "SHR" or opcode == "INC" or opcode == "DEC" or opcode == "NOT":
-                if payloadLen != 1:
-                    errorPrint(index, f"1 payload expected!!, but found {payloadLen}")
-
-                for payload in payloadList:
-                    if payload not in self.registerList:
-                        errorPrint(index, f"'{payload}' is not a register!! allowed registers are {self.allowedGpRegStr}")
-
-                payload = payloadList[0]
-                bitVal = bitVal | self.registerDict[payload]
-
-                bitVal = bitVal << 6 # INC, DEC are 6 bit
-                bitVal = bitVal | self.instructionDict[opcode]
-
-                if not self.silent:
-                    self.printCompiledLine(line, bitVal)
-
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
-
-
-            ## Parse JMP, JMZ, JNZ, JMC, JME, JMG, JML command | Format: 0TTT_0101
-            elif opcode == "JMP" or opcode == "JMZ" or opcode == "JNZ" or \
-                opcode == "JMC" or opcode == "JME" or opcode == "JMG" or opcode == "JML":
-                if payloadLen != 1:
-                    errorPrint(index, f"1 payload expected!!, but found {payloadLen}")
-
-                payload = payloadList[0]
-                address = 0xFF # Default value
-                if isInt(payload):
-                    address = int(payload)
-                elif isBinary(payload):
-                    address = int(payload, 2)
-                elif isHex(payload):
-                    address = int(payload, 16)
-                elif payload in self.tagDict:
-                    address = self.tagDict[payload]
-                else:
-                    errorPrint(index, f"'{payload}' is not a proper address!! for Binary or Hex, use 0b or 0x prefix respectively.")
-
-                if address > MAX_ROM_ADDRESS_11_BIT:
-                        errorPrint(index, "Max ROM address limit cross!!")
-
-                bitVal = self.instructionDict[opcode] # JMP, JMZ, JNZ are 8 bit
-
-                if not self.silent:
-                    highAddress = address >> 8
-                    lowAddress = address & 0xff
-                    self.printCompiledLine(line, bitVal, highAddress, lowAddress)
-
-
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
-
-                highAddress = address >> 8
-                lowAddress = address & 0xff
-                self.binArr.append(highAddress)
-                self.binArr.append(lowAddress)
-                self.addressIndex += 2
-
-
-            ## Parse LDI, CMI, CMIS command | Format: RRTT_0100, RRTT_1101
-            elif opcode == "LDI" or opcode == "CMI" or opcode == "CMIS":
-                if payloadLen != 2:
-                    errorPrint(index, f"2 payload expected!!, but found {payloadLen}")
-
-                destReg = payloadList[0]
-                if destReg not in self.registerList:
-                        errorPrint(index, f"Destination register not found!! allowed registers are {self.allowedGpRegStr}")
-
-                immediateVal = payloadList[1]
-                if isInt(immediateVal):
-                    immediateVal = int(immediateVal)
-                elif isBinary(immediateVal):
-                    immediateVal = int(immediateVal, 2)
-                elif isHex(immediateVal):
-                    immediateVal = int(immediateVal, 16)
-                else:
-                    errorPrint(index, f"{immediateVal} is not a valid value!! for Binary or Hex, use 0b or 0x prefix respectively.")
-                    immediateVal = 0
-
-                if self.unsigned:
-                    if not (MIN_VAL_UNSIGNED_8_BIT <= immediateVal <= MAX_VAL_UNSIGNED_8_BIT):
-                        errorPrint(index, "Value out of unsigned 8-bit range!")
-                    if immediateVal < 0:
-                        errorPrint(index, "Negative value not allowed in unsigned mode!")
-                else:
-                    if immediateVal < 0: # if negative value then check if must be greater than or equal to -128
-                        if immediateVal < MIN_VAL_SIGNED_8_BIT:
-                            errorPrint(index, f"Value '{immediateVal}' out of signed 8-bit range!")
-                        else:
-                            immediateVal = get2sComplement(immediateVal)
-                    else:
-                        # if positive value then user might want as 2's complement value; but still is <= 255
-                        if immediateVal > MAX_VAL_UNSIGNED_8_BIT:
-                            errorPrint(index, f"Value '{immediateVal}' out of signed 8-bit range!")
-
-                bitVal = bitVal | self.registerDict[destReg]
-
-                bitVal = bitVal << 6 # LDI, CMI, CMIS are 6 bit
-                bitVal = bitVal | self.instructionDict[opcode]
-
-                if not self.silent:
-                    self.printCompiledLine(line, bitVal, immediateVal)
-
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
-
-                self.binArr.append(immediateVal)
-                self.addressIndex += 1
-
-
-            ## Parse WTSR, RDSR command | Format: SR01_0000, SR10_0000
-            elif opcode == "WTSR" or opcode == "RDSR":
-                if payloadLen != 1:
-                    errorPrint(index, f"1 payload expected!!, but found {payloadLen}")
-
-                for payload in payloadList:
-                    if payload not in self.specialRegisterList:
-                        errorPrint(index, f"'{payload}' is not a register!! allowed registers are {self.allowedSpRegStr}")
-
-                payload = payloadList[0]
-                bitVal = bitVal | self.specialRegisterDict[payload]
-
-                bitVal = bitVal << 6 # WTSR, RDSR are 6 bit
-                bitVal = bitVal | self.instructionDict[opcode]
-
-                if not self.silent:
-                    self.printCompiledLine(line, bitVal)
-
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
-
-
-            ## Parse LDM, SAV command | Format: RRTT_0100
-            elif opcode == "LDM" or opcode == "SAV":
-                if payloadLen != 2:
-                    errorPrint(index, f"2 payload expected!! but found {payloadLen}")
-
-                destReg = payloadList[0]
-                if destReg not in self.registerList:
-                        errorPrint(index, f"Destination register not found!! allowed registers are {self.allowedGpRegStr}")
-
-                memAddress = payloadList[1]
-                if isInt(memAddress):
-                    memAddress = int(memAddress)
-                elif isBinary(memAddress):
-                    memAddress = int(memAddress, 2)
-                elif isHex(memAddress):
-                    memAddress = int(memAddress, 16)
-                else:
-                    errorPrint(index, f"{memAddress} is not a valid value!! for Binary or Hex, use 0b or 0x prefix respectively.")
-                    memAddress = 0
-
-                if memAddress >= MAX_MEM_ADDRESS:
-                    errorPrint(index, "Max memory address limit cross!!")
-
-                bitVal = bitVal | self.registerDict[destReg]
-
-                bitVal = bitVal << 6 # LDM, SAV are 6 bit
-                bitVal = bitVal | self.instructionDict[opcode]
-
-                if not self.silent:
-                    self.printCompiledLine(line, bitVal, memAddress)
-
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
-
-                self.binArr.append(memAddress)
-                self.addressIndex += 1
-
-
-            ## Parse PUSH, POP command | Format: RRTT_1110
-            elif opcode == "PUSH" or opcode == "POP":
-                if payloadLen != 1:
-                    errorPrint(index, f"1 payload expected!!, but found {payloadLen}")
-
-                reg = payloadList[0]
-                if reg not in self.registerList:
-                    errorPrint(index, f"'{reg}' is not a register!! allowed registers are {self.allowedGpRegStr}")
-
-                bitVal = bitVal | self.registerDict[reg]
-                bitVal = bitVal << 6
-                bitVal = bitVal | self.instructionDict[opcode]
-
-                if not self.silent:
-                    self.printCompiledLine(line, bitVal)
+            if isTagLine(line):
+                tags.append((line[:-1], len(self.binArr), lineOffset))
+                continue
 
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
+            tokens = line.replace(",", " ").split()
+            opcode = tokens[0] if tokens else line
+            if opcode in LINK_DIRECTIVES:
+                if len(tokens) == 1:
+                    diagnostics.append((lineOffset, f"'{opcode}' needs at least one tag!!"))
+                target = exports if opcode == EXPORT_DIRECTIVE else imports
+                target.extend((tag, lineOffset) for tag in tokens[1:])
+                continue
 
+            encoding = self.encodingTable.get(opcode)
+            if encoding is None:
+                diagnostics.append((lineOffset, f"'{opcode}' is not supported instruction!!"))
+                continue
 
-            ## Parse PSHV command | Format: 0011_1110 VV
-            elif opcode == "PSHV":
-                if payloadLen != 1:
-                    errorPrint(index, f"1 payload expected!!, but found {payloadLen}")
+            offset = len(self.binArr)
+            fixupCount = len(self.fixups)
+            try:
+                self.encodeInstruction(encoding, tokens[1:], lineOffset)
+            except AssemblyError as e:
+                diagnostics.append((lineOffset, str(e)))
+                del self.binArr[offset:]
+                del self.fixups[fixupCount:]
+                self.binArr.extend(bytes(encoding.size))
+                continue
 
-                immediateVal = payloadList[0]
-                if isInt(immediateVal):
-                    immediateVal = int(immediateVal)
-                elif isBinary(immediateVal):
-                    immediateVal = int(immediateVal, 2)
-                elif isHex(immediateVal):
-                    immediateVal = int(immediateVal, 16)
+            sourceMap.append((offset, encoding.size, lineOffset))
+
+        return Chunk(bytes(self.binArr), tuple(tags), tuple(self.fixups), tuple(sourceMap), tuple(diagnostics),
+                     tuple(exports), tuple(imports))
+
+
+    def splitChunks(self):
+        # (position in self.lines, lines) from each tag line up to the next
+        # one, cut from the preprocessor output as it is produced. The
+        # optimizer needs the whole program first.
+        statements = self.preprocessor.process(enumerate(self.strippedLines))
+        if self.optimizer is not None:
+            statements = self.optimizer.run(statements)
+
+        start = 0
+        chunkLines = []
+        for index, line in statements:
+            if chunkLines and line and isTagLine(line):
+                yield start, chunkLines
+                start += len(chunkLines)
+                chunkLines = []
+            self.lines.append(line)
+            self.lineSources.append(index)
+            chunkLines.append(line)
+        yield start, chunkLines
+
+
+    def getChunk(self, lines):
+        if self.chunkCache is None:
+            return self.encodeChunk(lines)
+
+        text = "\n".join([str(self.unsigned)] + lines)
+        key = hashlib.sha256(text.encode()).hexdigest()
+        chunk = self.chunkCache.get(key)
+        if chunk is None:
+            chunk = self.encodeChunk(lines)
+            self.chunkCache[key] = chunk
+        return chunk
+
+
+    def run(self):
+        binArr      = bytearray()
+        symbols     = dict()
+        sourceMap   = []
+        problems    = self.problems
+        sources     = self.lineSources
+        fixups      = []
+        exports     = []
+        imports     = []
+
+        for start, lines in self.splitChunks():
+            chunk = self.getChunk(lines)
+            base = len(binArr)
+            binArr += chunk.binary
+
+            for tag, offset, lineOffset in chunk.tags:
+                if tag in symbols:
+                    problems.append((sources[start + lineOffset], f"Tag '{tag}' is already defined at address 0x{symbols[tag]:04X}"))
                 else:
-                    errorPrint(index, f"{immediateVal} is not a valid value!! for Binary or Hex, use 0b or 0x prefix respectively.")
-                    immediateVal = 0
-
-                if self.unsigned:
-                    if not (MIN_VAL_UNSIGNED_8_BIT <= immediateVal <= MAX_VAL_UNSIGNED_8_BIT):
-                        errorPrint(index, "Value out of unsigned 8-bit range!")
-                    if immediateVal < 0:
-                        errorPrint(index, "Negative value not allowed in unsigned mode!")
-                else:
-                    if immediateVal < 0:
-                        if immediateVal < MIN_VAL_SIGNED_8_BIT:
-                            errorPrint(index, f"Value '{immediateVal}' out of signed 8-bit range!")
-                        else:
-                            immediateVal = get2sComplement(immediateVal)
-                    else:
-                        if immediateVal > MAX_VAL_UNSIGNED_8_BIT:
-                            errorPrint(index, f"Value '{immediateVal}' out of signed 8-bit range!")
-
-                bitVal = self.instructionDict[opcode]
-
-                if not self.silent:
-                    self.printCompiledLine(line, bitVal, immediateVal)
-
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
-
-                self.binArr.append(immediateVal)
-                self.addressIndex += 1
-
-
-            ## Parse CALL command | Format: 0111_1110 AA
-            elif opcode == "CALL":
-                if payloadLen != 1:
-                    errorPrint(index, f"1 payload expected!!, but found {payloadLen}")
-
-                payload = payloadList[0]
-                address = 0xFF
-                if isInt(payload):
-                    address = int(payload)
-                elif isBinary(payload):
-                    address = int(payload, 2)
-                elif isHex(payload):
-                    address = int(payload, 16)
-                elif payload in self.tagDict:
-                    address = self.tagDict[payload]
-                else:
-                    errorPrint(index, f"'{payload}' is not a proper address!! for Binary or Hex, use 0b or 0x prefix respectively.")
-
-                if address > MAX_ROM_ADDRESS_11_BIT:
-                    errorPrint(index, "Max ROM address limit cross!!")
-
-                bitVal = self.instructionDict[opcode]
-
-                if not self.silent:
-                    highAddress = address >> 8
-                    lowAddress = address & 0xff
-                    self.printCompiledLine(line, bitVal, highAddress, lowAddress)
-
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
+                    symbols[tag] = base + offset
+            for offset, size, lineOffset in chunk.sourceMap:
+                location, line = self.location(sources[start + lineOffset])
+                sourceMap.append(SourceMapEntry(base + offset, size, location, line, lines[lineOffset]))
+            problems.extend((sources[start + lineOffset], message) for lineOffset, message in chunk.diagnostics)
+            fixups.extend((base + offset, tag, sources[start + lineOffset]) for offset, tag, lineOffset in chunk.fixups)
+            exports.extend((tag, sources[start + lineOffset]) for tag, lineOffset in chunk.exports)
+            imports.extend(tag for tag, _ in chunk.imports)
+
+        problems.extend(self.preprocessor.problems)
+        problems.extend(problem for problem in self.badIncludes if problem[0] in self.preprocessor.includes)
+
+        for tag, index in exports:
+            if tag not in symbols:
+                problems.append((index, f"Exported tag '{tag}' is not defined!!"))
+
+        relocations = []
+        for offset, tag, index in fixups:
+            if tag not in symbols and tag not in imports:
+                problems.append((index, f"'{tag}' is not a proper address!! for Binary or Hex, use 0b or 0x prefix respectively."))
+                continue
+            location, line = self.location(index)
+            relocations.append(Relocation(offset, tag, location, line, self.rawLines[index]))
 
-                highAddress = address >> 8
-                lowAddress = address & 0xff
-                self.binArr.append(highAddress)
-                self.binArr.append(lowAddress)
-                self.addressIndex += 2
+        problems.sort(key=lambda problem: problem[0])
+        diagnostics = [self.diagnostic(index, message) for index, message in problems]
 
+        rewrites = []
+        if self.optimizer is not None:
+            for index, rule, bytesSaved, cyclesSaved, stepsSaved in sorted(self.optimizer.rewrites,
+                                                                           key=lambda rewrite: rewrite[0]):
+                location, line = self.location(index)
+                rewrites.append(Rewrite(location, line, self.rawLines[index].strip(), rule, bytesSaved, cyclesSaved,
+                                        stepsSaved, self.optimizer.stepSource))
 
-            ## Parse HLT, NOP, OUT, OUTS, RTN, RST commands | Format: 00TT_0000, 00TT_1110, 1111_1111
-            elif opcode == "HLT" or opcode == "NOP" or opcode == "OUT" or opcode == "OUTS" or opcode == "RTN" or opcode == "RST":
-                if payloadLen != 0:
-                    errorPrint(index, f"No payload expected!! but found {payloadLen}")
+        return ObjectFile(self.name, bytes(binArr), symbols, list(dict.fromkeys(tag for tag, _ in exports)),
+                          list(dict.fromkeys(imports)), relocations, sourceMap, diagnostics, self.lines,
+                          self.dependencies, rewrites)
 
-                bitVal = self.instructionDict[opcode] # HLT, NOP, OUT, RST are 8 bit
 
-                if not self.silent:
-                    self.printCompiledLine(line, bitVal)
+class Compiler:
+    # Command line front end: reads the file, writes the .bin or .o (and,
+    # unless silent, the .i file and a listing), and exits on the first errors
+    def __init__(self, assemblyFile, outFile, silent, padding, unsigned, noBootloader, cacheDir = None,
+                 listingFile = None, includePaths = (), libraries = (), emitObject = False, optimize = False):
+        if not os.path.exists(assemblyFile):
+            print(f"{assemblyFile} not found!!!")
+            exit(-1)
 
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
+        try:
+            f = open(assemblyFile, 'r')
+            assembly = f.read()
+            f.close()
+        except Exception as e:
+            print(f"Not able to open the {assemblyFile}!!!")
+            exit(-1)
 
+        cache = None
+        if cacheDir is not None:
+            from AssemblyCache import AssemblyCache
+            cache = AssemblyCache(cacheDir)
 
-            ## Parse AND, OR, XOR, CMP, CMPS, LDR, STR command | Format: SSDD_0111, SSDD_1000, SSDD_1001, SSDD_1011, SSDD_1100
-            elif opcode == "AND" or opcode == "OR" or opcode == "XOR" or opcode == "CMP" or opcode == "CMPS" or opcode == "LDR" or opcode == "STR":
-                if payloadLen != 2:
-                    errorPrint(index, f"2 payload expected!!, but found {payloadLen}")
+        objects = []
+        for library in libraries:
+            try:
+                objects.append(ObjectFile.load(library))
+            except Exception as e:
+                print(f"Not able to open the {library}!!!")
+                exit(-1)
 
-                for payload in payloadList:
-                    if payload not in self.registerList:
-                        errorPrint(index, f"'{payload}' is not a register!! allowed registers are {self.allowedGpRegStr}")
+        try:
+            objectFile = assembleObject(assembly, unsigned=unsigned, bootloader=not noBootloader, name=assemblyFile,
+                                        includePaths=includePaths, cache=cache, optimize=optimize)
+        except OSError as e:
+            print(f"Not able to open the {startupCode}!!!")
+            exit(-1)
 
-                for payload in payloadList:
-                    bitVal = bitVal << 2
-                    bitVal = bitVal | self.registerDict[payload]
+        if emitObject:
+            self.result = AssemblyResult(objectFile.binary, objectFile.symbols, objectFile.sourceMap,
+                                         objectFile.diagnostics, objectFile.lines, objectFile.rewrites)
+        else:
+            self.result = link([objectFile] + objects)
 
-                bitVal = bitVal << 4
-                bitVal = bitVal | self.instructionDict[opcode]
+        from Listing import writeIntermediate, writeListing, writeRewrites
 
-                if not self.silent:
-                    self.printCompiledLine(line, bitVal)
+        self.assemblyFile       = assemblyFile
+        self.outFile            = outFile
+        self.silent             = silent
+        self.paddingEnabled     = padding
 
-                self.binArr.append(bitVal)
-                self.addressIndex += 1
+        if not self.silent:
+            # write intermediate file for debug
+            tempName = ".".join((self.assemblyFile).split(".")[:-1])
+            with open(f"{tempName}.i", "w") as f:
+                writeIntermediate(self.result.lines, f)
 
+        if not self.result.success:
+            for diagnostic in self.result.diagnostics:
+                print(diagnostic)
+            exit(-1)
 
-            # Looks like a TAG
-            elif opcode[-1] == ":":
-                pass
-            else:
-                errorPrint(index, "No supported instruction found!!")
+        if emitObject:
+            objectFile.save(self.outFile)
+            if optimize and not self.silent:
+                writeRewrites(self.result.rewrites, sys.stdout)
+            return
 
         f = open(self.outFile, 'wb')
-        f.write(self.binArr)
+        f.write(self.result.binary)
         if self.paddingEnabled:
-            paddingSize = MAX_ROM_ADDRESS_11_BIT - len(self.binArr) + 1
+            paddingSize = MAX_ROM_ADDRESS_11_BIT - len(self.result.binary) + 1
             if paddingSize > 0:
                 paddingBytes = bytearray([PADDING_CHAR] * paddingSize)
                 f.write(paddingBytes)
         f.close()
 
+        if listingFile is not None:
+            with open(listingFile, "w") as f:
+                writeListing(self.result, f, self.paddingEnabled)
+        elif not self.silent:
+            writeListing(self.result, sys.stdout, self.paddingEnabled)
+
+        if optimize and not self.silent:
+            writeRewrites(self.result.rewrites, sys.stdout)
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -690,6 +757,50 @@ def main():
         help   = "Do not include bootloader"
     )
 
+    parser.add_argument(
+        "-c",
+        "--cache",
+        default = None,
+        help    = "Reuse results and unchanged code from this cache directory"
+    )
+
+    parser.add_argument(
+        "-l",
+        "--listing",
+        default = None,
+        help    = "Write the listing to this file instead of the console"
+    )
+
+    parser.add_argument(
+        "-I",
+        "--include",
+        action  = 'append',
+        default = [],
+        help    = "Also search this directory for .include files"
+    )
+
+    parser.add_argument(
+        "-obj",
+        "--object",
+        action = 'store_true',
+        help   = "Write a relocatable object file instead of a binary"
+    )
+
+    parser.add_argument(
+        "-O",
+        "--optimize",
+        action = 'store_true',
+        help   = "Run the peephole optimizer and report what it saved"
+    )
+
+    parser.add_argument(
+        "-L",
+        "--link",
+        action  = 'append',
+        default = [],
+        help    = "Link this object file after the program"
+    )
+
     args = parser.parse_args()
     assemblyFile = args.assemblyFile
     outFile      = args.out
@@ -698,7 +809,8 @@ def main():
     unsigned     = args.unsigned
     noBootloader = args.no_bootloader
 
-    compile = Compiler(assemblyFile, outFile, silent, padding, unsigned, noBootloader)
+    compile = Compiler(assemblyFile, outFile, silent, padding, unsigned, noBootloader, args.cache, args.listing,
+                       args.include, args.link, args.object, args.optimize)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+
+from Assembler import Chunk, ObjectFile, configPath, getBootloaderSource
+from Optimizer import microcodeBankPaths
+
+
+CACHE_FORMAT_VERSION = 3
+
+
+def hashFiles(*paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def writeJson(path, data):
+    # Write then rename, so parallel builds never read a half written entry
+    tempPath = f"{path}.{os.getpid()}.tmp"
+    with open(tempPath, 'w') as f:
+        json.dump(data, f)
+    os.replace(tempPath, path)
+
+
+def readJson(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ChunkStore:
+    # Encoded chunks by content hash, in memory and one file per chunk
+    def __init__(self, directory):
+        self.directory = directory
+        self.chunks = dict()
+        os.makedirs(directory, exist_ok=True)
+
+
+    def get(self, key):
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            data = readJson(os.path.join(self.directory, f"{key}.json"))
+            if data is not None:
+                chunk = Chunk(bytes.fromhex(data[0]), *(tuple(tuple(item) for item in field) for field in data[1:]))
+                self.chunks[key] = chunk
+        return chunk
+
+
+    def __setitem__(self, key, chunk):
+        self.chunks[key] = chunk
+        writeJson(os.path.join(self.directory, f"{key}.json"), [chunk.binary.hex()] + list(chunk[1:]))
+
+
+class AssemblyCache:
+    # On-disk cache of assembled objects, keyed by everything the output
+    # depends on: source, bootloader, ISA config and the code that reads it,
+    # assembler code and flags.
+    # Included files are checked against the hashes recorded with the entry.
+    # Chunks are shared between programs and survive edits elsewhere in a file.
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        toolDir = os.path.dirname(__file__)
+        tools = [os.path.join(toolDir, tool) for tool in ('Assembler.py', 'Preprocessor.py', 'Optimizer.py')]
+        # MicrocodeConfig.py turns the config into the opcodes, sizes and masks the encoder uses
+        self.toolHash = hashFiles(configPath, *tools, os.path.join(toolDir, '..', 'Microcode', 'MicrocodeConfig.py'),
+                                  os.path.join(toolDir, '..', 'Emulator', 'utils', 'helpers.py'),
+                                  os.path.join(toolDir, '..', 'Emulator', 'core', 'microcode_cycles.py'))
+        self.chunks = ChunkStore(os.path.join(cacheDir, 'chunks', self.toolHash[:16]))
+
+
+    def key(self, source, unsigned, bootloader, name, includePaths = (), optimize = False):
+        digest = hashlib.sha256()
+        header = [str(CACHE_FORMAT_VERSION), self.toolHash, str(unsigned), str(bootloader), str(optimize), name]
+        if optimize:
+            # The optimizer report counts microcode steps from the built banks
+            bankPaths = microcodeBankPaths()
+            header.append("no microcode" if None in bankPaths else hashFiles(*bankPaths))
+        header += list(includePaths)
+        digest.update("\n".join(header).encode())
+        if bootloader:
+            digest.update(getBootloaderSource().encode())
+        digest.update(b"\0" + source.encode())
+        return digest.hexdigest()
+
+
+    def load(self, key):
+        data = readJson(os.path.join(self.cacheDir, f"{key}.json"))
+        if data is None:
+            return None
+        objectFile = ObjectFile.fromJson(data)
+        for path, contentHash in objectFile.dependencies.items():
+            if not os.path.isfile(path) or hashFiles(path) != contentHash:
+                return None
+        return objectFile
+
+
+    def store(self, key, objectFile):
+        writeJson(os.path.join(self.cacheDir, f"{key}.json"), objectFile.toJson())
@@ -0,0 +1,123 @@
+from collections import defaultdict
+
+from Assembler import MAX_ROM_ADDRESS_11_BIT, PADDING_CHAR
+
+try:
+    import hexdump
+except ModuleNotFoundError:
+    hexdump = None
+
+
+def buildTagIndex(symbols):
+    # address -> tags defined there, in definition order
+    tagIndex = defaultdict(list)
+    for tag, address in symbols.items():
+        tagIndex[address].append(tag)
+    return tagIndex
+
+
+def formatCompiledLine(address, tags, tagWidth, line, sourceWidth, code):
+    instruc = code[0]
+    binary  = f"{instruc:08b}"
+    addr_binary = f"{address:011b}"
+
+    if not tags:
+        tagStr = " "*tagWidth
+        printLine = ""
+    else:
+        # Multiple tags - all but last on lines of their own (right-aligned)
+        printLine = "".join(f"{tag+':':>{tagWidth}}\n" for tag in tags[:-1])
+        tagStr = f"{tags[-1]+':':>{tagWidth}}"
+
+    printLine += f"{tagStr} 0x{address:04X} [{addr_binary[:3]}_{addr_binary[3:7]}_{addr_binary[7:]}]: "
+    printLine += f"{line:{sourceWidth}} | Code: "
+    printLine += f"{binary[:4]}_{binary[4:]} "
+
+    if len(code) == 1:
+        printLine += f"                     // 0x{instruc:02X}"
+    elif len(code) == 2: # Immediate value or memory address
+        binary = f"{code[1]:08b}"
+        printLine += f" {binary[:4]}_{binary[4:]} "
+        printLine += f"          // 0x{instruc:02X} 0x{code[1]:02X}"
+    else: # High and low ROM address
+        binary1 = f"{code[1]:08b}"
+        binary2 = f"{code[2]:08b}"
+        printLine += f" {binary1[:4]}_{binary1[4:]} {binary2[:4]}_{binary2[4:]} "
+        printLine += f"// 0x{instruc:02X} 0x{code[1]:02X} 0x{code[2]:02X}"
+
+    return printLine
+
+
+def writeIntermediate(lines, stream):
+    # Comment-free, upper-cased source with the code under each tag indented
+    tagFound = False
+    for line in lines:
+        lineStripped = line.strip()
+        if lineStripped:  # Only write non-empty lines
+            if lineStripped[-1] == ":":
+                tagFound = True
+                stream.write(f"\n{lineStripped}\n")
+            elif tagFound:
+                stream.write(f"    {lineStripped}\n")
+            else:
+                stream.write(f"{lineStripped}\n")
+
+
+def writeHexdump(data, stream):
+    if hexdump is not None:
+        for line in hexdump.hexdump(data, result='generator'):
+            stream.write(f"{line}\n")
+
+
+def writeListing(result, stream, padding = False):
+    # Streams the listing of a successful AssemblyResult: one line per
+    # instruction, the tag table and a hexdump of the image
+    tagIndex    = buildTagIndex(result.symbols)
+    tagWidth    = max((len(tag) for tag in result.symbols), default=0) + 1
+    sourceWidth = max(len(line) for line in result.lines)
+    binary      = result.binary
+
+    stream.write("\n")
+    for entry in result.sourceMap:
+        code = binary[entry.address:entry.address + entry.size]
+        stream.write(formatCompiledLine(entry.address, tagIndex.get(entry.address), tagWidth,
+                                        entry.text, sourceWidth, code) + "\n")
+
+    stream.write("\nTAGs\n")
+    for key, value in result.symbols.items():
+        stream.write(f"0x{value:04X}: {key}\n")
+
+    stream.write("\n\n  Binary  ")
+    stream.write("".join(f"{col:02X} " for col in range(0x8)) + " ")
+    stream.write("".join(f"{col:02X} " for col in range(0x8, 0x10)))
+    stream.write("\n          ------------------------------------------------\n")
+
+    if padding:
+        originalLen = len(binary)
+        align16andOneLine = ((originalLen + 15) // 16 * 16) + 16
+        writeHexdump(binary + bytes([PADDING_CHAR] * (align16andOneLine - originalLen)), stream)
+        stream.write("\n.... .... [elided middle padding bytes] .... ....\n\n")
+        # Print the last full 16-byte line of the ROM space as padding
+        last_line_addr = ((MAX_ROM_ADDRESS_11_BIT + 1 - 16) // 16) * 16  # e.g., 0x07F0 for 2KB
+        # Hex groups (8 + 8) and ASCII column (dots for non-printables)
+        hex_left  = " ".join(f"{PADDING_CHAR:02X}" for _ in range(8))
+        hex_right = " ".join(f"{PADDING_CHAR:02X}" for _ in range(8))
+        ascii_col = "." * 16
+        stream.write(f"{last_line_addr:08X}: {hex_left}  {hex_right}  {ascii_col}\n")
+    else:
+        writeHexdump(binary, stream)
+
+
+def writeRewrites(rewrites, stream):
+    # Peephole report: one line per change and the totals
+    stream.write("\nPeephole optimizer\n")
+    # Cycles are the emulator's instruction costs, steps the clock steps of
+    # the microcode sequences (instruction costs again without built banks)
+    for rewrite in rewrites:
+        stream.write(f"{rewrite.location}:{rewrite.line}: {rewrite.text:24} {rewrite.rule}, "
+                     f"saves {rewrite.bytesSaved} bytes, {rewrite.cyclesSaved} cycles, "
+                     f"{rewrite.stepsSaved} steps ({rewrite.stepSource})\n")
+    totalBytes  = sum(rewrite.bytesSaved for rewrite in rewrites)
+    totalCycles = sum(rewrite.cyclesSaved for rewrite in rewrites)
+    totalSteps  = sum(rewrite.stepsSaved for rewrite in rewrites)
+    stream.write(f"{len(rewrites)} changes, {totalBytes} bytes, {totalCycles} cycles and {totalSteps} steps saved\n")
@@ -0,0 +1,316 @@
+import os
+import sys
+from typing import NamedTuple
+
+# Add the emulator to path for its instruction costs and the microcode step counts
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Emulator'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Emulator', 'utils'))
+from helpers import instructionCycles
+from core.microcode_cycles import loadMicrocodeCycles, microcodeBankPaths
+
+JUMP_INSTRUCTIONS        = ('JMP', 'JMZ', 'JNZ', 'JMC', 'JME', 'JMG', 'JML')
+ROM_ADDRESS_INSTRUCTIONS = JUMP_INSTRUCTIONS + ('CALL',)
+NO_FALLTHROUGH           = ('JMP', 'RTN')
+JUMP_IF_EQUAL            = ('JMZ', 'JME')
+JUMP_IF_NOT_EQUAL        = ('JNZ',)
+COMPARE_IMMEDIATE        = ('CMI', 'CMIS')
+
+# Statement kinds
+BLANK       = 0
+TAG         = 1
+DIRECTIVE   = 2     # No code, e.g. .EXPORT
+INSTRUCTION = 3
+UNKNOWN     = 4     # Left for the encoder to report
+
+MAX_PASSES = 32
+
+
+class Rewrite(NamedTuple):
+    location: str
+    line: int
+    text: str           # The source line as written
+    rule: str
+    bytesSaved: int
+    cyclesSaved: int    # Each time the code runs; for jumps, each time taken
+    stepsSaved: int     # The same in clock steps of the microcode sequences
+    stepSource: str     # 'microcode', or 'instruction' when the banks were not built
+
+
+def tokenize(line):
+    return line.replace(",", " ").split()
+
+
+def byteValue(text):
+    # Operand as the 8-bit pattern the encoder stores, None if not a number
+    try:
+        if text.startswith(("0X", "0B")):
+            value = int(text, 16 if text[1] == "X" else 2)
+        else:
+            value = int(text)
+    except ValueError:
+        return None
+    return value & 0xFF
+
+
+class PeepholeOptimizer:
+    # Rewrites the preprocessed program before it is encoded. Takes and
+    # returns (source index, line) pairs like the Preprocessor. Tags are
+    # never removed and no rewrite reaches across one, except jumps, which
+    # look through tags to where they land. Programs that jump to absolute
+    # ROM addresses are left as they are, since any size change moves code.
+    # Savings are counted twice: in the emulator's instruction costs and in
+    # the clock steps of each opcode's sequence in the built microcode
+    # (Microcode/out/uCode*.bin), which fall back to the instruction costs
+    # when the banks have not been generated. A rewrite that would cost
+    # more by either count is not made.
+    def __init__(self, encodingTable, directives = (), microcodeDir = None):
+        self.encodingTable = encodingTable
+        self.directives    = set(directives)
+        self.rewrites      = []     # (source index, rule, bytes saved, cycles saved, steps saved)
+        self.threaded      = dict() # id() of a threaded statement -> its entry in rewrites
+        self.skipped       = False
+
+        self.microcodeCycles = loadMicrocodeCycles(microcodeDir)
+        self.stepSource      = 'instruction' if self.microcodeCycles is None else 'microcode'
+
+
+    def run(self, statements):
+        self.statements = [[index, line] for index, line in statements]
+        if self.hasAbsoluteAddresses():
+            self.skipped = True
+            return [tuple(statement) for statement in self.statements]
+
+        for _ in range(MAX_PASSES):
+            changed = False
+            for rule in (self.removeSelfMoves, self.collapsePushPop, self.foldConstantCompares,
+                         self.threadJumps, self.removeUnreachable, self.removeJumpsToNext):
+                if rule():
+                    changed = True
+                    self.statements = [statement for statement in self.statements if statement[1] is not None]
+            if not changed:
+                break
+        return [tuple(statement) for statement in self.statements]
+
+
+    def kind(self, line):
+        if not line:
+            return BLANK
+        if line[-1] == ":" and len(tokenize(line)) == 1:
+            return TAG
+        tokens = tokenize(line)
+        if tokens[0] in self.directives:
+            return DIRECTIVE
+        encoding = self.encodingTable.get(tokens[0])
+        if encoding is None or len(tokens) - 1 != len(encoding.registerShifts) + (encoding.valueKind is not None):
+            return UNKNOWN
+        return INSTRUCTION
+
+
+    def hasAbsoluteAddresses(self):
+        for _, line in self.statements:
+            if self.kind(line) == INSTRUCTION:
+                tokens = tokenize(line)
+                if tokens[0] in ROM_ADDRESS_INSTRUCTIONS and byteValue(tokens[1]) is not None:
+                    return True
+        return False
+
+
+    def code(self):
+        # Positions of the statements that produce code, each with whether a
+        # tag lies between it and the code before it
+        positions = []
+        tagged = False
+        for position, (_, line) in enumerate(self.statements):
+            kind = self.kind(line)
+            if kind == TAG:
+                tagged = True
+            elif kind in (INSTRUCTION, UNKNOWN):
+                positions.append((position, tagged))
+                tagged = False
+        return positions
+
+
+    def landings(self):
+        # Tag -> position of the code it labels, len(statements) at the end
+        landings = dict()
+        pending = []
+        for position, (_, line) in enumerate(self.statements):
+            kind = self.kind(line)
+            if kind == TAG:
+                pending.append(line[:-1])
+            elif kind in (INSTRUCTION, UNKNOWN):
+                landings.update((tag, position) for tag in pending)
+                pending = []
+        landings.update((tag, len(self.statements)) for tag in pending)
+        return landings
+
+
+    def steps(self, mnemonic):
+        # Clock steps of the mnemonic's microcode sequence. Both flag paths
+        # of a branch are as long (stepping past the address takes as many
+        # steps as loading it), so the flag-low count serves taken or not.
+        if self.microcodeCycles is None:
+            return instructionCycles(mnemonic)
+        return self.microcodeCycles[self.encodingTable[mnemonic].opcode][0]
+
+
+    def justified(self, bytesSaved, cyclesSaved, stepsSaved):
+        return bytesSaved >= 0 and cyclesSaved >= 0 and stepsSaved >= 0
+
+
+    def record(self, position, rule, bytesSaved, cyclesSaved, stepsSaved):
+        self.rewrites.append((self.statements[position][0], rule, bytesSaved, cyclesSaved, stepsSaved))
+
+
+    def tokensAt(self, position):
+        if position >= len(self.statements) or self.kind(self.statements[position][1]) != INSTRUCTION:
+            return None
+        return tokenize(self.statements[position][1])
+
+
+    def removeSelfMoves(self):
+        # MOV X, X only costs time; the microcode treats it as a NOP
+        changed = False
+        for position, _ in self.code():
+            tokens = self.tokensAt(position)
+            if tokens and tokens[0] == 'MOV' and tokens[1] == tokens[2]:
+                self.record(position, "MOV to itself removed", 1, instructionCycles('MOV'), self.steps('MOV'))
+                self.statements[position][1] = None
+                changed = True
+        return changed
+
+
+    def collapsePushPop(self):
+        # PUSH X, POP X leaves everything but the free stack slot as it was;
+        # PUSH X, POP Y is MOV Y, X
+        changed = False
+        code = self.code()
+        pairCycles = instructionCycles('PUSH') + instructionCycles('POP')
+        pairSteps  = self.steps('PUSH') + self.steps('POP')
+        for (first, _), (second, tagged) in zip(code, code[1:]):
+            push, pop = self.tokensAt(first), self.tokensAt(second)
+            if tagged or not push or not pop or push[0] != 'PUSH' or pop[0] != 'POP':
+                continue
+            if push[1] == pop[1]:
+                self.record(first, "PUSH/POP pair removed", 2, pairCycles, pairSteps)
+                self.statements[first][1] = None
+            else:
+                savings = (1, pairCycles - instructionCycles('MOV'), pairSteps - self.steps('MOV'))
+                if not self.justified(*savings):
+                    continue
+                self.record(first, "PUSH/POP pair turned into MOV", *savings)
+                self.statements[first][1] = f"MOV {pop[1]}, {push[1]}"
+            self.statements[second][1] = None
+            changed = True
+        return changed
+
+
+    def foldConstantCompares(self):
+        # LDI X, a then CMI X, b decides JMZ/JME/JNZ right after: a branch
+        # never taken goes, one always taken becomes JMP. The compare stays
+        # for the flags.
+        changed = False
+        code = self.code()
+        for (load, _), (compare, taggedCompare), (jump, taggedJump) in zip(code, code[1:], code[2:]):
+            loadTokens, compareTokens, jumpTokens = self.tokensAt(load), self.tokensAt(compare), self.tokensAt(jump)
+            if taggedCompare or taggedJump or not loadTokens or not compareTokens or not jumpTokens:
+                continue
+            if loadTokens[0] != 'LDI' or compareTokens[0] not in COMPARE_IMMEDIATE or loadTokens[1] != compareTokens[1]:
+                continue
+            if jumpTokens[0] not in JUMP_IF_EQUAL + JUMP_IF_NOT_EQUAL:
+                continue
+            loaded, compared = byteValue(loadTokens[2]), byteValue(compareTokens[2])
+            if loaded is None or compared is None:
+                continue
+
+            taken = (loaded == compared) == (jumpTokens[0] in JUMP_IF_EQUAL)
+            if taken:
+                savings = (0, instructionCycles(jumpTokens[0]) - instructionCycles('JMP'),
+                           self.steps(jumpTokens[0]) - self.steps('JMP'))
+                if not self.justified(*savings):
+                    continue
+                self.record(jump, "Constant compare, branch always taken", *savings)
+                self.statements[jump][1] = f"JMP {jumpTokens[1]}"
+            else:
+                self.record(jump, "Constant compare, branch never taken", 3, instructionCycles(jumpTokens[0]),
+                            self.steps(jumpTokens[0]))
+                self.statements[jump][1] = None
+            changed = True
+        return changed
+
+
+    def threadJumps(self):
+        # A jump or call to a JMP goes straight to where that JMP leads. A
+        # chain that comes back to a target it passed is an endless loop and
+        # is left as written. A jump threaded again in a later pass keeps
+        # one report entry, with the hops of all passes.
+        changed = False
+        landings = self.landings()
+        for position, _ in self.code():
+            tokens = self.tokensAt(position)
+            if not tokens or tokens[0] not in ROM_ADDRESS_INSTRUCTIONS:
+                continue
+            target, hops, visited = tokens[1], 0, {position}
+            while target in landings:
+                landing = landings[target]
+                landed = self.tokensAt(landing)
+                if not landed or landed[0] != 'JMP':
+                    break
+                if landing in visited:
+                    hops = 0
+                    break
+                visited.add(landing)
+                target = landed[1]
+                hops += 1
+            if hops:
+                self.recordThread(position, target, hops)
+                self.statements[position][1] = f"{tokens[0]} {target}"
+                changed = True
+        return changed
+
+
+    def recordThread(self, position, target, hops):
+        # Statements keep their list object for the whole run; a macro line
+        # can expand to several jumps, so its source index would not do
+        key = id(self.statements[position])
+        rule = f"Jump chain threaded to {target}"
+        cyclesSaved, stepsSaved = hops * instructionCycles('JMP'), hops * self.steps('JMP')
+        if key in self.threaded:
+            entry = self.threaded[key]
+            index, _, _, previousCycles, previousSteps = self.rewrites[entry]
+            self.rewrites[entry] = (index, rule, 0, previousCycles + cyclesSaved, previousSteps + stepsSaved)
+            return
+        self.threaded[key] = len(self.rewrites)
+        self.record(position, rule, 0, cyclesSaved, stepsSaved)
+
+
+    def removeUnreachable(self):
+        # Code after JMP or RTN up to the next tag can not run
+        changed = False
+        reachable = True
+        for position, tagged in self.code():
+            if tagged:
+                reachable = True
+            tokens = self.tokensAt(position)
+            if not reachable and tokens:
+                self.record(position, "Unreachable code removed", self.encodingTable[tokens[0]].size, 0, 0)
+                self.statements[position][1] = None
+                changed = True
+            elif tokens and tokens[0] in NO_FALLTHROUGH:
+                reachable = False
+        return changed
+
+
+    def removeJumpsToNext(self):
+        # A jump to the code right after it ends up there either way
+        changed = False
+        landings = self.landings()
+        code = self.code()
+        for (position, _), following in zip(code, code[1:] + [(len(self.statements), False)]):
+            tokens = self.tokensAt(position)
+            if tokens and tokens[0] in JUMP_INSTRUCTIONS and landings.get(tokens[1]) == following[0]:
+                self.record(position, "Jump to the next instruction removed", 3, instructionCycles(tokens[0]),
+                            self.steps(tokens[0]))
+                self.statements[position][1] = None
+                changed = True
+        return changed
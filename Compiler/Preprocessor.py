@@ -0,0 +1,337 @@
+import ast
+import operator
+import re
+from typing import List, NamedTuple, Tuple
+
+
+EQU_DIRECTIVE    = ".EQU"
+DEFINE_DIRECTIVE = ".DEFINE"
+MACRO_DIRECTIVE  = ".MACRO"
+ENDM_DIRECTIVE   = ".ENDM"
+REPT_DIRECTIVE   = ".REPT"
+ENDR_DIRECTIVE   = ".ENDR"
+IF_DIRECTIVE     = ".IF"
+IFDEF_DIRECTIVE  = ".IFDEF"
+IFNDEF_DIRECTIVE = ".IFNDEF"
+ELIF_DIRECTIVE   = ".ELIF"
+ELSE_DIRECTIVE   = ".ELSE"
+ENDIF_DIRECTIVE  = ".ENDIF"
+INCLUDE_DIRECTIVE = ".INCLUDE"
+
+DIRECTIVES = (EQU_DIRECTIVE, DEFINE_DIRECTIVE, MACRO_DIRECTIVE, ENDM_DIRECTIVE, REPT_DIRECTIVE, ENDR_DIRECTIVE,
+              IF_DIRECTIVE, IFDEF_DIRECTIVE, IFNDEF_DIRECTIVE, ELIF_DIRECTIVE, ELSE_DIRECTIVE, ENDIF_DIRECTIVE,
+              INCLUDE_DIRECTIVE)
+
+MAX_EXPANSION_DEPTH = 64
+UNIQUE_PARAMETER    = "#"       # \# in a macro body: number of the expansion, for local tags
+
+DIRECTIVE_LINE    = re.compile(r"(\S+)[\s,]*([^\s,]*)[\s,]*(.*)$")
+EXPRESSION_TOKEN  = re.compile(r"\s*(0[XB][0-9A-F_]+|\d[0-9_]*|[A-Z_][A-Z0-9_.]*|&&|\|\||<<|>>|[<>=!]=|\S)")
+MACRO_PARAMETER   = re.compile(r"\\([A-Z_][A-Z0-9_]*|#)")
+NAME              = re.compile(r"[A-Z_][A-Z0-9_.]*$")
+NAME_TOKEN        = re.compile(r"(?<![A-Z0-9_.\\])[A-Z_][A-Z0-9_.]*")
+OPERAND_LITERAL   = re.compile(r"[-+]?(0X[0-9A-F_]+|0B[01_]+|\d+)$")
+OPERATOR          = re.compile(r"[-+*/%&|^~<>()!=]")
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod, ast.LShift: operator.lshift, ast.RShift: operator.rshift,
+    ast.BitAnd: operator.and_, ast.BitOr: operator.or_, ast.BitXor: operator.xor,
+}
+UNARY_OPERATORS = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Invert: operator.invert,
+                   ast.Not: lambda value: int(not value)}
+COMPARE_OPERATORS = {ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+                     ast.Gt: operator.gt, ast.GtE: operator.ge}
+
+
+class PreprocessError(Exception):
+    pass
+
+
+class Macro(NamedTuple):
+    parameters: Tuple[str, ...]
+    body: List[Tuple[int, str]]
+
+
+def parseLiteral(token):
+    try:
+        if token.startswith(("0X", "0B")):
+            return int(token, 16 if token[1] == "X" else 2)
+        return int(token)
+    except ValueError:
+        raise PreprocessError(f"'{token}' is not a number!!")
+
+
+def evaluate(expression, constants):
+    # Integer expression over numbers (decimal, 0x, 0b) and .equ constants
+    # with C style operators; comparisons and logic give 1 or 0
+    pythonTokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = EXPRESSION_TOKEN.match(expression, position)
+        if match is None:
+            break
+        token = match.group(1)
+        position = match.end()
+        if token[0].isdigit():
+            pythonTokens.append(str(parseLiteral(token)))
+        elif NAME.match(token):
+            if token not in constants:
+                raise PreprocessError(f"'{token}' is not a defined constant!!")
+            pythonTokens.append(f"({constants[token]})")
+        else:
+            pythonTokens.append({"&&": " and ", "||": " or ", "!": " not ", "/": "//"}.get(token, token))
+
+    try:
+        tree = ast.parse("".join(pythonTokens), mode='eval')
+    except SyntaxError:
+        raise PreprocessError(f"'{expression}' is not a valid expression!!")
+    return _evaluateNode(tree.body, expression)
+
+
+def _evaluateNode(node, expression):
+    if isinstance(node, ast.Constant) and isinstance(node.value, int):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        left, right = _evaluateNode(node.left, expression), _evaluateNode(node.right, expression)
+        if isinstance(node.op, (ast.FloorDiv, ast.Mod)) and right == 0:
+            raise PreprocessError(f"Division by zero in '{expression}'!!")
+        return BINARY_OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        return UNARY_OPERATORS[type(node.op)](_evaluateNode(node.operand, expression))
+    if isinstance(node, ast.BoolOp):
+        values = [_evaluateNode(value, expression) for value in node.values]
+        return int(all(values) if isinstance(node.op, ast.And) else any(values))
+    if isinstance(node, ast.Compare) and all(type(op) in COMPARE_OPERATORS for op in node.ops):
+        left = _evaluateNode(node.left, expression)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluateNode(comparator, expression)
+            if not COMPARE_OPERATORS[type(op)](left, right):
+                return 0
+            left = right
+        return 1
+    raise PreprocessError(f"'{expression}' is not a valid expression!!")
+
+
+def firstToken(line):
+    return line.split(None, 1)[0].rstrip(",") if line else ""
+
+
+def splitOperands(text):
+    # Comma separated when there is a comma, so expressions may hold spaces
+    if "," in text:
+        return [operand.strip() for operand in text.split(",")]
+    return text.split()
+
+
+class Preprocessor:
+    # Streaming stage between comment stripping and the encoder: process()
+    # takes (source index, line) pairs and yields them with .equ/.define
+    # names replaced, macros and .rept blocks expanded and the branches of
+    # conditionals that are off dropped. Lines without a directive pass
+    # through as they are. Problems are collected as (source index, message).
+    # .include lines are expanded before this stage; the indexes of those
+    # outside a dropped branch are collected in includes.
+    def __init__(self, reservedNames = ()):
+        self.reservedNames = set(reservedNames)
+        self.constants     = dict()     # .equ name -> value
+        self.defines       = dict()     # .define name -> replacement text
+        self.macros        = dict()
+        self.problems      = []
+        self.includes      = set()
+        self.expansions    = 0
+        self.depth         = 0
+
+
+    def process(self, lines):
+        lines = iter(lines)
+        conditions = []     # [active, branch taken, opening index] per open .IF
+
+        for index, line in lines:
+            directive = firstToken(line)
+
+            if directive in (IF_DIRECTIVE, IFDEF_DIRECTIVE, IFNDEF_DIRECTIVE):
+                enclosingActive = all(condition[0] for condition in conditions)
+                active = enclosingActive and self.condition(index, directive, line)
+                conditions.append([active, active or not enclosingActive, index])
+                continue
+            if directive in (ELIF_DIRECTIVE, ELSE_DIRECTIVE, ENDIF_DIRECTIVE):
+                if not conditions:
+                    self.problems.append((index, f"'{directive}' without '{IF_DIRECTIVE}'!!"))
+                elif directive == ENDIF_DIRECTIVE:
+                    conditions.pop()
+                else:
+                    condition = conditions[-1]
+                    active = not condition[1] and (directive == ELSE_DIRECTIVE or self.condition(index, IF_DIRECTIVE, line))
+                    condition[0] = active
+                    condition[1] = condition[1] or active
+                continue
+            if conditions and not all(condition[0] for condition in conditions):
+                if directive in (MACRO_DIRECTIVE, REPT_DIRECTIVE):
+                    self.collect(lines, index, directive)
+                continue
+
+            if directive == INCLUDE_DIRECTIVE:
+                self.includes.add(index)
+                yield index, ""
+            elif directive == EQU_DIRECTIVE or directive == DEFINE_DIRECTIVE:
+                self.define(index, directive, line)
+            elif directive == MACRO_DIRECTIVE:
+                self.defineMacro(index, line, self.collect(lines, index, directive))
+            elif directive == REPT_DIRECTIVE:
+                yield from self.repeat(index, line, self.collect(lines, index, directive))
+            elif directive in (ENDM_DIRECTIVE, ENDR_DIRECTIVE):
+                self.problems.append((index, f"'{directive}' without its opening directive!!"))
+            elif directive in self.macros:
+                yield from self.expandMacro(index, directive, line)
+            elif self.constants or self.defines or OPERATOR.search(line):
+                yield index, self.substitute(index, line)
+            else:
+                yield index, line
+
+        for condition in conditions:
+            self.problems.append((condition[2], f"'{ENDIF_DIRECTIVE}' missing!!"))
+
+
+    def collect(self, lines, index, opening):
+        # Body of a .MACRO or .REPT block, nested blocks included
+        closing = ENDM_DIRECTIVE if opening == MACRO_DIRECTIVE else ENDR_DIRECTIVE
+        body = []
+        depth = 1
+        for item in lines:
+            directive = firstToken(item[1])
+            if directive == opening:
+                depth += 1
+            elif directive == closing:
+                depth -= 1
+                if depth == 0:
+                    return body
+            body.append(item)
+        self.problems.append((index, f"'{closing}' missing!!"))
+        return body
+
+
+    def checkName(self, index, name):
+        if not NAME.match(name):
+            self.problems.append((index, f"'{name}' is not a valid name!!"))
+            return False
+        if name in self.reservedNames or name in DIRECTIVES:
+            self.problems.append((index, f"'{name}' is a reserved name!!"))
+            return False
+        if name in self.constants or name in self.defines or name in self.macros:
+            self.problems.append((index, f"'{name}' is already defined!!"))
+            return False
+        return True
+
+
+    def define(self, index, directive, line):
+        _, name, value = DIRECTIVE_LINE.match(line).groups()
+        if not self.checkName(index, name):
+            return
+        if directive == DEFINE_DIRECTIVE:
+            self.defines[name] = value.strip()
+            return
+        try:
+            self.constants[name] = evaluate(self.replaceDefines(value), self.constants)
+        except PreprocessError as e:
+            self.problems.append((index, str(e)))
+
+
+    def condition(self, index, directive, line):
+        _, name, rest = DIRECTIVE_LINE.match(line).groups()
+        if directive != IF_DIRECTIVE:
+            defined = name in self.constants or name in self.defines
+            return defined if directive == IFDEF_DIRECTIVE else not defined
+        try:
+            expression = line.split(None, 1)[1] if len(line.split(None, 1)) > 1 else ""
+            return bool(evaluate(self.replaceDefines(expression), self.constants))
+        except PreprocessError as e:
+            self.problems.append((index, str(e)))
+            return False
+
+
+    def defineMacro(self, index, line, body):
+        _, name, parameters = DIRECTIVE_LINE.match(line).groups()
+        if not self.checkName(index, name):
+            return
+        self.macros[name] = Macro(tuple(parameter.lstrip("\\") for parameter in splitOperands(parameters)), body)
+
+
+    def expandMacro(self, index, name, line):
+        macro = self.macros[name]
+        arguments = splitOperands(line.split(None, 1)[1]) if len(line.split(None, 1)) > 1 else []
+        if len(arguments) != len(macro.parameters):
+            self.problems.append((index, f"Macro '{name}' expects {len(macro.parameters)} arguments, "
+                                         f"but found {len(arguments)}"))
+            return
+        if self.depth >= MAX_EXPANSION_DEPTH:
+            self.problems.append((index, f"Macro '{name}' nested deeper than {MAX_EXPANSION_DEPTH}!!"))
+            return
+
+        self.expansions += 1
+        values = dict(zip(macro.parameters, arguments))
+        values[UNIQUE_PARAMETER] = str(self.expansions)
+
+        def replace(match):
+            return values.get(match.group(1), match.group(0))
+
+        # Expanded lines are reported against the invocation
+        body = [(index, MACRO_PARAMETER.sub(replace, text)) for _, text in macro.body]
+        self.depth += 1
+        yield from self.process(body)
+        self.depth -= 1
+
+
+    def repeat(self, index, line, body):
+        # .REPT count[, name]: body count times, name set to 0, 1, ... if given
+        _, count, name = DIRECTIVE_LINE.match(line).groups()
+        name = name.strip()
+        try:
+            count = evaluate(self.replaceDefines(count), self.constants)
+        except PreprocessError as e:
+            self.problems.append((index, str(e)))
+            return
+        if name and not self.checkName(index, name):
+            return
+
+        for iteration in range(count):
+            if name:
+                self.constants[name] = iteration
+            yield from self.process(body)
+        self.constants.pop(name, None)
+
+
+    def replaceDefines(self, text):
+        if not self.defines:
+            return text
+        return NAME_TOKEN.sub(lambda match: self.defines.get(match.group(0), match.group(0)), text)
+
+
+    def substitute(self, index, line):
+        # Operands naming a constant are replaced by their value, operands
+        # that are expressions (SIZE - 1, 0x10 | 1) by the result. A line
+        # with an operand that does not evaluate is reported here and
+        # dropped, so the encoder does not report it again.
+        line = self.replaceDefines(line)
+        parts = line.split(None, 1)
+        if len(parts) < 2:
+            return line
+        operands = splitOperands(parts[1])
+        changed = False
+        failed = False
+        for position, operand in enumerate(operands):
+            if operand in self.constants:
+                operands[position] = str(self.constants[operand])
+                changed = True
+            elif (OPERATOR.search(operand) and not OPERAND_LITERAL.match(operand)) or \
+                    any(name in self.constants for name in NAME_TOKEN.findall(operand)):
+                try:
+                    operands[position] = str(evaluate(operand, self.constants))
+                    changed = True
+                except PreprocessError as e:
+                    self.problems.append((index, str(e)))
+                    failed = True
+        if failed:
+            return ""
+        return f"{parts[0]} {', '.join(operands)}" if changed else line
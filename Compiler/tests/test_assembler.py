@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Assembler import assemble
+
+
+def test_diagnostics_are_in_source_order():
+    source = "START:\n    JMP nowhere\n    NOP\n    FOO B\n"
+    result = assemble(source, name="order.S")
+    assert [diagnostic.line for diagnostic in result.diagnostics] == [2, 4]
+    assert "'NOWHERE' is not a proper address" in result.diagnostics[0].message
+
+
+def test_include_in_dropped_branch_is_not_reported():
+    source = ".if 0\n.include \"missing.inc\"\n.endif\n.include \"missing.inc\"\n    HLT\n"
+    result = assemble(source, name="include.S")
+    assert [(diagnostic.line, diagnostic.message) for diagnostic in result.diagnostics] == \
+        [(4, "Included file 'missing.inc' not found!!")]
+
+
+def test_bad_operand_expression_is_reported_once():
+    result = assemble("    LDI A, 1+\n    HLT\n", name="expression.S")
+    assert [(diagnostic.line, diagnostic.message) for diagnostic in result.diagnostics] == \
+        [(1, "'1+' is not a valid expression!!")]
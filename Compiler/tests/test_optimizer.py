@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Assembler import LINK_DIRECTIVES, getEncodingTable
+from Optimizer import PeepholeOptimizer
+
+
+def optimize(lines, microcodeDir = None):
+    optimizer = PeepholeOptimizer(getEncodingTable(), LINK_DIRECTIVES, microcodeDir)
+    statements = optimizer.run(list(enumerate(lines)))
+    return optimizer, [line for _, line in statements]
+
+
+def test_jump_cycle_is_not_threaded():
+    # Threading used to send the CALL around the loop once per pass
+    lines = ["START:", "CALL L1", "L1:", "JMP L2", "HLT", "L2:", "JMP L1"]
+    optimizer, result = optimize(lines)
+    assert "CALL L1" in result
+    assert not [rewrite for rewrite in optimizer.rewrites if rewrite[1].startswith("Jump chain")]
+
+
+def test_savings_count_microcode_steps():
+    optimizer, _ = optimize(["START:", "PUSH A", "POP B", "HLT"])
+    if optimizer.stepSource != 'microcode':
+        pytest.skip("microcode banks not generated")
+    (index, rule, bytesSaved, cyclesSaved, stepsSaved), = optimizer.rewrites
+    assert rule == "PUSH/POP pair turned into MOV"
+    assert stepsSaved == optimizer.steps('PUSH') + optimizer.steps('POP') - optimizer.steps('MOV')
+
+
+def test_steps_fall_back_to_instruction_costs(tmp_path):
+    optimizer, result = optimize(["START:", "MOV A, A", "HLT"], microcodeDir=str(tmp_path))
+    assert optimizer.stepSource == 'instruction'
+    assert optimizer.rewrites == [(1, "MOV to itself removed", 1, 2, 2)]
+    assert result == ["START:", "HLT"]
@@ -1,18 +1,34 @@
+# Flags are bit fields of ALU.flagBits
+FLAG_ZERO     = 0x01  # Z flag - result is zero
+FLAG_CARRY    = 0x02  # C flag - carry out from MSB
+FLAG_NEGATIVE = 0x04  # N flag - result is negative (bit 7 set)
+
+FLAG_BITS = {
+    'zero'    : FLAG_ZERO,
+    'carry'   : FLAG_CARRY,
+    'negative': FLAG_NEGATIVE
+}
+
+
 class ALU:
+    __slots__ = ('flagBits', 'temp1', 'temp2')
+
     def __init__(self):
         self.reset()
 
 
     def reset(self):
-        self.flags = {
-            'zero'    : False,   # Z flag - result is zero
-            'carry'   : False,   # C flag - carry out from MSB
-            'negative': False    # N flag - result is negative (bit 7 set)
-        }
+        self.flagBits = 0
         self.temp1 = 0  # Temporary register 1
         self.temp2 = 0  # Temporary register 2
 
 
+    @property
+    def flags(self):
+        # Read-only dict view kept for callers that index flags by name
+        return self.getFlags()
+
+
     def setTemps(self, val1, val2):
         self.temp1 = val1 & 0xFF
         self.temp2 = val2 & 0xFF
@@ -94,23 +110,25 @@ class ALU:
 
 
     def _updateFlags(self, result, carry):
-        self.flags['zero']     = (result == 0)
-        self.flags['carry']    = carry
-        self.flags['negative'] = (result & 0x80) != 0  # Bit 7 set
+        self.flagBits = (result == 0) | (bool(carry) << 1) | ((result & 0x80) >> 5)
 
 
     def getFlags(self):
-        return self.flags.copy()
+        flagBits = self.flagBits
+        return {name: (flagBits & bit) != 0 for name, bit in FLAG_BITS.items()}
 
 
     def setFlag(self, flagName, value):
-        if flagName in self.flags:
-            self.flags[flagName] = bool(value)
+        if flagName in FLAG_BITS:
+            if value:
+                self.flagBits |= FLAG_BITS[flagName]
+            else:
+                self.flagBits &= ~FLAG_BITS[flagName]
 
 
     def __str__(self):
         flagsStr = ""
-        flagsStr += "Z" if self.flags['zero'] else "-"
-        flagsStr += "C" if self.flags['carry'] else "-"
-        flagsStr += "N" if self.flags['negative'] else "-"
+        flagsStr += "Z" if self.flagBits & FLAG_ZERO else "-"
+        flagsStr += "C" if self.flagBits & FLAG_CARRY else "-"
+        flagsStr += "N" if self.flagBits & FLAG_NEGATIVE else "-"
         return f"ALU Flags: {flagsStr}"
@@ -0,0 +1,189 @@
+import os
+import sys
+from array import array
+from hashlib import md5
+from typing import NamedTuple
+
+from .alu import ALU
+
+
+# Each entry packs the 8-bit result in bits [7:0] and ALU.flagBits in [10:8].
+# Binary tables are indexed by (a << 8) | b; add/sub prepend carry/borrow-in
+# as bit 16. Unary tables are indexed by the operand alone.
+TABLE_CACHE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Microcode', 'out', 'aluTables.bin'))
+
+# The cache header carries a hash of the sources that define the packing and
+# the flag bits, so a change to either rebuilds the tables instead of
+# silently reusing stale ones
+TABLE_FORMAT_SOURCES = ('alu.py', 'alu_tables.py')
+
+
+def _tableFormatHash():
+    formatHash = md5()
+    for name in TABLE_FORMAT_SOURCES:
+        with open(os.path.join(os.path.dirname(__file__), name), 'rb') as f:
+            formatHash.update(f.read())
+    return formatHash.digest()[:8]
+
+
+TABLE_CACHE_MAGIC = b'C8ALU\x02' + _tableFormatHash()
+
+
+class AluTables(NamedTuple):
+    add: array
+    sub: array
+    logicAnd: array
+    logicOr: array
+    logicXor: array
+    shl: array
+    shr: array
+    logicNot: array
+
+
+TABLE_SIZES = {
+    'add'     : 2 * 65536,
+    'sub'     : 2 * 65536,
+    'logicAnd': 65536,
+    'logicOr' : 65536,
+    'logicXor': 65536,
+    'shl'     : 256,
+    'shr'     : 256,
+    'logicNot': 256,
+}
+
+_tables = None
+
+
+def _zeroNegative():
+    return [(result == 0) | ((result & 0x80) >> 5) for result in range(256)]
+
+
+def buildAluTables():
+    zeroNegative = _zeroNegative()
+
+    def entry(result, carry):
+        return result | ((zeroNegative[result] | (carry << 1)) << 8)
+
+    add = array('H', (entry((a + b + carryIn) & 0xFF, a + b + carryIn > 0xFF)
+                      for carryIn in (0, 1) for a in range(256) for b in range(256)))
+    sub = array('H', (entry((a - b - borrowIn) & 0xFF, a - b - borrowIn < 0)
+                      for borrowIn in (0, 1) for a in range(256) for b in range(256)))
+    logicAnd = array('H', (entry(a & b, 0) for a in range(256) for b in range(256)))
+    logicOr  = array('H', (entry(a | b, 0) for a in range(256) for b in range(256)))
+    logicXor = array('H', (entry(a ^ b, 0) for a in range(256) for b in range(256)))
+    shl      = array('H', (entry((value << 1) & 0xFF, value >> 7) for value in range(256)))
+    shr      = array('H', (entry(value >> 1, value & 0x01) for value in range(256)))
+    logicNot = array('H', (entry(value ^ 0xFF, 0) for value in range(256)))
+
+    return AluTables(add, sub, logicAnd, logicOr, logicXor, shl, shr, logicNot)
+
+
+def saveAluTables(tables, path = TABLE_CACHE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tempPath = f"{path}.tmp"
+    with open(tempPath, 'wb') as f:
+        f.write(TABLE_CACHE_MAGIC)
+        for table in tables:
+            if sys.byteorder == 'big':
+                table = array('H', table)
+                table.byteswap()
+            f.write(table.tobytes())  # Stored little-endian
+    os.replace(tempPath, path)
+
+
+def loadAluTables(path = TABLE_CACHE_PATH):
+    expectedSize = len(TABLE_CACHE_MAGIC) + 2 * sum(TABLE_SIZES.values())
+    if not os.path.exists(path) or os.path.getsize(path) != expectedSize:
+        return None
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(TABLE_CACHE_MAGIC):
+        return None
+
+    tables = []
+    offset = len(TABLE_CACHE_MAGIC)
+    for name in AluTables._fields:
+        table = array('H')
+        table.frombytes(data[offset:offset + 2 * TABLE_SIZES[name]])
+        if sys.byteorder == 'big':
+            table.byteswap()
+        tables.append(table)
+        offset += 2 * TABLE_SIZES[name]
+    return AluTables(*tables)
+
+
+def getAluTables(path = TABLE_CACHE_PATH):
+    # Built once per process, and once per checkout thanks to the disk cache
+    global _tables
+    if _tables is None:
+        tables = loadAluTables(path)
+        if tables is None:
+            tables = buildAluTables()
+            try:
+                saveAluTables(tables, path)
+            except OSError:
+                pass  # Read-only checkout; keep the in-memory copy
+        _tables = tables
+    return _tables
+
+
+class TableALU(ALU):
+    # The tables are resolved to one slot each up front, so every operation
+    # is a single array index plus the unpacking of the entry
+    __slots__ = ('tables', 'addTable', 'subTable', 'andTable', 'orTable', 'xorTable',
+                 'shlTable', 'shrTable', 'notTable')
+
+    def __init__(self, tables = None):
+        self.tables = tables if tables is not None else getAluTables()
+        (self.addTable, self.subTable, self.andTable, self.orTable, self.xorTable,
+         self.shlTable, self.shrTable, self.notTable) = self.tables
+        super().__init__()
+
+
+    def add(self, a, b, carryIn = 0):
+        entry = self.addTable[(carryIn << 16) | (a << 8) | b]
+        self.flagBits = entry >> 8
+        return entry & 0xFF, (entry & 0x200) != 0
+
+
+    def subtract(self, a, b, borrowIn = 0):
+        entry = self.subTable[(borrowIn << 16) | (a << 8) | b]
+        self.flagBits = entry >> 8
+        return entry & 0xFF, (entry & 0x200) != 0
+
+
+    def shiftLeft(self, value):
+        entry = self.shlTable[value]
+        self.flagBits = entry >> 8
+        return entry & 0xFF
+
+
+    def shiftRight(self, value):
+        entry = self.shrTable[value]
+        self.flagBits = entry >> 8
+        return entry & 0xFF
+
+
+    def logicalAnd(self, a, b):
+        entry = self.andTable[(a << 8) | b]
+        self.flagBits = entry >> 8
+        return entry & 0xFF
+
+
+    def logicalOr(self, a, b):
+        entry = self.orTable[(a << 8) | b]
+        self.flagBits = entry >> 8
+        return entry & 0xFF
+
+
+    def logicalXor(self, a, b):
+        entry = self.xorTable[(a << 8) | b]
+        self.flagBits = entry >> 8
+        return entry & 0xFF
+
+
+    def logicalNot(self, value):
+        entry = self.notTable[value]
+        self.flagBits = entry >> 8
+        return entry & 0xFF
@@ -0,0 +1,340 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .decoder   import InstructionDecoder
+from .memory    import Memory
+from .alu       import FLAG_ZERO, FLAG_CARRY, FLAG_NEGATIVE
+from .registers import REGISTER_NAMES
+
+
+JUMP_OPCODES = ('JMP', 'JMZ', 'JNZ', 'JMC', 'JME', 'JMG', 'JML')
+
+
+class BatchSoftwareCPU:
+    # N copies of SoftwareCPU sharing one ROM, stored as structure-of-arrays
+    # and stepped in lock-step. Each step groups the running lanes by opcode
+    # and applies one vectorized update per group, following the execute()
+    # semantics of SoftwareCPU (including CALL pushing PC + 2 and RST
+    # leaving PC at 1). Lanes that execute RST, or hit an instruction
+    # SoftwareCPU rejects (LDR, STR, unknown), stop for the rest of the run()
+    # call, as SoftwareCPU.run() does.
+
+    def __init__(self, laneCount):
+        if np is None:
+            raise ImportError("BatchSoftwareCPU requires numpy")
+
+        self.laneCount = laneCount
+        self.decoder = InstructionDecoder()
+        self.memory = Memory()  # ROM only; RAM lives per lane below
+
+        # One mnemonic kind, operand set and size per opcode byte
+        self.kinds = sorted({entry.mnemonic for entry in self.decoder.decodeTable})
+        self.kindTable = np.array([self.kinds.index(entry.mnemonic) for entry in self.decoder.decodeTable], dtype=np.intp)
+        self.sizeTable = np.array([entry.size for entry in self.decoder.decodeTable], dtype=np.int64)
+        self.destinationTable = np.array([entry.operands.get('destinationRegister', entry.operands.get('register', 0))
+                                          for entry in self.decoder.decodeTable], dtype=np.intp)
+        self.sourceTable = np.array([entry.operands.get('sourceRegister', 0)
+                                     for entry in self.decoder.decodeTable], dtype=np.intp)
+
+        self.handlers = [getattr(self, f"_execute{kind.capitalize()}", self._executeUnknown) for kind in self.kinds]
+        for kind in JUMP_OPCODES:
+            self.handlers[self.kinds.index(kind)] = self._makeJump(kind)
+        self.unknownKinds = np.array([handler == self._executeUnknown for handler in self.handlers])
+
+        # Per-lane state
+        self.registers = np.zeros((laneCount, len(REGISTER_NAMES)), dtype=np.uint8)
+        self.ram = np.zeros((laneCount, self.memory.RAM_SIZE), dtype=np.uint8)
+        self.stackPointer = np.zeros(laneCount, dtype=np.int64)
+        self.programCounter = np.zeros(laneCount, dtype=np.int64)
+        self.instructionRegister = np.zeros(laneCount, dtype=np.uint8)
+        self.flagBits = np.zeros(laneCount, dtype=np.uint8)
+        self.halted = np.zeros(laneCount, dtype=bool)
+        self.sevenSegmentValue = np.zeros(laneCount, dtype=np.uint8)
+        self.outputEnabled = np.zeros(laneCount, dtype=bool)
+        self.instructionCount = np.zeros(laneCount, dtype=np.int64)
+        self.cycleCount = np.zeros(laneCount, dtype=np.int64)
+        self.running = np.zeros(laneCount, dtype=bool)
+        self.rom = np.zeros(self.memory.ROM_SIZE + 3, dtype=np.int64)
+        self.reset()
+
+
+    def reset(self, lanes = None):
+        lanes = slice(None) if lanes is None else lanes
+        self.registers[lanes] = 0
+        self.ram[lanes] = 0
+        self.stackPointer[lanes] = self.memory.RAM_SIZE - 1
+        self.programCounter[lanes] = 0
+        self.instructionRegister[lanes] = 0
+        self.flagBits[lanes] = 0
+        self.halted[lanes] = False
+        self.sevenSegmentValue[lanes] = 0
+        self.outputEnabled[lanes] = False
+        self.instructionCount[lanes] = 0
+        self.cycleCount[lanes] = 0
+
+
+    def loadProgram(self, binaryData, startAddress = 0):
+        self.memory.loadRom(binaryData, startAddress)
+        # Operand reads past the end of ROM see 0, as Memory.readRom does
+        self.rom[:self.memory.ROM_SIZE] = np.frombuffer(bytes(self.memory.rom), dtype=np.uint8)
+        self.reset()
+
+
+    def step(self):
+        # One instruction on every running, non-halted lane; returns how many ran
+        lanes = np.flatnonzero(self.running & ~self.halted)
+        if lanes.size == 0:
+            return 0
+
+        romSize = self.memory.ROM_SIZE
+        pc = self.programCounter[lanes]
+        inRom = pc < romSize
+        address = np.minimum(pc, romSize)
+        # Fetching past the end of ROM halts the lane and executes a NOP
+        opcode = np.where(inRom, self.rom[address], 0)
+        self.halted[lanes[~inRom]] = True
+        self.instructionRegister[lanes[inRom]] = opcode[inRom]
+
+        immediate = np.where(address + 1 < romSize, self.rom[address + 1], 0)
+        target = (immediate << 8) | self.rom[address + 2]
+        self.programCounter[lanes] = pc + self.sizeTable[opcode]
+
+        kinds = self.kindTable[opcode]
+        order = np.argsort(kinds, kind='stable')
+        counts = np.bincount(kinds, minlength=len(self.kinds))
+        end = 0
+        for kind in np.flatnonzero(counts):
+            start, end = end, end + counts[kind]
+            group = order[start:end]
+            self.handlers[kind](lanes[group], opcode[group], pc[group], immediate[group], target[group])
+
+        executed = lanes[~self.unknownKinds[kinds]]
+        self.instructionCount[executed] += 1
+        self.cycleCount[executed] += 1  # Simplified - each instruction = 1 cycle
+        return executed.size
+
+
+    def run(self, maxInstructions = 10000):
+        # Returns the number of lock-steps taken
+        self.running[:] = True
+        steps = 0
+        while steps < maxInstructions and self.step():
+            steps += 1
+        self.running[:] = False
+        return steps
+
+
+    def getLaneState(self, lane):
+        return {
+            'registers'       : dict(zip(REGISTER_NAMES, (int(value) for value in self.registers[lane]))),
+            'executionMode'   : 'software',
+            'cycleType'       : 'instruction',
+            'pc'              : int(self.programCounter[lane]),
+            'ir'              : int(self.instructionRegister[lane]),
+            'halted'          : bool(self.halted[lane]),
+            'alu_flags'       : {'zero'    : bool(self.flagBits[lane] & FLAG_ZERO),
+                                 'carry'   : bool(self.flagBits[lane] & FLAG_CARRY),
+                                 'negative': bool(self.flagBits[lane] & FLAG_NEGATIVE)},
+            'seven_segment'   : int(self.sevenSegmentValue[lane]),
+            'outputEnabled'   : bool(self.outputEnabled[lane]),
+            'instructionCount': int(self.instructionCount[lane]),
+            'cycleCount'      : int(self.cycleCount[lane]),
+            'ram'             : [int(value) for value in self.ram[lane]]
+        }
+
+
+    # Vectorized ALU, same results and flags as ALU in alu.py
+    def _setFlags(self, lanes, result, carry):
+        self.flagBits[lanes] = (result == 0) | (carry.astype(np.uint8) << 1) | ((result & 0x80) >> 5)
+
+
+    def _arithmetic(self, lanes, a, b, subtract):
+        result = a.astype(np.int64) - b if subtract else a.astype(np.int64) + b
+        carry = result < 0 if subtract else result > 0xFF
+        result = (result & 0xFF).astype(np.uint8)
+        self._setFlags(lanes, result, carry)
+        return result
+
+
+    def _logical(self, lanes, result):
+        result = result.astype(np.uint8)
+        self._setFlags(lanes, result, np.zeros(result.shape, dtype=bool))
+        return result
+
+
+    def _push(self, lanes, values):
+        sp = self.stackPointer[lanes]
+        self.ram[lanes, sp] = values
+        self.stackPointer[lanes] = (sp - 1) & 0x0F
+
+
+    def _pop(self, lanes):
+        sp = (self.stackPointer[lanes] + 1) & 0x0F
+        self.stackPointer[lanes] = sp
+        return self.ram[lanes, sp]
+
+
+    # Instruction implementations; each receives the lanes executing it
+    def _executeNop(self, lanes, opcode, pc, immediate, target):
+        pass
+
+
+    def _executeHlt(self, lanes, opcode, pc, immediate, target):
+        self.halted[lanes] = True
+        self.programCounter[lanes] = pc
+
+
+    def _executeOut(self, lanes, opcode, pc, immediate, target):
+        self.sevenSegmentValue[lanes] = self.registers[lanes, 0]
+        self.outputEnabled[lanes] = True
+
+    _executeOuts = _executeOut
+
+
+    def _executeRst(self, lanes, opcode, pc, immediate, target):
+        self.reset(lanes)
+        self.programCounter[lanes] = 1
+        self.running[lanes] = False  # SoftwareCPU.reset() ends the run() call too
+
+
+    def _executeAdd(self, lanes, opcode, pc, immediate, target):
+        dst = self.destinationTable[opcode]
+        self.registers[lanes, dst] = self._arithmetic(lanes, self.registers[lanes, dst],
+                                                      self.registers[lanes, self.sourceTable[opcode]], False)
+
+
+    def _executeSub(self, lanes, opcode, pc, immediate, target):
+        dst = self.destinationTable[opcode]
+        self.registers[lanes, dst] = self._arithmetic(lanes, self.registers[lanes, dst],
+                                                      self.registers[lanes, self.sourceTable[opcode]], True)
+
+
+    def _executeCmp(self, lanes, opcode, pc, immediate, target):
+        self._arithmetic(lanes, self.registers[lanes, self.destinationTable[opcode]],
+                         self.registers[lanes, self.sourceTable[opcode]], True)
+
+    _executeCmps = _executeCmp
+
+
+    def _executeCmi(self, lanes, opcode, pc, immediate, target):
+        self._arithmetic(lanes, self.registers[lanes, self.destinationTable[opcode]], immediate, True)
+
+    _executeCmis = _executeCmi
+
+
+    def _executeAnd(self, lanes, opcode, pc, immediate, target):
+        dst = self.destinationTable[opcode]
+        self.registers[lanes, dst] = self._logical(lanes, self.registers[lanes, dst]
+                                                   & self.registers[lanes, self.sourceTable[opcode]])
+
+
+    def _executeOr(self, lanes, opcode, pc, immediate, target):
+        dst = self.destinationTable[opcode]
+        self.registers[lanes, dst] = self._logical(lanes, self.registers[lanes, dst]
+                                                   | self.registers[lanes, self.sourceTable[opcode]])
+
+
+    def _executeXor(self, lanes, opcode, pc, immediate, target):
+        dst = self.destinationTable[opcode]
+        self.registers[lanes, dst] = self._logical(lanes, self.registers[lanes, dst]
+                                                   ^ self.registers[lanes, self.sourceTable[opcode]])
+
+
+    def _executeNot(self, lanes, opcode, pc, immediate, target):
+        reg = self.destinationTable[opcode]
+        self.registers[lanes, reg] = self._logical(lanes, ~self.registers[lanes, reg])
+
+
+    def _executeMov(self, lanes, opcode, pc, immediate, target):
+        self.registers[lanes, self.destinationTable[opcode]] = self.registers[lanes, self.sourceTable[opcode]]
+
+
+    def _executeShl(self, lanes, opcode, pc, immediate, target):
+        reg = self.destinationTable[opcode]
+        value = self.registers[lanes, reg]
+        result = (value << 1).astype(np.uint8)
+        self._setFlags(lanes, result, (value & 0x80) != 0)
+        self.registers[lanes, reg] = result
+
+
+    def _executeShr(self, lanes, opcode, pc, immediate, target):
+        reg = self.destinationTable[opcode]
+        value = self.registers[lanes, reg]
+        result = value >> 1
+        self._setFlags(lanes, result, (value & 0x01) != 0)
+        self.registers[lanes, reg] = result
+
+
+    def _executeInc(self, lanes, opcode, pc, immediate, target):
+        reg = self.destinationTable[opcode]
+        self.registers[lanes, reg] = self._arithmetic(lanes, self.registers[lanes, reg], 1, False)
+
+
+    def _executeDec(self, lanes, opcode, pc, immediate, target):
+        reg = self.destinationTable[opcode]
+        self.registers[lanes, reg] = self._arithmetic(lanes, self.registers[lanes, reg], 1, True)
+
+
+    def _executeLdi(self, lanes, opcode, pc, immediate, target):
+        self.registers[lanes, self.destinationTable[opcode]] = immediate
+
+
+    def _executeLdm(self, lanes, opcode, pc, immediate, target):
+        self.registers[lanes, self.destinationTable[opcode]] = self.ram[lanes, immediate & 0x0F]
+
+
+    def _executeSav(self, lanes, opcode, pc, immediate, target):
+        self.ram[lanes, immediate & 0x0F] = self.registers[lanes, self.destinationTable[opcode]]
+
+
+    def _executePush(self, lanes, opcode, pc, immediate, target):
+        self._push(lanes, self.registers[lanes, self.destinationTable[opcode]])
+
+
+    def _executePop(self, lanes, opcode, pc, immediate, target):
+        self.registers[lanes, self.destinationTable[opcode]] = self._pop(lanes)
+
+
+    def _executePshv(self, lanes, opcode, pc, immediate, target):
+        self._push(lanes, immediate)
+
+
+    def _executeCall(self, lanes, opcode, pc, immediate, target):
+        returnAddress = pc + 2  # Mirrors SoftwareCPU._executeCall
+        self._push(lanes, (returnAddress >> 8) & 0xFF)
+        self._push(lanes, returnAddress & 0xFF)
+        self.programCounter[lanes] = target
+
+
+    def _executeRtn(self, lanes, opcode, pc, immediate, target):
+        lowByte = self._pop(lanes).astype(np.int64)
+        highByte = self._pop(lanes).astype(np.int64)
+        self.programCounter[lanes] = (highByte << 8) | lowByte
+
+
+    def _executeUnknown(self, lanes, opcode, pc, immediate, target):
+        self.running[lanes] = False
+
+
+    def _makeJump(self, kind):
+        def execute(lanes, opcode, pc, immediate, target):
+            flagBits = self.flagBits[lanes]
+            zero     = (flagBits & FLAG_ZERO) != 0
+            negative = (flagBits & FLAG_NEGATIVE) != 0
+            if kind == 'JMP':
+                self.programCounter[lanes] = target
+                return
+            elif kind in ('JMZ', 'JME'):
+                shouldJump = zero
+            elif kind == 'JNZ':
+                shouldJump = ~zero
+            elif kind == 'JMC':
+                shouldJump = (flagBits & FLAG_CARRY) != 0
+            elif kind == 'JMG':
+                shouldJump = ~zero & ~negative
+            else:  # JML
+                shouldJump = negative & ~zero
+            self.programCounter[lanes] = np.where(shouldJump, target, pc + 3)
+        return execute
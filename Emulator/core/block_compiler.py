@@ -0,0 +1,227 @@
+import re
+from typing import Callable, NamedTuple
+
+from .registers import REGISTER_NAMES
+
+
+MAX_BLOCK_INSTRUCTIONS = 256
+
+# Conditions read the flag locals of the generated function (z, c, n)
+JUMP_CONDITIONS = {
+    'JMP': None,
+    'JMZ': 'z',
+    'JNZ': 'not z',
+    'JMC': 'c',
+    'JME': 'z',
+    'JMG': 'not z and not n',
+    'JML': 'n and not z',
+}
+
+SET_ZN = "z = r{0} == 0; n = r{0} >= 128"
+
+
+class CompiledBlock(NamedTuple):
+    function: Callable
+    instructionCount: int
+    lastInstruction: int
+
+
+def _registerOperands(operands):
+    if 'register' in operands:
+        return f"r{REGISTER_NAMES[operands['register']]}", None
+    dst = REGISTER_NAMES[operands.get('destinationRegister', 0)]
+    src = REGISTER_NAMES[operands.get('sourceRegister', 0)]
+    return f"r{dst}", f"r{src}"
+
+
+def _emitStraightLine(opcode, operands, immediate):
+    # Returns the Python lines for one non-branching instruction, or None if
+    # the instruction must be left to SoftwareCPU.step (HLT, RST, unknown).
+    dst, src = _registerOperands(operands)
+    reg = dst
+
+    if opcode == 'NOP':
+        return []
+    if opcode in ('OUT', 'OUTS'):
+        return ["cpu.sevenSegmentValue = rA", "cpu.outputEnabled = True"]
+    if opcode == 'ADD':
+        return [f"t = {dst} + {src}", "c = t > 255", f"{dst} = t & 255", SET_ZN.format(dst[1])]
+    if opcode == 'SUB':
+        return [f"t = {dst} - {src}", "c = t < 0", f"{dst} = t & 255", SET_ZN.format(dst[1])]
+    if opcode in ('CMP', 'CMPS'):
+        return [f"t = ({dst} - {src})", "c = t < 0", "t &= 255", "z = t == 0; n = t >= 128"]
+    if opcode in ('AND', 'OR', 'XOR'):
+        operator = {'AND': '&', 'OR': '|', 'XOR': '^'}[opcode]
+        return [f"{dst} = {dst} {operator} {src}", "c = False", SET_ZN.format(dst[1])]
+    if opcode == 'MOV':
+        return [f"{dst} = {src}"]
+    if opcode == 'SHL':
+        return [f"c = {reg} >= 128", f"{reg} = ({reg} << 1) & 255", SET_ZN.format(reg[1])]
+    if opcode == 'SHR':
+        return [f"c = ({reg} & 1) == 1", f"{reg} >>= 1", SET_ZN.format(reg[1])]
+    if opcode == 'INC':
+        return [f"t = {reg} + 1", "c = t > 255", f"{reg} = t & 255", SET_ZN.format(reg[1])]
+    if opcode == 'DEC':
+        return [f"t = {reg} - 1", "c = t < 0", f"{reg} = t & 255", SET_ZN.format(reg[1])]
+    if opcode == 'NOT':
+        return [f"{reg} ^= 255", "c = False", SET_ZN.format(reg[1])]
+    if opcode == 'LDI':
+        return [f"{reg} = {immediate}"]
+    if opcode == 'LDM':
+        return [f"{reg} = ram[{immediate & 0x0F}]"]
+    if opcode == 'SAV':
+        return [f"ram[{immediate & 0x0F}] = {reg}"]
+    if opcode in ('CMI', 'CMIS'):
+        return [f"t = {reg} - {immediate}", "c = t < 0", "t &= 255", "z = t == 0; n = t >= 128"]
+    if opcode == 'PUSH':
+        return [f"ram[sp] = {reg}", "sp = (sp - 1) & 15"]
+    if opcode == 'POP':
+        return ["sp = (sp + 1) & 15", f"{reg} = ram[sp]"]
+    if opcode == 'PSHV':
+        return [f"ram[sp] = {immediate}", "sp = (sp - 1) & 15"]
+    return None
+
+
+def _emitTerminator(opcode, pc, size, address):
+    # Returns (lines, nextPcExpression, loopCondition) for an instruction that
+    # ends a block; loopCondition is set for a conditional jump back to itself.
+    if opcode in JUMP_CONDITIONS:
+        condition = JUMP_CONDITIONS[opcode]
+        if condition is None:
+            return [], str(address), None
+        return [], f"{address} if {condition} else {pc + size}", condition
+    if opcode == 'CALL':
+        # Mirrors SoftwareCPU._executeCall, which pushes PC + 2
+        returnAddress = pc + 2
+        return [
+            f"ram[sp] = {(returnAddress >> 8) & 0xFF}", "sp = (sp - 1) & 15",
+            f"ram[sp] = {returnAddress & 0xFF}", "sp = (sp - 1) & 15",
+        ], str(address), None
+    if opcode == 'RTN':
+        return [
+            "sp = (sp + 1) & 15", "t = ram[sp]",
+            "sp = (sp + 1) & 15",
+        ], "(ram[sp] << 8) | t", None
+    return None
+
+
+def compileBlock(cpu, startPc):
+    romSize = cpu.memory.ROM_SIZE
+    rom = bytes(cpu.memory.rom) + bytes(2)
+    decode = cpu.decoder.decode
+
+    body = []
+    count = 0
+    lastInstruction = None
+    nextPc = None
+    loopCondition = None
+    pc = startPc
+
+    while pc < romSize and count < MAX_BLOCK_INSTRUCTIONS:
+        instruction = rom[pc]
+        opcode, operands, size = decode(instruction)
+        immediate = rom[pc + 1]
+        address = (rom[pc + 1] << 8) | rom[pc + 2]
+
+        terminator = _emitTerminator(opcode, pc, size, address)
+        if terminator is not None:
+            lines, nextPc, condition = terminator
+            body.append(f"# {pc:04X}: {opcode}")
+            body.extend(lines)
+            count += 1
+            lastInstruction = instruction
+            if address == startPc:
+                loopCondition = condition
+            break
+
+        lines = _emitStraightLine(opcode, operands, immediate)
+        if lines is None:
+            break
+        body.append(f"# {pc:04X}: {opcode}")
+        body.extend(lines)
+        count += 1
+        lastInstruction = instruction
+        pc += size
+
+    if count == 0:
+        return None
+    if nextPc is None:
+        nextPc = str(pc)
+
+    # Tight loops (a conditional jump back to the block start) iterate inside
+    # the generated function, bounded by the caller's instruction budget.
+    if loopCondition is not None:
+        body = (["iterations = 1", "while True:"]
+                + [f"    {line}" for line in body]
+                + [f"    if not ({loopCondition}):",
+                   f"        nextPc = {pc + size}",
+                   "        break",
+                   "    if iterations >= maxIterations:",
+                   f"        nextPc = {startPc}",
+                   "        break",
+                   "    iterations += 1"])
+        result = f"nextPc, iterations * {count}"
+    else:
+        body = body + [f"nextPc = {nextPc}"]
+        result = f"nextPc, {count}"
+
+    # Only move the state this block touches in and out of locals
+    text = "\n".join(body)
+    registers = [name for name in REGISTER_NAMES if re.search(rf"\br{name}\b", text)]
+    usesFlags = re.search(r"\b[zcn]\b", text) is not None
+    usesStack = re.search(r"\bsp\b", text) is not None
+
+    source = ["def block(regs, alu, ram, memory, cpu, maxIterations):"]
+    source.extend(f"    r{name} = regs[{REGISTER_NAMES.index(name)}]" for name in registers)
+    if usesFlags:
+        source.append("    f = alu.flagBits; z = (f & 1) != 0; c = (f & 2) != 0; n = (f & 4) != 0")
+    if usesStack:
+        source.append("    sp = memory.stackPointer")
+    source.extend(f"    {line}" for line in body)
+    source.extend(f"    regs[{REGISTER_NAMES.index(name)}] = r{name}" for name in registers)
+    if usesFlags:
+        source.append("    alu.flagBits = z | (c << 1) | (n << 2)")
+    if usesStack:
+        source.append("    memory.stackPointer = sp")
+    source.append(f"    return {result}")
+
+    namespace = {}
+    exec(compile("\n".join(source), f"<block 0x{startPc:04X}>", "exec"), namespace)
+    return CompiledBlock(namespace['block'], count, lastInstruction)
+
+
+def runBlocks(cpu, maxInstructions = 10000):
+    # ROM only changes through loadProgram, whose reset() clears the cache
+    cache = cpu.blockCache
+    memory = cpu.memory
+
+    cpu.running = True
+    executed = 0
+    pc = cpu.programCounter
+
+    while cpu.running and not cpu.halted and executed < maxInstructions:
+        if pc in cache:
+            block = cache[pc]
+        elif pc < memory.ROM_SIZE:
+            block = cache[pc] = compileBlock(cpu, pc)
+        else:
+            block = None
+
+        maxIterations = (maxInstructions - executed) // block.instructionCount if block is not None else 0
+        if maxIterations > 0:
+            pc, count = block.function(cpu.registers.values, cpu.alu, memory.ram, memory, cpu, maxIterations)
+            executed += count
+            cpu.instructionCount += count
+            cpu.cycleCount += count
+            cpu.instructionRegister = block.lastInstruction
+            cpu.programCounter = pc
+            continue
+
+        # Not compilable here, or not enough budget left for the whole block
+        if not cpu.step():
+            break
+        executed += 1
+        pc = cpu.programCounter
+
+    cpu.running = False
+    return executed
@@ -0,0 +1,48 @@
+# Control word layout: one bit per control line, the bus driver and the
+# register-file latch as small enums above them. FlSe2..FlSe0 sit next to each
+# other so the flag select code is a single shift.
+CW_PCL   = 1 << 0
+CW_PCC   = 1 << 1
+CW_ADSU  = 1 << 2
+CW_CIN   = 1 << 3
+CW_SPC   = 1 << 4
+CW_SPUD  = 1 << 5
+CW_FLSE2 = 1 << 6
+CW_FLSE1 = 1 << 7
+CW_FLSE0 = 1 << 8
+CW_HLT   = 1 << 9
+CW_T1I   = 1 << 10
+CW_T2I   = 1 << 11
+CW_PCLI  = 1 << 12
+CW_PCHI  = 1 << 13
+CW_IRI   = 1 << 14
+CW_SEG7E = 1 << 15
+CW_SPL   = 1 << 16
+CW_SPO   = 1 << 17
+CW_MDI   = 1 << 18
+CW_MEI   = 1 << 19
+CW_FLGU  = 1 << 20
+CW_SQR   = 1 << 21
+
+CONTROL_LINE_BITS = {
+    'PCL': CW_PCL, 'PCC': CW_PCC, 'AdSu': CW_ADSU, 'Cin': CW_CIN, 'SpC': CW_SPC,
+    'SpUd': CW_SPUD, 'FlSe0': CW_FLSE0, 'FlSe1': CW_FLSE1, 'FlSe2': CW_FLSE2, 'HLT': CW_HLT,
+    'T1I': CW_T1I, 'T2I': CW_T2I, 'PCLI': CW_PCLI, 'PCHI': CW_PCHI, 'IRI': CW_IRI,
+    'Seg7E': CW_SEG7E, 'SpL': CW_SPL, 'SpO': CW_SPO, 'MdI': CW_MDI, 'MeI': CW_MEI,
+    'FlgU': CW_FLGU, 'SqR': CW_SQR,
+}
+CW_OUTPUT_ENABLE = CW_SPO | CW_SEG7E | CW_SPL
+CW_MEMORY_WRITE  = CW_MEI | CW_MDI
+FLAG_SELECT_SHIFT = 6
+
+BUS_SOURCE_SHIFT = 24
+BUS_NONE, BUS_A, BUS_B, BUS_C, BUS_D, BUS_PC, BUS_ROM, BUS_RAM, BUS_ADSU, BUS_AND, BUS_OR, BUS_XOR = range(12)
+BUS_SOURCES = {
+    'rAO': BUS_A, 'rBO': BUS_B, 'rCO': BUS_C, 'rDO': BUS_D, 'PCO': BUS_PC, 'RomO': BUS_ROM,
+    'MeO': BUS_RAM, 'AdSuO': BUS_ADSU, 'AndO': BUS_AND, 'OrO': BUS_OR, 'XorO': BUS_XOR,
+}
+
+BUS_LATCH_SHIFT = 28
+LATCH_REGISTERS = {'rAI': 1, 'rBI': 2, 'rCI': 3, 'rDI': 4}  # Register index + 1, 0 = none
+
+FLAG_SELECTS = tuple(((code >> 2) & 1, (code >> 1) & 1, code & 1) for code in range(8))
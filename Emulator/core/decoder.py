@@ -1,11 +1,19 @@
 import os
 import sys
+from types import MappingProxyType
+from typing import NamedTuple
 
 # Add parent directory to path to import MicrocodeConfig
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'Microcode'))
 from MicrocodeConfig import ParseConfig, GetAllInstructionOpcodes, GetAllInstructionSizes
 
 
+class DecodedInstruction(NamedTuple):
+    mnemonic: str
+    operands: MappingProxyType
+    size: int
+
+
 class InstructionDecoder:
     def __init__(self):
         # Load from centralized config
@@ -48,8 +56,21 @@ class InstructionDecoder:
                 subType = (opcode >> 4) & 0x0F
                 self.specialOpcodes[0b1111][subType] = insName
 
+        # Every opcode byte is known once the config is parsed, so decode all
+        # 256 of them up front. Entries are shared, hence read-only operands.
+        self.decodeTable = tuple(self._freezeEntry(self._decodeSlow(instruction)) for instruction in range(256))
+
 
     def decode(self, instruction):
+        return self.decodeTable[instruction & 0xFF]
+
+
+    def _freezeEntry(self, entry):
+        opcodeName, operands, size = entry
+        return DecodedInstruction(opcodeName, MappingProxyType(dict(operands)), size)
+
+
+    def _decodeSlow(self, instruction):
         opcode      = instruction & 0x0F  # Bottom 4 bits
         upperNibble = (instruction >> 4) & 0x0F  # Top 4 bits
 
@@ -147,6 +168,7 @@ class InstructionDecoder:
             # Get first instruction byte
             instByte = binaryData[pc]
             opcode, operands, size = self.decode(instByte)
+            operands = dict(operands)  # Table entries are shared and read-only
 
             # Collect all bytes for this instruction
             rawBytes = [instByte]
@@ -0,0 +1,458 @@
+from .alu import FLAG_ZERO, FLAG_CARRY, FLAG_NEGATIVE
+from .alu_tables import TableALU
+
+
+# Each factory returns a handler specialized for one opcode byte. A handler
+# takes the PC of the instruction and returns the PC of the next one; register
+# indices, sizes and flag conditions are resolved here, once, instead of per step.
+def _makeNop(cpu, env, operands, size):
+    def handler(pc):
+        return pc + size
+    return handler
+
+
+def _makeOut(cpu, env, operands, size):
+    regs = env['regs']
+
+    def handler(pc):
+        cpu.sevenSegmentValue = regs[0]
+        cpu.outputEnabled = True
+        return pc + size
+    return handler
+
+
+def _makeAdd(cpu, env, operands, size):
+    regs, alu = env['regs'], env['alu']
+    dst = operands['destinationRegister']
+    src = operands['sourceRegister']
+
+    def handler(pc):
+        result = regs[dst] + regs[src]
+        carry = result > 0xFF
+        result &= 0xFF
+        alu.flagBits = (result == 0) | (carry << 1) | ((result & 0x80) >> 5)
+        regs[dst] = result
+        return pc + size
+    return handler
+
+
+def _makeSub(cpu, env, operands, size):
+    regs, alu = env['regs'], env['alu']
+    dst = operands['destinationRegister']
+    src = operands['sourceRegister']
+
+    def handler(pc):
+        result = regs[dst] - regs[src]
+        carry = result < 0
+        result &= 0xFF
+        alu.flagBits = (result == 0) | (carry << 1) | ((result & 0x80) >> 5)
+        regs[dst] = result
+        return pc + size
+    return handler
+
+
+def _makeCmp(cpu, env, operands, size):
+    regs, alu = env['regs'], env['alu']
+    dst = operands['destinationRegister']
+    src = operands['sourceRegister']
+
+    def handler(pc):
+        result = regs[dst] - regs[src]
+        carry = result < 0
+        result &= 0xFF
+        alu.flagBits = (result == 0) | (carry << 1) | ((result & 0x80) >> 5)
+        return pc + size
+    return handler
+
+
+def _makeLogic(operation):
+    def factory(cpu, env, operands, size):
+        regs, alu = env['regs'], env['alu']
+        dst = operands['destinationRegister']
+        src = operands['sourceRegister']
+
+        def handler(pc):
+            result = operation(regs[dst], regs[src])
+            alu.flagBits = (result == 0) | ((result & 0x80) >> 5)
+            regs[dst] = result
+            return pc + size
+        return handler
+    return factory
+
+
+def _makeMov(cpu, env, operands, size):
+    regs = env['regs']
+    dst = operands['destinationRegister']
+    src = operands['sourceRegister']
+
+    def handler(pc):
+        regs[dst] = regs[src]
+        return pc + size
+    return handler
+
+
+def _makeShl(cpu, env, operands, size):
+    regs, alu = env['regs'], env['alu']
+    reg = operands['register']
+
+    def handler(pc):
+        value = regs[reg]
+        result = (value << 1) & 0xFF
+        alu.flagBits = (result == 0) | ((value & 0x80) >> 6) | ((result & 0x80) >> 5)
+        regs[reg] = result
+        return pc + size
+    return handler
+
+
+def _makeShr(cpu, env, operands, size):
+    regs, alu = env['regs'], env['alu']
+    reg = operands['register']
+
+    def handler(pc):
+        value = regs[reg]
+        result = value >> 1
+        alu.flagBits = (result == 0) | ((value & 0x01) << 1)
+        regs[reg] = result
+        return pc + size
+    return handler
+
+
+def _makeInc(cpu, env, operands, size):
+    regs, alu = env['regs'], env['alu']
+    reg = operands['register']
+
+    def handler(pc):
+        result = regs[reg] + 1
+        carry = result > 0xFF
+        result &= 0xFF
+        alu.flagBits = (result == 0) | (carry << 1) | ((result & 0x80) >> 5)
+        regs[reg] = result
+        return pc + size
+    return handler
+
+
+def _makeDec(cpu, env, operands, size):
+    regs, alu = env['regs'], env['alu']
+    reg = operands['register']
+
+    def handler(pc):
+        result = regs[reg] - 1
+        carry = result < 0
+        result &= 0xFF
+        alu.flagBits = (result == 0) | (carry << 1) | ((result & 0x80) >> 5)
+        regs[reg] = result
+        return pc + size
+    return handler
+
+
+def _makeNot(cpu, env, operands, size):
+    regs, alu = env['regs'], env['alu']
+    reg = operands['register']
+
+    def handler(pc):
+        result = regs[reg] ^ 0xFF
+        alu.flagBits = (result == 0) | ((result & 0x80) >> 5)
+        regs[reg] = result
+        return pc + size
+    return handler
+
+
+def _makeLdi(cpu, env, operands, size):
+    regs, rom = env['regs'], env['rom']
+    reg = operands['register']
+
+    def handler(pc):
+        regs[reg] = rom[pc + 1]
+        return pc + size
+    return handler
+
+
+def _makeLdm(cpu, env, operands, size):
+    regs, rom, ram = env['regs'], env['rom'], env['ram']
+    reg = operands['register']
+
+    def handler(pc):
+        regs[reg] = ram[rom[pc + 1] & 0x0F]
+        return pc + size
+    return handler
+
+
+def _makeSav(cpu, env, operands, size):
+    regs, rom, ram = env['regs'], env['rom'], env['ram']
+    reg = operands['register']
+
+    def handler(pc):
+        ram[rom[pc + 1] & 0x0F] = regs[reg]
+        return pc + size
+    return handler
+
+
+def _makeCmi(cpu, env, operands, size):
+    regs, alu, rom = env['regs'], env['alu'], env['rom']
+    reg = operands['register']
+
+    def handler(pc):
+        result = regs[reg] - rom[pc + 1]
+        carry = result < 0
+        result &= 0xFF
+        alu.flagBits = (result == 0) | (carry << 1) | ((result & 0x80) >> 5)
+        return pc + size
+    return handler
+
+
+def _makePush(cpu, env, operands, size):
+    regs, memory = env['regs'], cpu.memory
+    ram = env['ram']
+    reg = operands['register']
+
+    def handler(pc):
+        stackPointer = memory.stackPointer
+        ram[stackPointer] = regs[reg]
+        memory.stackPointer = (stackPointer - 1) & 0x0F
+        return pc + size
+    return handler
+
+
+def _makePop(cpu, env, operands, size):
+    regs, memory = env['regs'], cpu.memory
+    ram = env['ram']
+    reg = operands['register']
+
+    def handler(pc):
+        stackPointer = (memory.stackPointer + 1) & 0x0F
+        memory.stackPointer = stackPointer
+        regs[reg] = ram[stackPointer]
+        return pc + size
+    return handler
+
+
+def _makePshv(cpu, env, operands, size):
+    rom, ram, memory = env['rom'], env['ram'], cpu.memory
+
+    def handler(pc):
+        stackPointer = memory.stackPointer
+        ram[stackPointer] = rom[pc + 1]
+        memory.stackPointer = (stackPointer - 1) & 0x0F
+        return pc + size
+    return handler
+
+
+def _makeCall(cpu, env, operands, size):
+    rom, ram, memory = env['rom'], env['ram'], cpu.memory
+
+    def handler(pc):
+        # Mirrors SoftwareCPU._executeCall, which pushes PC + 2
+        returnAddress = pc + 2
+        stackPointer = memory.stackPointer
+        ram[stackPointer] = (returnAddress >> 8) & 0xFF
+        stackPointer = (stackPointer - 1) & 0x0F
+        ram[stackPointer] = returnAddress & 0xFF
+        memory.stackPointer = (stackPointer - 1) & 0x0F
+        return (rom[pc + 1] << 8) | rom[pc + 2]
+    return handler
+
+
+def _makeRtn(cpu, env, operands, size):
+    ram, memory = env['ram'], cpu.memory
+
+    def handler(pc):
+        stackPointer = (memory.stackPointer + 1) & 0x0F
+        lowByte = ram[stackPointer]
+        stackPointer = (stackPointer + 1) & 0x0F
+        memory.stackPointer = stackPointer
+        return (ram[stackPointer] << 8) | lowByte
+    return handler
+
+
+def _makeJump(condition):
+    def factory(cpu, env, operands, size):
+        rom, alu = env['rom'], env['alu']
+
+        if condition is None:
+            def handler(pc):
+                return (rom[pc + 1] << 8) | rom[pc + 2]
+        else:
+            def handler(pc):
+                if condition(alu.flagBits):
+                    return (rom[pc + 1] << 8) | rom[pc + 2]
+                return pc + size
+        return handler
+    return factory
+
+
+# With a TableALU every ALU op below is one lookup into a packed
+# result/flags table (see alu_tables), instead of arithmetic plus flag math.
+def _makeTableBinary(tableName, writeBack = True):
+    def factory(cpu, env, operands, size):
+        regs, alu = env['regs'], env['alu']
+        table = getattr(alu.tables, tableName)
+        dst = operands['destinationRegister']
+        src = operands['sourceRegister']
+
+        if writeBack:
+            def handler(pc):
+                entry = table[(regs[dst] << 8) | regs[src]]
+                alu.flagBits = entry >> 8
+                regs[dst] = entry & 0xFF
+                return pc + size
+        else:
+            def handler(pc):
+                alu.flagBits = table[(regs[dst] << 8) | regs[src]] >> 8
+                return pc + size
+        return handler
+    return factory
+
+
+def _makeTableUnary(tableName, operand = None):
+    # operand is the constant right-hand side for INC/DEC via the add/sub tables
+    def factory(cpu, env, operands, size):
+        regs, alu = env['regs'], env['alu']
+        table = getattr(alu.tables, tableName)
+        reg = operands['register']
+
+        if operand is None:
+            def handler(pc):
+                entry = table[regs[reg]]
+                alu.flagBits = entry >> 8
+                regs[reg] = entry & 0xFF
+                return pc + size
+        else:
+            def handler(pc):
+                entry = table[(regs[reg] << 8) | operand]
+                alu.flagBits = entry >> 8
+                regs[reg] = entry & 0xFF
+                return pc + size
+        return handler
+    return factory
+
+
+def _makeTableCmi(cpu, env, operands, size):
+    regs, alu, rom = env['regs'], env['alu'], env['rom']
+    table = alu.tables.sub
+    reg = operands['register']
+
+    def handler(pc):
+        alu.flagBits = table[(regs[reg] << 8) | rom[pc + 1]] >> 8
+        return pc + size
+    return handler
+
+
+TABLE_HANDLER_FACTORIES = {
+    'ADD' : _makeTableBinary('add'),
+    'SUB' : _makeTableBinary('sub'),
+    'CMP' : _makeTableBinary('sub', writeBack=False),
+    'CMPS': _makeTableBinary('sub', writeBack=False),
+    'AND' : _makeTableBinary('logicAnd'),
+    'OR'  : _makeTableBinary('logicOr'),
+    'XOR' : _makeTableBinary('logicXor'),
+    'SHL' : _makeTableUnary('shl'),
+    'SHR' : _makeTableUnary('shr'),
+    'NOT' : _makeTableUnary('logicNot'),
+    'INC' : _makeTableUnary('add', operand=1),
+    'DEC' : _makeTableUnary('sub', operand=1),
+    'CMI' : _makeTableCmi,
+    'CMIS': _makeTableCmi,
+}
+
+
+HANDLER_FACTORIES = {
+    'NOP' : _makeNop,
+    'OUT' : _makeOut,
+    'OUTS': _makeOut,
+    'ADD' : _makeAdd,
+    'SUB' : _makeSub,
+    'CMP' : _makeCmp,
+    'CMPS': _makeCmp,
+    'AND' : _makeLogic(lambda a, b: a & b),
+    'OR'  : _makeLogic(lambda a, b: a | b),
+    'XOR' : _makeLogic(lambda a, b: a ^ b),
+    'MOV' : _makeMov,
+    'SHL' : _makeShl,
+    'SHR' : _makeShr,
+    'INC' : _makeInc,
+    'DEC' : _makeDec,
+    'NOT' : _makeNot,
+    'LDI' : _makeLdi,
+    'LDM' : _makeLdm,
+    'SAV' : _makeSav,
+    'CMI' : _makeCmi,
+    'CMIS': _makeCmi,
+    'PUSH': _makePush,
+    'POP' : _makePop,
+    'PSHV': _makePshv,
+    'CALL': _makeCall,
+    'RTN' : _makeRtn,
+    'JMP' : _makeJump(None),
+    'JMZ' : _makeJump(lambda flagBits: flagBits & FLAG_ZERO),
+    'JNZ' : _makeJump(lambda flagBits: not flagBits & FLAG_ZERO),
+    'JMC' : _makeJump(lambda flagBits: flagBits & FLAG_CARRY),
+    'JME' : _makeJump(lambda flagBits: flagBits & FLAG_ZERO),
+    'JMG' : _makeJump(lambda flagBits: not flagBits & (FLAG_ZERO | FLAG_NEGATIVE)),
+    'JML' : _makeJump(lambda flagBits: flagBits & (FLAG_ZERO | FLAG_NEGATIVE) == FLAG_NEGATIVE),
+}
+
+
+def buildHandlers(cpu, rom):
+    # HLT, RST and anything SoftwareCPU.execute rejects get no handler; the
+    # run loop hands those to SoftwareCPU.step so their side effects match.
+    env = {
+        'regs' : cpu.registers.values,
+        'alu'  : cpu.alu,
+        'ram'  : cpu.memory.ram,
+        'rom'  : rom,
+    }
+
+    factories = HANDLER_FACTORIES
+    if isinstance(cpu.alu, TableALU):
+        factories = {**HANDLER_FACTORIES, **TABLE_HANDLER_FACTORIES}
+
+    handlers = []
+    for instruction in range(256):
+        opcode, operands, size = cpu.decoder.decode(instruction)
+        factory = factories.get(opcode)
+        handlers.append(factory(cpu, env, operands, size) if factory else None)
+    return handlers
+
+
+def runThreaded(cpu, maxInstructions = 10000):
+    romSize = cpu.memory.ROM_SIZE
+    # Operand reads past the end of ROM see 0, as Memory.readRom does
+    rom = bytes(cpu.memory.rom) + bytes(2)
+    handlers = buildHandlers(cpu, rom)
+
+    cpu.running = True
+    executed = 0
+    pc = cpu.programCounter
+    instruction = None
+
+    while cpu.running and not cpu.halted and executed < maxInstructions:
+        # Fast path: stay inside this loop until a slow-path instruction shows up
+        start = executed
+        while executed < maxInstructions and pc < romSize:
+            instruction = rom[pc]
+            handler = handlers[instruction]
+            if handler is None:
+                break
+            pc = handler(pc)
+            executed += 1
+
+        fastCount = executed - start
+        cpu.instructionCount += fastCount
+        cpu.cycleCount += fastCount
+        cpu.programCounter = pc
+        if instruction is not None:
+            cpu.instructionRegister = instruction
+
+        if executed >= maxInstructions:
+            break
+
+        # Slow path: one interpreted step. reset() clears state in place, so
+        # the handlers stay bound to the live registers and RAM.
+        if not cpu.step():
+            break
+        executed += 1
+        pc = cpu.programCounter
+        instruction = None
+
+    cpu.running = False
+    return executed
@@ -4,7 +4,17 @@ import yaml
 from .decoder import InstructionDecoder
 from .registers import RegisterFile
 from .memory import Memory
-from .alu import ALU
+from .alu import ALU, FLAG_ZERO, FLAG_CARRY, FLAG_NEGATIVE
+from .alu_tables import TableALU
+from .control_word import (
+    CW_PCL, CW_PCC, CW_ADSU, CW_CIN, CW_HLT, CW_SPUD, CW_T1I, CW_T2I, CW_PCLI, CW_PCHI, CW_IRI,
+    CW_SEG7E, CW_SPL, CW_MDI, CW_FLGU, CW_SQR, CW_OUTPUT_ENABLE, CW_MEMORY_WRITE, CONTROL_LINE_BITS,
+    FLAG_SELECT_SHIFT, FLAG_SELECTS, BUS_SOURCE_SHIFT, BUS_SOURCES, BUS_LATCH_SHIFT, LATCH_REGISTERS,
+    BUS_NONE, BUS_A, BUS_D, BUS_PC, BUS_ROM, BUS_RAM, BUS_ADSU, BUS_AND, BUS_OR,
+)
+from .microtrace import runTraces
+from .profiler import Profiler
+from .trace import TraceBuffer, DEFAULT_CAPACITY
 
 
 class HardwareCPU:
@@ -17,10 +27,11 @@ class HardwareCPU:
                  sevenSegPath=None,
                  configPath=None,
                  enable_signal_logging=True,
-                 log_callback=None):
+                 log_callback=None,
+                 useAluTables=False):
         self.registers = RegisterFile()
         self.memory = Memory()
-        self.alu = ALU()
+        self.alu = TableALU() if useAluTables else ALU()
         self.decoder = InstructionDecoder()
 
         self.microcodeDir = microcodeDir or self.DEFAULT_MICROCODE_DIR
@@ -31,11 +42,14 @@ class HardwareCPU:
         self.log_callback = log_callback if log_callback is not None else print
 
         self.microcodeBanks = [bytearray(), bytearray(), bytearray()]
+        self.controlWords = ()
+        self.traceCache = {}  # (IR, flags, flag select, started) -> MicroTrace, see microtrace
         self.sevenSegRom = None
         self.inputSignalByCode = {}
         self.outputSignalByCode = {}
 
         self.flagSelect = (0, 0, 0)
+        self.flagSelectCode = 0
         self.memoryAddress = 0
         self.bus = 0
         self.temp1 = 0
@@ -46,9 +60,12 @@ class HardwareCPU:
         self.sevenSegmentPatterns = None
         self.outputEnabled = False
         self.signedMode = True
+        self.profiler = None
+        self.trace = None
 
         self._loadConfig()
         self._loadMicrocodeBanks()
+        self._predecodeMicrocode()
         self._loadSevenSegRom()
         self.reset()
 
@@ -87,6 +104,27 @@ class HardwareCPU:
                 raise ValueError(f"Microcode bank {filename} must be 32768 bytes")
             self.microcodeBanks[chipIndex] = bytearray(data)
 
+    def _predecodeMicrocode(self):
+        # The banks never change once loaded, so turn every address into a
+        # control word up front; identical bank byte triples share the work.
+        wordsByOutputs = {}
+        controlWords = []
+        for address, outputs in enumerate(zip(*self.microcodeBanks)):
+            word = wordsByOutputs.get(outputs)
+            if word is None:
+                word = wordsByOutputs[outputs] = self._encode_control_word(self._decode_microcode_outputs(*outputs, address))
+            controlWords.append(word)
+        self.controlWords = tuple(controlWords)
+
+    def _encode_control_word(self, signals):
+        word = 0
+        for name, bit in CONTROL_LINE_BITS.items():
+            if signals.get(name):
+                word |= bit
+        word |= BUS_SOURCES.get(signals['virtual_output'], BUS_NONE) << BUS_SOURCE_SHIFT
+        word |= LATCH_REGISTERS.get(signals['virtual_input'], 0) << BUS_LATCH_SHIFT
+        return word
+
     def _loadSevenSegRom(self):
         if not os.path.exists(self.sevenSegPath):
             self._generateSevenSegRom()
@@ -163,26 +201,17 @@ class HardwareCPU:
             f.write(bytes(eeprom))
 
     def _compute_flag_input(self):
-        select = self.flagSelect
-        zero = self.alu.flags['zero']
-        carry = self.alu.flags['carry']
-        negative = self.alu.flags['negative']
-        greater = (not zero) and (not negative)
-        less = negative
-        equal = zero
-
-        code = (select[0] << 2) | (select[1] << 1) | select[2]
-
-        if code == 0b000:
-            return 1 if zero else 0
+        code = self.flagSelectCode
+        flagBits = self.alu.flagBits
+
+        if code == 0b000 or code == 0b100:  # Zero / equal
+            return flagBits & FLAG_ZERO
         if code == 0b001:
-            return 1 if carry else 0
-        if code == 0b010:
-            return 1 if greater else 0
-        if code == 0b011:
-            return 1 if less else 0
-        if code == 0b100:
-            return 1 if equal else 0
+            return 1 if flagBits & FLAG_CARRY else 0
+        if code == 0b010:  # Greater
+            return 0 if flagBits & (FLAG_ZERO | FLAG_NEGATIVE) else 1
+        if code == 0b011:  # Less
+            return 1 if flagBits & FLAG_NEGATIVE else 0
         return 0
 
     def _get_microcode_address(self):
@@ -264,88 +293,73 @@ class HardwareCPU:
             result, carryOut = self.alu.add(self.temp1, self.temp2, cin)
         return result, carryOut
 
-    def _compute_bus_value(self, signals):
-        virtual_output = signals.get('virtual_output')
-        if virtual_output == 'rAO':
-            return self.registers.readByName('A')
-        if virtual_output == 'rBO':
-            return self.registers.readByName('B')
-        if virtual_output == 'rCO':
-            return self.registers.readByName('C')
-        if virtual_output == 'rDO':
-            return self.registers.readByName('D')
-        if virtual_output == 'PCO':
+    def _compute_bus_value(self, word):
+        source = (word >> BUS_SOURCE_SHIFT) & 0x0F
+        if source == BUS_NONE:
+            # No output source is driving the bus in this micro-step.
+            return 0
+        if source <= BUS_D:
+            return self.registers.values[source - BUS_A]
+        if source == BUS_PC:
             return self.programCounter & 0xFF
-        if virtual_output == 'RomO':
+        if source == BUS_ROM:
             return self.memory.readRom(self.programCounter)
-        if virtual_output == 'MeO':
+        if source == BUS_RAM:
             return self.memory.readRam(self.memoryAddress)
-        if virtual_output == 'AdSuO':
-            result, _ = self._alu_result(signals['AdSu'], int(signals['Cin']))
+        if source == BUS_ADSU:
+            result, _ = self._alu_result(word & CW_ADSU, 1 if word & CW_CIN else 0)
             return result
-        if virtual_output == 'AndO':
+        if source == BUS_AND:
             return self.temp1 & self.temp2
-        if virtual_output == 'OrO':
+        if source == BUS_OR:
             return self.temp1 | self.temp2
-        if virtual_output == 'XorO':
-            return self.temp1 ^ self.temp2
+        return self.temp1 ^ self.temp2
 
-        # No output source is driving the bus in this micro-step.
-        return 0
-
-    def _apply_control_signals(self, signals):
-        if signals.get('SpO') or signals.get('Seg7E') or signals.get('SpL'):
+    def _apply_control_word(self, word):
+        if word & CW_OUTPUT_ENABLE:
             self.outputEnabled = True
         self.sevenSegmentPatterns = None
 
-        if signals.get('rAI'):
-            self.registers.writeByName('A', self.bus)
-        if signals.get('rBI'):
-            self.registers.writeByName('B', self.bus)
-        if signals.get('rCI'):
-            self.registers.writeByName('C', self.bus)
-        if signals.get('rDI'):
-            self.registers.writeByName('D', self.bus)
-        if signals.get('T1I'):
+        latch = word >> BUS_LATCH_SHIFT
+        if latch:
+            self.registers.values[latch - 1] = self.bus
+        if word & CW_T1I:
             self.temp1 = self.bus & 0xFF
-        if signals.get('T2I'):
+        if word & CW_T2I:
             self.temp2 = self.bus & 0xFF
-        if signals.get('PCLI'):
+        if word & CW_PCLI:
             self.pcLowRegister = self.bus & 0xFF
-        if signals.get('PCHI'):
+        if word & CW_PCHI:
             self.pcHighRegister = self.bus & 0x07
-        if signals.get('IRI'):
+        if word & CW_IRI:
             self.instructionRegister = self.bus & 0xFF
-        if signals.get('Seg7E'):
-            self.sevenSegmentValue = self.registers.readByName('A')
-        if signals.get('SpL'):
+        if word & CW_SEG7E:
+            self.sevenSegmentValue = self.registers.values[0]
+        if word & CW_SPL:
             self.sevenSegmentValue = self.bus & 0xFF
 
-        if signals.get('MdI'):
+        if word & CW_MDI:
             self.memoryAddress = self.bus & 0x0F
 
-        if signals.get('MeI') and signals.get('MdI'):
+        if word & CW_MEMORY_WRITE == CW_MEMORY_WRITE:
             self.memory.writeRam(self.memoryAddress, self.bus)
 
-        if signals.get('PCL'):
+        if word & CW_PCL:
             self.programCounter = ((self.pcHighRegister << 8) | self.pcLowRegister) & 0x7FF
 
-        if signals.get('PCC'):
+        if word & CW_PCC:
             self.programCounter = (self.programCounter + 1) & 0x7FF
 
-        if signals.get('FlgU'):
-            result, carryOut = self._alu_result(signals['AdSu'], int(signals['Cin']))
+        if word & CW_FLGU:
+            result, carryOut = self._alu_result(word & CW_ADSU, 1 if word & CW_CIN else 0)
             self.alu._updateFlags(result, carryOut)
 
-        if signals.get('Seg7E') or signals.get('SpO') or signals.get('SpL'):
+        if word & CW_OUTPUT_ENABLE:
             self._update_seven_segment_patterns()
 
-        if signals.get('SpUd'):
-            self.signedMode = False
-        else:
-            self.signedMode = True
+        self.signedMode = not (word & CW_SPUD)
 
-        if signals.get('HLT'):
+        if word & CW_HLT:
             self.halted = True
 
     def _update_seven_segment_patterns(self):
@@ -380,6 +394,7 @@ class HardwareCPU:
         self.halted = False
         self.running = False
         self.flagSelect = (0, 0, 0)
+        self.flagSelectCode = 0
         self.memoryAddress = 0
         self.bus = 0
         self.temp1 = 0
@@ -390,54 +405,92 @@ class HardwareCPU:
         self.instructionCount = 0
         self.cycleCount = 0
         self.currentInstructionStarted = False
+        self.instructionStartPc = 0
+        self.instructionStartCycle = 0
+
+    def enableProfiling(self, profiler=None):
+        self.profiler = profiler or Profiler(romSize=self.memory.ROM_SIZE, configPath=self.configPath,
+                                             decoder=self.decoder)
+        return self.profiler
+
+    def disableProfiling(self):
+        self.profiler = None
+
+    def enableTrace(self, capacity=DEFAULT_CAPACITY, stream=None):
+        self.disableTrace()
+        self.trace = TraceBuffer(capacity, stream)
+        return self.trace
+
+    def disableTrace(self):
+        trace, self.trace = self.trace, None
+        if trace is not None:
+            trace.close()
+        return trace
 
     def step(self):
         if self.halted:
             return False
 
-        address = self._get_microcode_address()
-        bank0 = self.microcodeBanks[0][address]
-        bank1 = self.microcodeBanks[1][address]
-        bank2 = self.microcodeBanks[2][address]
-
-        signals = self._decode_microcode_outputs(bank0, bank1, bank2, address)
+        pcBefore = self.programCounter
 
-        # Log instruction start before logging signals
-        if self.sequenceCounter == 0 and not self.currentInstructionStarted and self.enable_signal_logging:
-            self._log_instruction_start()
+        address = self._get_microcode_address()
+        word = self.controlWords[address]
 
         if self.enable_signal_logging:
-            self._log_signals(signals, self.cycleCount)
+            # Log instruction start before logging signals
+            if self.sequenceCounter == 0 and not self.currentInstructionStarted:
+                self._log_instruction_start()
+            banks = self.microcodeBanks
+            self._log_signals(self._decode_microcode_outputs(banks[0][address], banks[1][address], banks[2][address], address),
+                              self.cycleCount)
 
-        bus_value = self._compute_bus_value(signals)
-        self.bus = bus_value & 0xFF
+        self.bus = self._compute_bus_value(word) & 0xFF
 
-        self._apply_control_signals(signals)
+        self._apply_control_word(word)
 
-        next_seq = 0 if signals.get('SqR') else ((self.sequenceCounter + 1) & 0x0F)
-        if signals.get('SqR') and self.currentInstructionStarted:
-            self.instructionCount += 1
-            self.currentInstructionStarted = False
-        elif signals.get('HLT') and self.currentInstructionStarted:
+        next_seq = 0 if word & CW_SQR else ((self.sequenceCounter + 1) & 0x0F)
+        if word & (CW_SQR | CW_HLT) and self.currentInstructionStarted:
             self.instructionCount += 1
             self.currentInstructionStarted = False
+            if self.profiler is not None:
+                self.profiler.record(self.instructionStartPc, self.instructionRegister, self.programCounter,
+                                     self.cycleCount + 1 - self.instructionStartCycle)
+            if self.trace is not None:
+                self.trace.write(self.instructionStartPc, self.registers.values, self.instructionRegister,
+                                 self.alu.flagBits, self.memory.stackPointer, self.sevenSegmentValue)
 
         if self.sequenceCounter == 0 and not self.currentInstructionStarted:
             self.currentInstructionStarted = True
+            self.instructionStartPc = pcBefore
+            self.instructionStartCycle = self.cycleCount
 
         self.sequenceCounter = next_seq
         self.cycleCount += 1
 
-        self.flagSelect = (int(signals.get('FlSe0', False)),
-                           int(signals.get('FlSe1', False)),
-                           int(signals.get('FlSe2', False)))
+        self.flagSelectCode = (word >> FLAG_SELECT_SHIFT) & 0b111
+        self.flagSelect = FLAG_SELECTS[self.flagSelectCode]
 
         return not self.halted
 
     def run(self, maxInstructions=10000):
+        # maxInstructions bounds micro-steps (clock cycles), not instructions
+        return self._run_cycles(maxInstructions)
+
+    def runInstructions(self, count, maxCycles=10000):
+        # Runs until count more instructions retire (SqR or HLT), the CPU
+        # halts or maxCycles micro-steps pass
+        return self._run_cycles(maxCycles, self.instructionCount + count)
+
+    def _run_cycles(self, maxCycles, untilInstructionCount=None):
+        # The per-cycle signal log, the profiler and the trace need the stepping path
+        if not self.enable_signal_logging and self.profiler is None and self.trace is None:
+            return runTraces(self, maxCycles, untilInstructionCount)
+
         self.running = True
         executed = 0
-        while self.running and not self.halted and executed < maxInstructions:
+        while self.running and not self.halted and executed < maxCycles:
+            if untilInstructionCount is not None and self.instructionCount >= untilInstructionCount:
+                break
             if not self.step():
                 break
             executed += 1
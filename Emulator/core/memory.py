@@ -1,4 +1,6 @@
 class Memory:
+    __slots__ = ('ROM_SIZE', 'RAM_SIZE', 'rom', 'ram', 'stackPointer')
+
     def __init__(self):
         self.ROM_SIZE = 2048  # 2KB ROM (11-bit addressing)
         self.RAM_SIZE = 16    # 16 bytes RAM (4-bit addressing)
@@ -25,6 +27,10 @@ class Memory:
                 break  # Don't overflow ROM
 
 
+    def clearRom(self):
+        self.rom[:] = bytes(self.ROM_SIZE)
+
+
     def readRom(self, address):
         if 0 <= address < self.ROM_SIZE:
             return self.rom[address]
@@ -61,7 +67,7 @@ class Memory:
 
 
     def resetRam(self):
-        self.ram = bytearray(self.RAM_SIZE)
+        self.ram[:] = bytes(self.RAM_SIZE)  # In place, keeps self.ram bindings valid
         self.stackPointer = self.RAM_SIZE - 1
 
 
@@ -0,0 +1,80 @@
+import os
+import sys
+
+# Add the Microcode directory to path to read the pin maps the banks were built with
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'Microcode'))
+from MicrocodeConfig import (ParseConfig, CFG_MICROCODE_CHIPS_PIN_MAP, CFG_INPUT_PIN_MAP, CFG_OUTPUT_PIN_MAP,
+                             CFG_VIRTUAL_PIN_CONFIG, CFG_OUTPUT_CONTROL, UCODE_0, UCODE_1, UCODE_2)
+
+
+DEFAULT_MICROCODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Microcode', 'out'))
+DEFAULT_CONFIG_PATH   = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Microcode', 'MicroCodeConfig.yaml'))
+
+MAX_SEQUENCE_STEPS = 16
+
+_microcodeCycleCache = {}
+
+
+def _bankPath(microcodeDir, index, chipName):
+    # GenMicrocode writes uCode<n>.bin, HardwareCPU reads Microcode_<n>.bin
+    for fileName in (f"{chipName}.bin", f"Microcode_{index}.bin"):
+        path = os.path.join(microcodeDir, fileName)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def microcodeBankPaths(microcodeDir = None):
+    # Path of every chip's bank, None for the ones not generated
+    microcodeDir = microcodeDir or DEFAULT_MICROCODE_DIR
+    return [_bankPath(microcodeDir, index, chipName) for index, chipName in enumerate((UCODE_0, UCODE_1, UCODE_2))]
+
+
+def loadMicrocodeCycles(microcodeDir = None, configPath = None):
+    # Clock cycles of every opcode byte with the flag input held low and
+    # high: the steps up to and including the one that raises SqR or HLT.
+    # Addresses and outputs are placed by the config's chip pin maps.
+    # None when the banks have not been generated.
+    microcodeDir = microcodeDir or DEFAULT_MICROCODE_DIR
+    configPath = configPath or DEFAULT_CONFIG_PATH
+    key = (os.path.abspath(microcodeDir), os.path.abspath(configPath))
+    if key in _microcodeCycleCache:
+        return _microcodeCycleCache[key]
+
+    paths = microcodeBankPaths(microcodeDir)
+    if None in paths:
+        _microcodeCycleCache[key] = None
+        return None
+
+    banks = {}
+    for chipName, path in zip((UCODE_0, UCODE_1, UCODE_2), paths):
+        with open(path, 'rb') as f:
+            banks[chipName] = f.read()
+
+    config = ParseConfig(configPath)
+    pinMap = config[CFG_MICROCODE_CHIPS_PIN_MAP]
+    addressBit = {signal: int(pin.strip()[1:]) for pin, signal in pinMap[CFG_INPUT_PIN_MAP].items()}
+    outputBit = {signal: (chipName, int(pin.strip()[2:]))
+                 for chipName, pins in pinMap[CFG_OUTPUT_PIN_MAP].items() for pin, signal in pins.items()}
+    sequenceReset = config[CFG_VIRTUAL_PIN_CONFIG][CFG_OUTPUT_CONTROL]['SqR']
+
+    def signal(name, address):
+        chipName, bit = outputBit[name]
+        return (banks[chipName][address] >> bit) & 1
+
+    cycles = []
+    for opcode in range(256):
+        base = sum(1 << addressBit[f"InsR{bit}"] for bit in range(8) if opcode >> bit & 1)
+        perFlag = []
+        for flag in (0, 1):
+            for step in range(MAX_SEQUENCE_STEPS):
+                address = base | (flag << addressBit['Flag'])
+                address |= sum(1 << addressBit[f"Seqn{bit}"] for bit in range(4) if step >> bit & 1)
+                virtualOutput = sum(signal(f"ViOt{pin}", address) << position for position, pin in enumerate("ABCD"))
+                if virtualOutput == sequenceReset or signal('HLT', address):
+                    break
+            perFlag.append(step + 1)
+        cycles.append(tuple(perFlag))
+
+    _microcodeCycleCache[key] = tuple(cycles)
+    return _microcodeCycleCache[key]
@@ -0,0 +1,222 @@
+from typing import Callable, NamedTuple
+
+from .control_word import (
+    CW_PCL, CW_PCC, CW_ADSU, CW_CIN, CW_SPUD, CW_HLT, CW_T1I, CW_T2I, CW_PCLI, CW_PCHI, CW_IRI,
+    CW_SEG7E, CW_SPL, CW_MDI, CW_FLGU, CW_SQR, CW_OUTPUT_ENABLE, CW_MEMORY_WRITE,
+    FLAG_SELECT_SHIFT, FLAG_SELECTS, BUS_SOURCE_SHIFT, BUS_LATCH_SHIFT,
+    BUS_NONE, BUS_A, BUS_D, BUS_PC, BUS_ROM, BUS_RAM, BUS_ADSU, BUS_AND, BUS_OR, BUS_XOR,
+)
+
+
+# Flag input for each flag select code, as HardwareCPU._compute_flag_input
+FLAG_INPUTS = {
+    0b000: "alu.flagBits & 1",
+    0b001: "(alu.flagBits >> 1) & 1",
+    0b010: "0 if alu.flagBits & 5 else 1",
+    0b011: "(alu.flagBits >> 2) & 1",
+    0b100: "alu.flagBits & 1",
+}
+
+BUS_EXPRESSIONS = {
+    BUS_NONE: "0",
+    BUS_PC  : "pc & 255",
+    BUS_ROM : "rom[pc]",
+    BUS_RAM : "ram[mar]",
+    BUS_AND : "t1 & t2",
+    BUS_OR  : "t1 | t2",
+    BUS_XOR : "t1 ^ t2",
+}
+
+STATE_LOCALS = (
+    ('pc', 'programCounter'), ('t1', 'temp1'), ('t2', 'temp2'), ('mar', 'memoryAddress'),
+    ('pcl', 'pcLowRegister'), ('pch', 'pcHighRegister'), ('ir', 'instructionRegister'),
+)
+
+
+class MicroTrace(NamedTuple):
+    function: Callable
+    cycleCount: int
+    halts: bool
+
+
+def _aluCall(word):
+    operation = "subtract" if word & CW_ADSU else "add"
+    return f"alu.{operation}(t1, t2, {1 if word & CW_CIN else 0})"
+
+
+def _emitControlWord(word):
+    # Python lines for one micro-step, in the order of
+    # HardwareCPU._compute_bus_value and _apply_control_word
+    source = (word >> BUS_SOURCE_SHIFT) & 0x0F
+    if BUS_A <= source <= BUS_D:
+        lines = [f"bus = regs[{source - BUS_A}]"]
+    elif source == BUS_ADSU:
+        lines = [f"bus = {_aluCall(word)}[0]"]
+    else:
+        lines = [f"bus = {BUS_EXPRESSIONS[source]}"]
+
+    if word & CW_OUTPUT_ENABLE:
+        lines.append("cpu.outputEnabled = True")
+    lines.append("cpu.sevenSegmentPatterns = None")
+
+    latch = word >> BUS_LATCH_SHIFT
+    if latch:
+        lines.append(f"regs[{latch - 1}] = bus")
+    if word & CW_T1I:
+        lines.append("t1 = bus")
+    if word & CW_T2I:
+        lines.append("t2 = bus")
+    if word & CW_PCLI:
+        lines.append("pcl = bus")
+    if word & CW_PCHI:
+        lines.append("pch = bus & 7")
+    if word & CW_IRI:
+        lines.append("ir = bus")
+    if word & CW_SEG7E:
+        lines.append("cpu.sevenSegmentValue = regs[0]")
+    if word & CW_SPL:
+        lines.append("cpu.sevenSegmentValue = bus")
+    if word & CW_MDI:
+        lines.append("mar = bus & 15")
+    if word & CW_MEMORY_WRITE == CW_MEMORY_WRITE:
+        lines.append("ram[mar] = bus")
+    if word & CW_PCL:
+        lines.append("pc = ((pch << 8) | pcl) & 0x7FF")
+    if word & CW_PCC:
+        lines.append("pc = (pc + 1) & 0x7FF")
+    if word & CW_FLGU:
+        lines.append(_aluCall(word))  # Leaves the flags _updateFlags would set
+    if word & CW_OUTPUT_ENABLE:
+        lines.append("cpu._update_seven_segment_patterns()")
+    lines.append(f"cpu.signedMode = {not (word & CW_SPUD)}")
+    if word & CW_HLT:
+        lines.append("cpu.halted = True")
+    return lines
+
+
+def _emitExit(cycles, instructions, sequenceCounter, started, word):
+    flagSelectCode = (word >> FLAG_SELECT_SHIFT) & 0b111
+    lines = [f"cpu.{attribute} = {name}" for name, attribute in STATE_LOCALS]
+    lines += [
+        "cpu.bus = bus",
+        f"cpu.sequenceCounter = {sequenceCounter}",
+        f"cpu.currentInstructionStarted = {started}",
+        f"cpu.cycleCount += {cycles}",
+        f"cpu.flagSelectCode = {flagSelectCode}",
+        f"cpu.flagSelect = {FLAG_SELECTS[flagSelectCode]}",
+    ]
+    if instructions:
+        lines.append(f"cpu.instructionCount += {instructions}")
+    lines.append(f"return {cycles}")
+    return lines
+
+
+def compileTrace(addresses, controlWords, started):
+    # addresses[i] is the microcode address of cycle i, recorded by stepping
+    # from sequence counter 0. Cycles that may change the next address
+    # (IR loads, flag updates) are followed by a guard that leaves the trace
+    # early, with the machine state exact, if this run takes another path.
+    body = []
+    sequenceCounter = 0
+    instructions = 0
+    flagsChanged = False
+    halts = False
+
+    for index, address in enumerate(addresses):
+        word = controlWords[address]
+        body.append(f"# Cycle {index}: address 0x{address:04X}")
+        body.extend(_emitControlWord(word))
+
+        # Instruction and sequence bookkeeping of HardwareCPU.step
+        nextSequence = 0 if word & CW_SQR else (sequenceCounter + 1) & 0x0F
+        if word & (CW_SQR | CW_HLT) and started:
+            instructions += 1
+            started = False
+        if sequenceCounter == 0 and not started:
+            started = True
+        sequenceCounter = nextSequence
+
+        flagsChanged = flagsChanged or bool(word & CW_FLGU) or (word >> BUS_SOURCE_SHIFT) & 0x0F == BUS_ADSU
+        exit = _emitExit(index + 1, instructions, sequenceCounter, started, word)
+
+        if word & CW_HLT:
+            halts = True
+            body.extend(exit)
+            break
+        if index + 1 == len(addresses):
+            body.extend(exit)
+            break
+
+        nextAddress = addresses[index + 1]
+        guards = []
+        if word & CW_IRI:
+            guards.append(f"ir != {nextAddress & 0xFF}")
+        if flagsChanged:
+            flagSelectCode = (word >> FLAG_SELECT_SHIFT) & 0b111
+            flagInput = FLAG_INPUTS.get(flagSelectCode, "0")
+            guards.append(f"({flagInput}) != {(nextAddress >> 12) & 1}")
+        if guards:
+            body.append(f"if {' or '.join(guards)}:")
+            body.extend(f"    {line}" for line in exit)
+
+    source = ["def trace(cpu, regs, ram, rom, alu):"]
+    source.extend(f"    {name} = cpu.{attribute}" for name, attribute in STATE_LOCALS)
+    source.extend(f"    {line}" for line in body)
+
+    namespace = {}
+    exec(compile("\n".join(source), f"<microtrace 0x{addresses[0]:04X}>", "exec"), namespace)
+    return MicroTrace(namespace['trace'], len(addresses), halts)
+
+
+def runTraces(cpu, maxCycles = 10000, untilInstructionCount = None):
+    # Same contract as HardwareCPU.run: maxCycles bounds the micro-steps and
+    # the return value counts the steps that left the CPU running. Traces end
+    # on instruction boundaries, so untilInstructionCount stops exactly there.
+    cache = cpu.traceCache
+    controlWords = cpu.controlWords
+    regs = cpu.registers.values
+    ram = cpu.memory.ram
+    rom = cpu.memory.rom
+    alu = cpu.alu
+
+    cpu.running = True
+    executed = 0
+
+    while cpu.running and not cpu.halted and executed < maxCycles:
+        if untilInstructionCount is not None and cpu.instructionCount >= untilInstructionCount:
+            break
+        if cpu.sequenceCounter != 0:
+            # Resuming mid-sequence, e.g. after a guard left a trace early
+            if not cpu.step():
+                break
+            executed += 1
+            continue
+
+        key = (cpu.instructionRegister, cpu.alu.flagBits, cpu.flagSelectCode, cpu.currentInstructionStarted)
+        trace = cache.get(key)
+        if trace is not None and trace.cycleCount <= maxCycles - executed:
+            cycles = trace.function(cpu, regs, ram, rom, alu)
+            executed += cycles - 1 if cpu.halted else cycles
+            continue
+        if trace is not None:
+            if not cpu.step():
+                break
+            executed += 1
+            continue
+
+        # First visit: step through the sequence, recording its addresses
+        started = cpu.currentInstructionStarted
+        addresses = []
+        while executed < maxCycles:
+            addresses.append(cpu._get_microcode_address())
+            word = controlWords[addresses[-1]]
+            if not cpu.step():
+                break
+            executed += 1
+            if word & CW_SQR or cpu.sequenceCounter == 0:
+                break
+        if cpu.halted or word & CW_SQR or cpu.sequenceCounter == 0:
+            cache[key] = compileTrace(addresses, controlWords, started)
+
+    cpu.running = False
+    return executed
@@ -0,0 +1,189 @@
+from array import array
+
+from .decoder import InstructionDecoder
+from .memory import Memory
+from .microcode_cycles import loadMicrocodeCycles
+
+
+# What record() does beyond counting, by opcode byte
+PLAIN, BRANCH, CALL, RETURN, PUSH, POP, RESET = range(7)
+
+INSTRUCTION_KINDS = {
+    'JMP': BRANCH, 'JMZ': BRANCH, 'JNZ': BRANCH, 'JMC': BRANCH, 'JME': BRANCH, 'JMG': BRANCH, 'JML': BRANCH,
+    'CALL': CALL, 'RTN': RETURN, 'PUSH': PUSH, 'PSHV': PUSH, 'POP': POP, 'RST': RESET,
+}
+RETURN_ADDRESS_BYTES = 2
+
+
+class Profiler:
+    # Per-PC and per-opcode execution counters for either CPU. Every
+    # counter is a preallocated array, so record() is a handful of index
+    # updates. Micro-cycles are what the CPU measured or, for SoftwareCPU,
+    # the length of the instruction's sequence in the compiled microcode
+    # (a branch with the flag input set when taken); one per instruction if
+    # the microcode has not been generated. Cycles are also kept per chain
+    # of CALL targets for collapsed-stack (flamegraph) export.
+    def __init__(self, romSize = None, microcodeDir = None, configPath = None, decoder = None):
+        self.romSize = romSize or Memory().ROM_SIZE
+        decoder = decoder or InstructionDecoder()
+        decoded = [decoder.decode(opcodeByte) for opcodeByte in range(256)]
+        self.mnemonics = tuple(instruction.mnemonic for instruction in decoded)
+        self.sizes = bytes(instruction.size for instruction in decoded)
+        self.kinds = bytes(INSTRUCTION_KINDS.get(instruction.mnemonic, PLAIN) for instruction in decoded)
+
+        microcodeCycles = loadMicrocodeCycles(microcodeDir, configPath)
+        self.cycleSource = 'instruction' if microcodeCycles is None else 'microcode'
+        if microcodeCycles is None:
+            microcodeCycles = ((1, 1),) * 256
+        self.cyclesNotTaken = bytes(cycles[0] for cycles in microcodeCycles)
+        self.cyclesTaken = bytes(cycles[1] for cycles in microcodeCycles)
+
+        self.pcOpcodes      = bytearray(self.romSize)   # ROM does not change, so one byte per PC
+        self.pcCounts       = array('Q', bytes(8 * self.romSize))
+        self.pcCycles       = array('Q', bytes(8 * self.romSize))
+        self.branchTaken    = array('Q', bytes(8 * self.romSize))
+        self.branchNotTaken = array('Q', bytes(8 * self.romSize))
+        self.opcodeCounts   = array('Q', bytes(8 * 256))
+        self.opcodeCycles   = array('Q', bytes(8 * 256))
+        self.reset()
+
+
+    def reset(self):
+        self.pcOpcodes[:] = bytes(self.romSize)
+        for counters in (self.pcCounts, self.pcCycles, self.branchTaken, self.branchNotTaken,
+                         self.opcodeCounts, self.opcodeCycles):
+            counters[:] = array('Q', bytes(8 * len(counters)))
+        self.instructions = 0
+        self.cycles = 0
+        self.pushes = 0             # Bytes pushed, return addresses included
+        self.pops = 0
+        self.callStack = ()         # Targets of the CALLs not yet returned from
+        self.stackCycles = {}       # callStack -> cycles spent with it current, up to callStackSince
+        self.callStackSince = 0     # self.cycles when callStack last changed
+
+
+    def record(self, pc, opcodeByte, nextPc, cycles = None):
+        # One retired instruction: where it was, its opcode byte, where
+        # control went next and, if the CPU measured it, how long it took
+        kind = self.kinds[opcodeByte]
+        taken = kind == BRANCH and nextPc != pc + self.sizes[opcodeByte]
+        if cycles is None:
+            cycles = self.cyclesTaken[opcodeByte] if taken else self.cyclesNotTaken[opcodeByte]
+
+        pc %= self.romSize
+        self.pcOpcodes[pc] = opcodeByte
+        self.pcCounts[pc] += 1
+        self.pcCycles[pc] += cycles
+        self.opcodeCounts[opcodeByte] += 1
+        self.opcodeCycles[opcodeByte] += cycles
+        self.instructions += 1
+        self.cycles += cycles
+
+        if kind == PLAIN:
+            return
+        if kind == BRANCH:
+            if taken:
+                self.branchTaken[pc] += 1
+            else:
+                self.branchNotTaken[pc] += 1
+        elif kind == PUSH:
+            self.pushes += 1
+        elif kind == POP:
+            self.pops += 1
+        elif kind == CALL:
+            self.pushes += RETURN_ADDRESS_BYTES
+            self.enterCallStack(self.callStack + (nextPc,))
+        elif kind == RETURN:
+            self.pops += RETURN_ADDRESS_BYTES
+            self.enterCallStack(self.callStack[:-1])
+        else:
+            self.enterCallStack(())
+
+
+    def enterCallStack(self, callStack):
+        # The instruction that changes the stack is counted in the caller
+        self.stackCycles[self.callStack] = self.stackCycles.get(self.callStack, 0) + self.cycles - self.callStackSince
+        self.callStack = callStack
+        self.callStackSince = self.cycles
+
+
+    def frameName(self, address, names):
+        return names.get(address) or f"0x{address:04X}"
+
+
+    def flatProfile(self, names = None):
+        # One row per executed PC, most cycles first
+        names = names or {}
+        rows = []
+        for pc in range(self.romSize):
+            count = self.pcCounts[pc]
+            if not count:
+                continue
+            rows.append({
+                'pc'       : pc,
+                'name'     : names.get(pc),
+                'mnemonic' : self.mnemonics[self.pcOpcodes[pc]],
+                'count'    : count,
+                'cycles'   : self.pcCycles[pc],
+                'taken'    : self.branchTaken[pc],
+                'notTaken' : self.branchNotTaken[pc],
+            })
+        rows.sort(key=lambda row: (-row['cycles'], row['pc']))
+        return rows
+
+
+    def opcodeProfile(self):
+        rows = [{'opcode': opcodeByte, 'mnemonic': self.mnemonics[opcodeByte],
+                 'count': self.opcodeCounts[opcodeByte], 'cycles': self.opcodeCycles[opcodeByte]}
+                for opcodeByte in range(256) if self.opcodeCounts[opcodeByte]]
+        rows.sort(key=lambda row: (-row['cycles'], row['opcode']))
+        return rows
+
+
+    def collapsedStacks(self, names = None, entry = 0):
+        # "frame;frame;frame cycles" lines, as flamegraph.pl and speedscope read
+        names = names or {}
+        root = self.frameName(entry, names)
+        stackCycles = dict(self.stackCycles)
+        stackCycles[self.callStack] = stackCycles.get(self.callStack, 0) + self.cycles - self.callStackSince
+        lines = []
+        for stack, cycles in sorted(stackCycles.items()):
+            if not cycles:
+                continue
+            frames = [root] + [self.frameName(address, names) for address in stack]
+            lines.append(f"{';'.join(frames)} {cycles}")
+        return lines
+
+
+    def summary(self):
+        return {
+            'instructions'     : self.instructions,
+            'cycles'           : self.cycles,
+            'cycleSource'      : self.cycleSource,
+            'branchesTaken'    : sum(self.branchTaken),
+            'branchesNotTaken' : sum(self.branchNotTaken),
+            'pushes'           : self.pushes,
+            'pops'             : self.pops,
+        }
+
+
+    def formatFlatProfile(self, names = None, limit = 20):
+        summary = self.summary()
+        total = summary['cycles'] or 1
+        lines = [
+            f"Flat profile: {summary['instructions']} instructions, {summary['cycles']} cycles ({summary['cycleSource']})",
+            f"Branches: {summary['branchesTaken']} taken, {summary['branchesNotTaken']} not taken; "
+            f"stack: {summary['pushes']} bytes pushed, {summary['pops']} popped",
+            "",
+            f"{'PC':>6}  {'Tag':<12} {'Instr':<5} {'Count':>10} {'Cycles':>12} {'%':>6} {'Taken':>9} {'Not taken':>9}",
+        ]
+        for row in self.flatProfile(names)[:limit]:
+            branch = (f"{row['taken']:>9} {row['notTaken']:>9}"
+                      if self.kinds[self.pcOpcodes[row['pc']]] == BRANCH else "")
+            lines.append(f"0x{row['pc']:04X}  {row['name'] or '':<12} {row['mnemonic']:<5} {row['count']:>10} "
+                         f"{row['cycles']:>12} {100 * row['cycles'] / total:>6.2f} {branch}".rstrip())
+        lines += ["", f"{'Instr':<5} {'Opcode':>6} {'Count':>10} {'Cycles':>12} {'%':>6}"]
+        for row in self.opcodeProfile()[:limit]:
+            lines.append(f"{row['mnemonic']:<5}   0x{row['opcode']:02X} {row['count']:>10} {row['cycles']:>12} "
+                         f"{100 * row['cycles'] / total:>6.2f}")
+        return "\n".join(lines)
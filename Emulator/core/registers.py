@@ -1,42 +1,45 @@
+REGISTER_NAMES = ('A', 'B', 'C', 'D')  # Indexed by the 2-bit register code
+REGISTER_INDEX = {name: index for index, name in enumerate(REGISTER_NAMES)}
+
+
 class RegisterFile:
+    __slots__ = ('values',)
+
     def __init__(self):
-        self.reset()
+        self.values = bytearray(4)
 
 
     def reset(self):
-        self.registers = {
-            'A': 0,  # 0b00
-            'B': 0,  # 0b01
-            'C': 0,  # 0b10
-            'D': 0   # 0b11
-        }
+        # Clear in place so anything holding self.values stays bound to it
+        self.values[:] = bytes(4)
 
 
     def read(self, regCode):
-        regMap = {0b00: 'A', 0b01: 'B', 0b10: 'C', 0b11: 'D'}
-        if regCode in regMap:
-            return self.registers[regMap[regCode]]
+        if 0 <= regCode <= 3:
+            return self.values[regCode]
         return 0
 
 
     def write(self, regCode, value):
-        regMap = {0b00: 'A', 0b01: 'B', 0b10: 'C', 0b11: 'D'}
-        if regCode in regMap:
-            self.registers[regMap[regCode]] = value & 0xFF  # Ensure 8-bit
+        if 0 <= regCode <= 3:
+            self.values[regCode] = value & 0xFF  # Ensure 8-bit
 
 
     def readByName(self, regName):
-        return self.registers.get(regName.upper(), 0)
+        index = REGISTER_INDEX.get(regName.upper())
+        return self.values[index] if index is not None else 0
 
 
     def writeByName(self, regName, value):
-        if regName.upper() in self.registers:
-            self.registers[regName.upper()] = value & 0xFF
+        index = REGISTER_INDEX.get(regName.upper())
+        if index is not None:
+            self.values[index] = value & 0xFF
 
 
     def getAllRegisters(self):
-        return self.registers.copy()
+        return dict(zip(REGISTER_NAMES, self.values))
 
 
     def __str__(self):
-        return f"A:{self.registers['A']:02X} B:{self.registers['B']:02X} C:{self.registers['C']:02X} D:{self.registers['D']:02X}"
+        a, b, c, d = self.values
+        return f"A:{a:02X} B:{b:02X} C:{c:02X} D:{d:02X}"
@@ -1,15 +1,25 @@
 from .decoder   import InstructionDecoder
 from .registers import RegisterFile
 from .memory    import Memory
-from .alu       import ALU
+from .alu       import ALU, FLAG_ZERO, FLAG_CARRY, FLAG_NEGATIVE
+from .alu_tables import TableALU
+from .dispatch  import runThreaded
+from .block_compiler import runBlocks
+from .profiler  import Profiler
+from .trace     import TraceBuffer, DEFAULT_CAPACITY
 
 
 class SoftwareCPU:
-    def __init__(self, enable_execution_logging=False, log_callback=None):
+    # 'interpreter' decodes and executes one step() at a time; 'threaded'
+    # runs through per-opcode handlers bound once per run() call; 'block'
+    # compiles each basic block to a Python function on first visit.
+    ENGINES = ('interpreter', 'threaded', 'block')
+
+    def __init__(self, enable_execution_logging=False, log_callback=None, engine='interpreter', useAluTables=False):
         # Initialize components
         self.registers = RegisterFile()
         self.memory = Memory()
-        self.alu = ALU()
+        self.alu = TableALU() if useAluTables else ALU()
         self.decoder = InstructionDecoder()
 
         # CPU state
@@ -28,6 +38,10 @@ class SoftwareCPU:
         self.cycleCount = 0
         self.enableExecutionLogging = enable_execution_logging
         self.logCallback = log_callback if log_callback is not None else print
+        self.blockCache = {}  # Start PC -> CompiledBlock, see block_compiler
+        self.profiler = None
+        self.trace = None     # TraceBuffer written by every step, see enableTrace
+        self.setEngine(engine)
 
 
     def reset(self):
@@ -44,6 +58,7 @@ class SoftwareCPU:
         self.outputEnabled = False
         self.instructionCount = 0
         self.cycleCount = 0
+        self.blockCache.clear()
 
 
     def loadProgram(self, binaryData, startAddress = 0):
@@ -82,7 +97,12 @@ class SoftwareCPU:
         # Update counters
         if success:
             self.instructionCount += 1
-            self.cycleCount += 1  # Simplified - each instruction = 1 cycle
+            self.cycleCount += 1  # Simplified - each instruction = 1 cycle, see profiler for microcode cycles
+            if self.profiler is not None:
+                self.profiler.record(pcBefore, instruction, self.programCounter)
+            if self.trace is not None:
+                self.trace.write(pcBefore, self.registers.values, instruction, self.alu.flagBits,
+                                 self.memory.stackPointer, self.sevenSegmentValue)
 
         return success
 
@@ -330,22 +350,24 @@ class SoftwareCPU:
         targetAddress = operands.get('address', self._getJumpAddress())
 
         shouldJump = False
-        flags = self.alu.getFlags()
+        flagBits = self.alu.flagBits
+        zero     = flagBits & FLAG_ZERO
+        negative = flagBits & FLAG_NEGATIVE
 
         if opcode == 'JMP':
             shouldJump = True
         elif opcode == 'JMZ':
-            shouldJump = flags['zero']
+            shouldJump = zero
         elif opcode == 'JNZ':
-            shouldJump = not flags['zero']
+            shouldJump = not zero
         elif opcode == 'JMC':
-            shouldJump = flags['carry']
+            shouldJump = flagBits & FLAG_CARRY
         elif opcode == 'JME':
-            shouldJump = flags['zero']  # Equal means zero flag set
+            shouldJump = zero  # Equal means zero flag set
         elif opcode == 'JMG':  # Jump Greater
-            shouldJump = not flags['zero'] and not flags['negative']
+            shouldJump = not zero and not negative
         elif opcode == 'JML':  # Jump Less
-            shouldJump = flags['negative'] and not flags['zero']
+            shouldJump = negative and not zero
 
         if shouldJump:
             self.programCounter = targetAddress
@@ -387,6 +409,13 @@ class SoftwareCPU:
 
 
     def run(self, maxInstructions = 10000):
+        # Per-instruction logging, profiling and tracing need the interpreter's decode step
+        stepping = self.enableExecutionLogging or self.profiler is not None or self.trace is not None
+        if self.engine == 'threaded' and not stepping:
+            return runThreaded(self, maxInstructions)
+        if self.engine == 'block' and not stepping:
+            return runBlocks(self, maxInstructions)
+
         self.running = True
         executed = 0
 
@@ -426,6 +455,30 @@ class SoftwareCPU:
     def setExecutionLogging(self, enabled):
         self.enableExecutionLogging = bool(enabled)
 
+    def enableProfiling(self, profiler = None):
+        self.profiler = profiler or Profiler(romSize=self.memory.ROM_SIZE, decoder=self.decoder)
+        return self.profiler
+
+    def disableProfiling(self):
+        self.profiler = None
+
+    def enableTrace(self, capacity = DEFAULT_CAPACITY, stream = None):
+        self.disableTrace()
+        self.trace = TraceBuffer(capacity, stream)
+        return self.trace
+
+    def disableTrace(self):
+        # Flushes a streamed trace; returns the buffer for reading
+        trace, self.trace = self.trace, None
+        if trace is not None:
+            trace.close()
+        return trace
+
+    def setEngine(self, engine):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine '{engine}'; expected one of {', '.join(self.ENGINES)}")
+        self.engine = engine
+
 
     def __str__(self):
         state = self.getState()
@@ -0,0 +1,148 @@
+import mmap
+import struct
+
+from .decoder import InstructionDecoder
+from .registers import REGISTER_NAMES
+from .alu import FLAG_ZERO, FLAG_CARRY, FLAG_NEGATIVE
+
+
+# One retired instruction: its index in the run, PC, registers A-D, IR,
+# ALU flag bits, stack pointer and 7-segment value, all after it executed
+RECORD = struct.Struct('<IH4sBBBBxx')
+HEADER = struct.Struct('<4sHH')
+TRACE_MAGIC = b'8BTR'
+TRACE_VERSION = 1
+DEFAULT_CAPACITY = 4096
+
+
+class TraceRecord:
+    __slots__ = ('index', 'pc', 'registers', 'ir', 'flagBits', 'stackPointer', 'sevenSegment')
+
+    def __init__(self, index, pc, registers, ir, flagBits, stackPointer, sevenSegment):
+        self.index = index
+        self.pc = pc
+        self.registers = registers
+        self.ir = ir
+        self.flagBits = flagBits
+        self.stackPointer = stackPointer
+        self.sevenSegment = sevenSegment
+
+
+def formatRecord(record, decoder):
+    instruction = decoder.decode(record.ir)
+    operands = instruction.operands
+    text = instruction.mnemonic
+    if 'destinationRegister' in operands:
+        text += f" {REGISTER_NAMES[operands['destinationRegister']]} {REGISTER_NAMES[operands['sourceRegister']]}"
+    elif 'register' in operands:
+        text += f" {REGISTER_NAMES[operands['register']]}"
+    registers = " ".join(f"{name}={value:02X}" for name, value in zip(REGISTER_NAMES, record.registers))
+    flags = ("Z" if record.flagBits & FLAG_ZERO else "-") + ("C" if record.flagBits & FLAG_CARRY else "-") \
+        + ("N" if record.flagBits & FLAG_NEGATIVE else "-")
+    return (f"#{record.index:<8} {record.pc:04X}: {record.ir:02X} {text:<10} {registers} {flags} "
+            f"SP={record.stackPointer:X} OUT={record.sevenSegment:02X}")
+
+
+class TraceBuffer:
+    # Fixed-size ring of packed records. write() is one pack_into into a
+    # preallocated bytearray; nothing is decoded or formatted until the
+    # trace is read. With a stream, every full ring is written out before
+    # it is reused, so the stream gets the whole run, in order, as a trace
+    # file TraceFile can map.
+    def __init__(self, capacity = DEFAULT_CAPACITY, stream = None):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.count = 0
+        self.stream = stream
+        if stream is not None:
+            stream.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, RECORD.size))
+
+
+    def write(self, pc, registers, ir, flagBits, stackPointer, sevenSegment):
+        slot = self.count % self.capacity
+        RECORD.pack_into(self.buffer, slot * RECORD.size, self.count & 0xFFFFFFFF, pc, registers, ir,
+                         flagBits, stackPointer, sevenSegment)
+        self.count += 1
+        if slot == self.capacity - 1 and self.stream is not None:
+            self.stream.write(self.buffer)
+
+
+    def close(self):
+        # Writes the records of the last, partly filled ring
+        if self.stream is not None:
+            pending = self.count % self.capacity
+            self.stream.write(memoryview(self.buffer)[:pending * RECORD.size])
+            self.stream.flush()
+            self.stream = None
+
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+
+    def records(self, last = None):
+        # The most recent records, oldest first
+        available = len(self)
+        last = available if last is None else min(last, available)
+        for index in range(self.count - last, self.count):
+            yield TraceRecord(*RECORD.unpack_from(self.buffer, (index % self.capacity) * RECORD.size))
+
+
+    def format(self, last = None, decoder = None):
+        decoder = decoder or InstructionDecoder()
+        return "\n".join(formatRecord(record, decoder) for record in self.records(last))
+
+
+class TraceFile:
+    # Read side of a streamed trace, memory-mapped so a long run can be
+    # searched without loading it
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, recordSize = HEADER.unpack_from(self.map, 0)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION or recordSize != RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} execution trace")
+        self.records = memoryview(self.map)[HEADER.size:]
+
+
+    def __len__(self):
+        return len(self.records) // RECORD.size
+
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("trace record index out of range")
+        return TraceRecord(*RECORD.unpack_from(self.records, index * RECORD.size))
+
+
+    def find(self, pc = None, ir = None, start = 0, stop = None):
+        # Positions of the records with the given PC and/or IR
+        stop = len(self) if stop is None else min(stop, len(self))
+        view = self.records[start * RECORD.size:stop * RECORD.size]
+        return [start + position for position, (_, recordPc, _, recordIr, _, _, _) in enumerate(RECORD.iter_unpack(view))
+                if (pc is None or recordPc == pc) and (ir is None or recordIr == ir)]
+
+
+    def format(self, start = 0, stop = None, decoder = None):
+        decoder = decoder or InstructionDecoder()
+        stop = len(self) if stop is None else min(stop, len(self))
+        return "\n".join(formatRecord(self[index], decoder) for index in range(start, stop))
+
+
+    def close(self):
+        if getattr(self, 'records', None) is not None:
+            self.records.release()
+            self.records = None
+        self.map.close()
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
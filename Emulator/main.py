@@ -9,16 +9,21 @@ Examples:
     python main.py                    # Start GUI without program (signed mode default)
     python main.py program.bin        # Start GUI, load program (signed mode default)
     python main.py program.bin -u     # Start GUI, load program (unsigned mode)
+    python main.py -b programs/ -j 8  # Run every .bin headless, one JSON line per program
+    python main.py program.bin -V     # Check SoftwareCPU against HardwareCPU instruction by instruction
+    python main.py program.bin -a     # Static cycle, stack and ROM budget report without running it
+    python main.py program.bin -ng -p # Run headless and print a per-PC/per-opcode profile
+    python main.py program.bin -ng --trace run.trace  # Record every instruction to a binary trace file
 """
 
 import sys
 import os
 import argparse
+import json
 
 # Add current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from gui.main_window import EmulatorMainWindow
 from utils.loader import autoLoadProgram
 
 def main():
@@ -29,12 +34,113 @@ def main():
     parser.add_argument("-u",  "--unsigned", action = "store_true", help = "Start in unsigned mode (0 to 255)")
     parser.add_argument("-m",  "--mode", choices=["software", "hardware"], default="software",
                         help = "Emulator mode: software or hardware")
+    parser.add_argument("-e",  "--engine", choices=["interpreter", "threaded", "block"], default="interpreter",
+                        help = "Software mode execution engine (command line only)")
+    parser.add_argument("-t",  "--alu-tables", action = "store_true",
+                        help = "Use precomputed ALU lookup tables (cached in Microcode/out)")
+    parser.add_argument("-b",  "--batch", metavar = "PATH",
+                        help = "Run a directory of .bin files or a manifest headless and emit JSON lines")
+    parser.add_argument("-j",  "--jobs", type = int, default = None,
+                        help = "Batch worker processes (default: CPU count)")
+    parser.add_argument("-o",  "--output", metavar = "FILE", help = "Batch results file (default: stdout), or the analyze report as JSON")
+    parser.add_argument("--max-instructions", type = int, default = 10000,
+                        help = "Instruction budget per program in batch mode")
+    parser.add_argument("--max-cycles", type = int, default = None,
+                        help = "Cycle budget per program in batch mode (micro-cycles in hardware mode)")
+    parser.add_argument("-V",  "--verify", action = "store_true",
+                        help = "Run SoftwareCPU and HardwareCPU side by side and report the first divergence")
+    parser.add_argument("--verify-every", type = int, default = 1, metavar = "N",
+                        help = "Only compare every N instructions and at HLT (replays to locate a divergence)")
+    parser.add_argument("-p",  "--profile", action = "store_true",
+                        help = "Print a flat per-PC and per-opcode profile after a command line run")
+    parser.add_argument("--flamegraph", metavar = "FILE",
+                        help = "Write cycles per CALL stack in collapsed-stack format after a command line run")
+    parser.add_argument("--trace", metavar = "FILE",
+                        help = "Stream a binary record of every instruction to FILE during a command line run")
+    parser.add_argument("--trace-last", type = int, default = 0, metavar = "N",
+                        help = "Print the last N instructions with their registers after a command line run")
+    parser.add_argument("-a",  "--analyze", action = "store_true",
+                        help = "Report worst-case cycles, loop bounds, stack depth and ROM use without running")
 
     args = parser.parse_args()
 
     # Default to signed mode (matching assembler default), use unsigned only if specified
     initialSignedMode = not args.unsigned
 
+    if args.batch:
+        from utils.batch import collectPrograms, runBatch
+
+        try:
+            programs = collectPrograms(args.batch)
+            results = runBatch(programs, jobs=args.jobs, mode=args.mode, engine=args.engine,
+                               useAluTables=args.alu_tables, signedMode=initialSignedMode,
+                               maxInstructions=args.max_instructions, maxCycles=args.max_cycles,
+                               verifyEvery=args.verify_every if args.verify else None)
+        except Exception as e:
+            print(f"Error in batch mode: {e}", file=sys.stderr)
+            if args.debug:
+                import traceback
+                traceback.print_exc()
+            return 1
+
+        output = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            for result in results:
+                output.write(json.dumps(result) + "\n")
+        finally:
+            if args.output:
+                output.close()
+        return 1 if any(result['error'] or result.get('matched') is False for result in results) else 0
+
+    if args.analyze:
+        if not args.program or not os.path.exists(args.program):
+            print("Error: Program file is required for analyze mode")
+            return 1
+
+        try:
+            from utils.analyzer import StaticAnalyzer, formatAnalysis
+
+            result = StaticAnalyzer().analyze(autoLoadProgram(args.program)['binaryData'])
+            if args.output:
+                with open(args.output, 'w') as output:
+                    json.dump(result, output, indent=2)
+            print(formatAnalysis(result))
+            return 0 if result['rom']['fits'] and result['stack']['fits'] else 1
+
+        except Exception as e:
+            print(f"Error in analyze mode: {e}")
+            if args.debug:
+                import traceback
+                traceback.print_exc()
+            return 1
+
+    if args.verify:
+        if not args.program or not os.path.exists(args.program):
+            print("Error: Program file is required for verify mode")
+            return 1
+
+        try:
+            from core.software_cpu import SoftwareCPU
+            from core.hardware_cpu import HardwareCPU
+            from utils.differential import DifferentialRunner, formatDivergence
+
+            runner = DifferentialRunner(SoftwareCPU(engine=args.engine, useAluTables=args.alu_tables),
+                                        HardwareCPU(enable_signal_logging=False, useAluTables=args.alu_tables))
+            runner.software.setSignedMode(initialSignedMode)
+            runner.hardware.setSignedMode(initialSignedMode)
+            runner.loadProgram(autoLoadProgram(args.program)['binaryData'])
+            result = runner.run(args.max_instructions, args.verify_every)
+
+            print(formatDivergence(result))
+            return 0 if result['matched'] else 1
+
+        except Exception as e:
+            print(f"Error in verify mode: {e}")
+            if args.debug:
+                import traceback
+                traceback.print_exc()
+            return 1
+
     if args.no_gui:
         # Simple command line mode
         if not args.program or not os.path.exists(args.program):
@@ -44,21 +150,41 @@ def main():
         try:
             if args.mode == 'hardware':
                 from core.hardware_cpu import HardwareCPU
-                cpu = HardwareCPU(enable_signal_logging=True)
+                cpu = HardwareCPU(enable_signal_logging=True, useAluTables=args.alu_tables)
             else:
                 from core.software_cpu import SoftwareCPU
-                cpu = SoftwareCPU()
+                cpu = SoftwareCPU(engine=args.engine, useAluTables=args.alu_tables)
 
             cpu.setSignedMode(initialSignedMode)
             programData = autoLoadProgram(args.program)
             cpu.loadProgram(programData['binaryData'])
-            executed = cpu.run()
+            profiler = cpu.enableProfiling() if args.profile or args.flamegraph else None
+            traceFile = open(args.trace, 'wb') if args.trace else None
+            if traceFile or args.trace_last:
+                cpu.enableTrace(max(args.trace_last, 1024), traceFile)
+            try:
+                executed = cpu.run()
+            finally:
+                trace = cpu.disableTrace()
+                if traceFile:
+                    traceFile.close()
 
             print(f"Loaded program: {args.program}")
             print(f"Mode: {'Signed (-128 to +127)' if initialSignedMode else 'Unsigned (0 to 255)'}")
             print(f"Execution mode: {args.mode}")
+            if args.mode == 'software':
+                print(f"Engine: {args.engine}")
             print(f"Executed {executed} instruction cycles")
             print(f"Program halted: {cpu.halted}")
+            if args.profile:
+                print()
+                print(profiler.formatFlatProfile())
+            if args.flamegraph:
+                with open(args.flamegraph, 'w') as output:
+                    output.write("\n".join(profiler.collapsedStacks()) + "\n")
+            if args.trace_last:
+                print()
+                print(trace.format(args.trace_last, cpu.decoder))
             return 0
 
         except Exception as e:
@@ -70,6 +196,7 @@ def main():
 
     try:
         # Create and start GUI
+        from gui.main_window import EmulatorMainWindow
         app = EmulatorMainWindow(mode=args.mode)
 
         # Set initial display mode
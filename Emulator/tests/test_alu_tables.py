@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.alu import ALU
+from core.alu_tables import TABLE_CACHE_MAGIC, TableALU, buildAluTables, loadAluTables, saveAluTables
+
+
+def test_table_alu_matches_alu():
+    alu, tableAlu = ALU(), TableALU(buildAluTables())
+    for a in range(0, 256, 7):
+        for b in range(256):
+            for carryIn in (0, 1):
+                assert tableAlu.add(a, b, carryIn) == alu.add(a, b, carryIn)
+                assert tableAlu.flagBits == alu.flagBits
+                assert tableAlu.subtract(a, b, carryIn) == alu.subtract(a, b, carryIn)
+                assert tableAlu.flagBits == alu.flagBits
+            for operation in ('logicalAnd', 'logicalOr', 'logicalXor'):
+                assert getattr(tableAlu, operation)(a, b) == getattr(alu, operation)(a, b)
+                assert tableAlu.flagBits == alu.flagBits
+    for value in range(256):
+        for operation in ('shiftLeft', 'shiftRight', 'logicalNot'):
+            assert getattr(tableAlu, operation)(value) == getattr(alu, operation)(value)
+            assert tableAlu.flagBits == alu.flagBits
+
+
+def test_cache_round_trip(tmp_path):
+    path = str(tmp_path / 'aluTables.bin')
+    tables = buildAluTables()
+    saveAluTables(tables, path)
+    assert loadAluTables(path) == tables
+
+
+def test_cache_from_another_format_is_rejected(tmp_path):
+    path = str(tmp_path / 'aluTables.bin')
+    saveAluTables(buildAluTables(), path)
+    with open(path, 'r+b') as f:
+        f.write(b'C8ALU\x02' + bytes(len(TABLE_CACHE_MAGIC) - 6))  # Same size, other format hash
+    assert loadAluTables(path) is None
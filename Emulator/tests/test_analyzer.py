@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.analyzer import StaticAnalyzer
+
+
+def test_loop_counter_written_by_a_callee_has_no_bound():
+    #     LDI B, 5
+    #     CALL F
+    # L:  DEC B
+    #     JNZ L
+    #     HLT
+    # F:  LDI B, 100
+    #     RTN
+    program = bytes.fromhex("4c051f000a7b2e00055f4c642f")
+    result = StaticAnalyzer().analyze(program)
+    assert result['loops'][0]['bound'] is None
+    assert result['worstCycles'] is None
+
+
+def test_rom_size_counts_a_trailing_ff_operand():
+    #     LDI B, 255
+    program = bytes.fromhex("4cff")
+    result = StaticAnalyzer().analyze(program)
+    assert result['rom']['used'] == 2
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.software_cpu import SoftwareCPU
+from utils.batch import BatchJob, runJob
+
+
+@pytest.mark.parametrize('engine', SoftwareCPU.ENGINES)
+def test_reset_program_uses_up_its_budget(tmp_path, engine):
+    # RST (0xFF) zeroes the CPU's counters; an erased image is nothing but RST
+    program = tmp_path / 'erased.bin'
+    program.write_bytes(b'\xff\xff')
+
+    result = runJob(BatchJob(str(program), engine=engine, maxInstructions=500))
+
+    assert result['error'] is None
+    assert result['instructions'] == 500
+    assert result['cycles'] == 500
+
+
+def test_reset_program_stops_at_cycle_budget(tmp_path):
+    program = tmp_path / 'erased.bin'
+    program.write_bytes(b'\xff\xff')
+
+    result = runJob(BatchJob(str(program), maxInstructions=10000, maxCycles=300))
+
+    assert result['error'] is None
+    assert result['cycles'] == 300
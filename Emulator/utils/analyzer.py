@@ -0,0 +1,490 @@
+from core.decoder import InstructionDecoder
+from core.memory import Memory
+from core.microcode_cycles import loadMicrocodeCycles
+from .helpers import instructionCycles
+
+
+DEFAULT_HOT_BLOCKS = 5
+MAX_LOOP_ITERATIONS = 256   # An 8-bit counter that has not exited by then never will
+
+CONDITIONAL_JUMPS = ('JMZ', 'JNZ', 'JMC', 'JME', 'JMG', 'JML')
+BLOCK_ENDS        = CONDITIONAL_JUMPS + ('JMP', 'CALL', 'RTN', 'HLT', 'RST')
+NO_FALLTHROUGH    = ('JMP', 'RTN', 'HLT', 'RST')
+FLAG_SETTERS      = ('ADD', 'SUB', 'AND', 'OR', 'XOR', 'CMP', 'CMPS', 'CMI', 'CMIS', 'INC', 'DEC', 'SHL', 'SHR', 'NOT')
+REGISTER_WRITERS  = ('INC', 'DEC', 'SHL', 'SHR', 'NOT', 'LDI', 'LDM', 'POP')
+DESTINATION_WRITERS = ('ADD', 'SUB', 'MOV', 'AND', 'OR', 'XOR', 'LDR')
+STACK_EFFECT      = {'PUSH': 1, 'PSHV': 1, 'POP': -1}
+RETURN_ADDRESS_BYTES = 2
+
+
+class BasicBlock:
+    __slots__ = ('start', 'end', 'instructions', 'cycles', 'successors', 'call', 'escapes')
+
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.instructions = []  # (pc, mnemonic, operands, size)
+        self.cycles = 0
+        self.successors = []
+        self.call = None        # Target of the CALL ending the block
+        self.escapes = False    # Control leaves the program image or restarts it
+
+
+    @property
+    def last(self):
+        return self.instructions[-1][1]
+
+
+class StaticAnalyzer:
+    # Builds the control-flow graph of a ROM image from the decoder and
+    # bounds it without running it: worst-case cycles per routine (entry
+    # and every CALL target), loop trip counts where an LDI-initialised
+    # INC/DEC counter decides the back edge, stack high-water marks against
+    # the RAM and the blocks that cost the most. Cycles come from the
+    # compiled microcode, or the emulator's cycle table if it is not built.
+    def __init__(self, microcodeDir = None, configPath = None, decoder = None):
+        self.decoder = decoder or InstructionDecoder()
+        self.microcodeCycles = loadMicrocodeCycles(microcodeDir, configPath)
+        memory = Memory()
+        self.romSize = memory.ROM_SIZE
+        self.ramSize = memory.RAM_SIZE
+
+
+    def instructionCost(self, opcodeByte, mnemonic):
+        if self.microcodeCycles is None:
+            return instructionCycles(mnemonic)
+        return max(self.microcodeCycles[opcodeByte])
+
+
+    def analyze(self, binaryData, entry = 0, hotBlocks = DEFAULT_HOT_BLOCKS):
+        self.binaryData = bytes(binaryData)
+        self.entry = entry
+        self.warnings = []
+        self.unknownReturns = set()
+        self.decodeReachable(entry)
+        self.buildBlocks()
+
+        self.routines = {}
+        self.routineCycles = {}
+        self.routineStack = {}
+        self.loops = []
+        self.blockExecutions = {}
+        routines = [start for start in [entry] + sorted(self.callTargets - {entry}) if start in self.blocks]
+        results = [self.analyzeRoutine(start) for start in routines]
+
+        self.warnings += [f"RTN at 0x{self.blocks[node].instructions[-1][0]:04X} does not return to a CALL"
+                          for node in sorted(self.unknownReturns)]
+        codeBytes = sum(size for _, _, size in self.instructions.values())
+        programBytes = max((pc + size for pc, (_, _, size) in self.instructions.items()), default=0)
+        hot = sorted(self.blocks.values(), key=self.heat, reverse=True)[:hotBlocks]
+        stack = self.routineStack.get(entry, 0)
+
+        return {
+            'cycleSource'  : 'microcode' if self.microcodeCycles is not None else 'instructionCycles',
+            'rom'          : {'used': programBytes, 'reachableCode': codeBytes, 'limit': self.romSize,
+                              'free': self.romSize - programBytes, 'fits': programBytes <= self.romSize},
+            'stack'        : {'highWater': stack, 'limit': self.ramSize,
+                              'fits': stack is not None and stack <= self.ramSize},
+            'worstCycles'  : self.routineCycles.get(entry, 0),
+            'routines'     : results,
+            'loops'        : self.loops,
+            'hotBlocks'    : [{'start': block.start, 'end': block.end, 'cycles': block.cycles,
+                               'executions': self.blockExecutions.get(block.start)} for block in hot],
+            'blocks'       : len(self.blocks),
+            'warnings'     : self.warnings,
+        }
+
+
+    def decodeReachable(self, entry):
+        # pc -> (mnemonic, operands, size) for every instruction control can reach
+        decoded = {pc: (mnemonic, operands, len(rawBytes))
+                   for pc, mnemonic, operands, rawBytes in self.decoder.decodeProgram(self.binaryData)}
+        self.instructions = {}
+        self.leaders = {entry}
+        self.callTargets = set()
+        pending = [entry]
+
+        while pending:
+            pc = pending.pop()
+            while pc not in self.instructions:
+                if pc >= len(self.binaryData):
+                    self.warnings.append(f"Control runs past the end of the program at 0x{pc:04X}")
+                    break
+                if pc not in decoded:
+                    # Jump into the middle of an instruction of the linear decode
+                    decoded.update((address, (mnemonic, operands, len(rawBytes))) for address, mnemonic, operands, rawBytes
+                                   in self.decoder.decodeProgram(self.binaryData, pc) if address not in decoded)
+
+                mnemonic, operands, size = decoded[pc]
+                self.instructions[pc] = decoded[pc]
+                if mnemonic in BLOCK_ENDS:
+                    self.leaders.add(pc + size)
+                if mnemonic in CONDITIONAL_JUMPS + ('JMP', 'CALL'):
+                    target = operands.get('address')
+                    if target is None or target >= self.romSize:
+                        self.warnings.append(f"{mnemonic} at 0x{pc:04X} has no valid target")
+                    else:
+                        self.leaders.add(target)
+                        pending.append(target)
+                        if mnemonic == 'CALL':
+                            self.callTargets.add(target)
+                if mnemonic in NO_FALLTHROUGH:
+                    break
+                pc += size
+
+
+    def buildBlocks(self):
+        self.blocks = {}
+        block = None
+        for pc in sorted(self.instructions):
+            mnemonic, operands, size = self.instructions[pc]
+            if block is None or pc in self.leaders or pc != block.end:
+                block = self.blocks[pc] = BasicBlock(pc)
+            block.instructions.append((pc, mnemonic, operands, size))
+            block.cycles += self.instructionCost(self.binaryData[pc], mnemonic)
+            block.end = pc + size
+            if mnemonic in BLOCK_ENDS:
+                block = None
+
+        for block in self.blocks.values():
+            last, operands = block.last, block.instructions[-1][2]
+            if last in CONDITIONAL_JUMPS + ('JMP', 'CALL'):
+                if operands.get('address') not in self.blocks:
+                    block.escapes = True
+                elif last == 'CALL':
+                    block.call = operands['address']
+                else:
+                    block.successors.append(operands['address'])
+            if last == 'RST':
+                block.escapes = True
+            if last not in NO_FALLTHROUGH:
+                if block.end in self.blocks:
+                    block.successors.append(block.end)
+                else:
+                    block.escapes = True
+
+        self.predecessors = {start: [] for start in self.blocks}
+        for block in self.blocks.values():
+            for successor in block.successors:
+                self.predecessors[successor].append(block.start)
+
+
+    def routineBlocks(self, entry):
+        seen = [entry]
+        found = {entry}
+        for start in seen:
+            for successor in self.blocks[start].successors:
+                if successor not in found:
+                    found.add(successor)
+                    seen.append(successor)
+        return seen
+
+
+    def dominators(self, entry, nodes):
+        nodeSet = set(nodes)
+        dominators = {node: set(nodes) for node in nodes}
+        dominators[entry] = {entry}
+        changed = True
+        while changed:
+            changed = False
+            for node in nodes:
+                if node == entry:
+                    continue
+                predecessors = [dominators[p] for p in self.predecessors[node] if p in nodeSet]
+                new = set.intersection(*predecessors) | {node} if predecessors else {node}
+                if new != dominators[node]:
+                    dominators[node] = new
+                    changed = True
+        return dominators
+
+
+    def analyzeRoutine(self, entry):
+        if entry in self.routines:
+            return self.routines[entry]
+        self.routineCycles[entry] = None    # Until it is known; recursion is unbounded
+        nodes = self.routineBlocks(entry)
+        dominators = self.dominators(entry, nodes)
+
+        # Natural loops, one per header
+        loops = {}
+        for node in nodes:
+            for successor in self.blocks[node].successors:
+                if successor in dominators[node]:
+                    loop = loops.setdefault(successor, {'header': successor, 'latches': [], 'body': {successor}})
+                    loop['latches'].append(node)
+                    stack = [node]
+                    while stack:
+                        current = stack.pop()
+                        if current not in loop['body']:
+                            loop['body'].add(current)
+                            stack.extend(p for p in self.predecessors[current] if p in dominators)
+
+        backEdges = {(latch, header) for header, loop in loops.items() for latch in loop['latches']}
+        reducible = self.isAcyclic(nodes, backEdges)
+        if not reducible:
+            self.warnings.append(f"Routine 0x{entry:04X} has a loop with more than one entry; its cycles are unbounded")
+
+        for loop in sorted(loops.values(), key=lambda loop: len(loop['body'])):
+            loop['bound'] = self.loopBound(loop, dominators) if reducible else None
+            self.loops.append({'routine': entry, 'header': loop['header'], 'latches': sorted(loop['latches']),
+                               'blocks': sorted(loop['body']), 'bound': loop['bound']})
+
+        for node in nodes:
+            executions = 1
+            for loop in loops.values():
+                if node in loop['body']:
+                    executions = None if executions is None or loop['bound'] is None else executions * loop['bound']
+            previous = self.blockExecutions.get(node, 0)
+            self.blockExecutions[node] = None if executions is None or previous is None else max(previous, executions)
+
+        if entry not in self.routineStack:
+            self.routineStack[entry] = self.stackHighWater(entry)
+        if self.routineStack[entry] is None:
+            self.warnings.append(f"Routine 0x{entry:04X} can outgrow the {self.ramSize} byte RAM with its stack")
+        bounded = reducible and self.routineStack[entry] is not None
+        cycles = self.routineWorstCycles(entry, nodes, loops, backEdges) if bounded else None
+        self.routineCycles[entry] = cycles
+        self.routines[entry] = {'entry': entry, 'blocks': len(nodes), 'worstCycles': cycles,
+                                'stackHighWater': self.routineStack[entry]}
+        return self.routines[entry]
+
+
+    def isAcyclic(self, nodes, removedEdges):
+        nodeSet = set(nodes)
+        state = dict.fromkeys(nodes, 0)    # 0 new, 1 on the path, 2 done
+        for root in nodes:
+            if state[root]:
+                continue
+            stack = [(root, iter(self.blocks[root].successors))]
+            state[root] = 1
+            while stack:
+                node, successors = stack[-1]
+                for successor in successors:
+                    if successor not in nodeSet or (node, successor) in removedEdges:
+                        continue
+                    if state[successor] == 1:
+                        return False
+                    if state[successor] == 0:
+                        state[successor] = 1
+                        stack.append((successor, iter(self.blocks[successor].successors)))
+                        break
+                else:
+                    state[node] = 2
+                    stack.pop()
+        return True
+
+
+    def callCost(self, block):
+        if block.call is None:
+            return 0
+        if block.call not in self.routineCycles:
+            self.analyzeRoutine(block.call)
+        return self.routineCycles[block.call]
+
+
+    def routineWorstCycles(self, entry, nodes, loops, backEdges):
+        # Loops, innermost first, collapse into their header with trip
+        # count x longest iteration; the routine is then the longest path
+        representative = {node: node for node in nodes}
+        cost = {}
+        for node in nodes:
+            callCycles = self.callCost(self.blocks[node])
+            if callCycles is None or self.blocks[node].escapes or node in self.unknownReturns:
+                cost[node] = None
+            else:
+                cost[node] = self.blocks[node].cycles + callCycles
+
+        def edges(node, members):
+            targets = set()
+            for member in members[node]:
+                for successor in self.blocks[member].successors:
+                    if (member, successor) not in backEdges and representative.get(successor, successor) != node:
+                        targets.add(representative[successor])
+            return targets
+
+        members = {node: [node] for node in nodes}
+        for loop in sorted(loops.values(), key=lambda loop: len(loop['body'])):
+            header = loop['header']
+            inside = {representative[node] for node in loop['body']}
+            iteration = self.longestPath(header, lambda node: [t for t in edges(node, members) if t in inside], cost)
+            cost[header] = None if iteration is None or loop['bound'] is None else iteration * loop['bound']
+            for node in loop['body']:
+                representative[node] = header
+            members[header] = sorted({member for node in inside for member in members[node]})
+
+        return self.longestPath(representative[entry], lambda node: edges(node, members), cost)
+
+
+    def longestPath(self, start, successors, cost):
+        # Longest cost path from start in an acyclic graph, None if any
+        # node on a path is unbounded
+        order = []
+        seen = {start}
+        stack = [(start, iter(successors(start)))]
+        while stack:
+            node, remaining = stack[-1]
+            for successor in remaining:
+                if successor not in seen:
+                    seen.add(successor)
+                    stack.append((successor, iter(successors(successor))))
+                    break
+            else:
+                order.append(node)
+                stack.pop()
+
+        longest = {}
+        for node in order:
+            if cost[node] is None:
+                longest[node] = None
+                continue
+            tails = [longest[successor] for successor in successors(node)]
+            longest[node] = None if None in tails else cost[node] + max(tails, default=0)
+        return longest[start]
+
+
+    def writesRegister(self, instruction, register):
+        _, mnemonic, operands, _ = instruction
+        if mnemonic in REGISTER_WRITERS:
+            return operands.get('register') == register
+        if mnemonic in DESTINATION_WRITERS:
+            return operands.get('destinationRegister') == register
+        return False
+
+
+    def loopBound(self, loop, dominators):
+        # Trip count of a loop whose only latch ends in JNZ/JMZ/JME back to
+        # the header, tested on a counter register the loop changes once per
+        # iteration with INC/DEC and that is set by LDI before the loop
+        if len(loop['latches']) != 1:
+            return None
+        latch = self.blocks[loop['latches'][0]]
+        jump = latch.instructions[-1]
+        if jump[1] not in ('JNZ', 'JMZ', 'JME') or jump[2].get('address') != loop['header']:
+            return None
+        test = next((instruction for instruction in reversed(latch.instructions[:-1]) if instruction[1] in FLAG_SETTERS), None)
+        if test is None or test[1] not in ('INC', 'DEC', 'CMI', 'CMIS'):
+            return None
+        register = test[2]['register']
+        if any(self.calleeWrites(self.blocks[node].call, register) for node in loop['body']):
+            return None
+
+        writes = [(node, instruction) for node in loop['body'] for instruction in self.blocks[node].instructions
+                  if self.writesRegister(instruction, register)]
+        if len(writes) != 1 or writes[0][1][1] not in ('INC', 'DEC'):
+            return None
+        writeBlock, write = writes[0]
+        if writeBlock not in dominators[latch.start] or (writeBlock == latch.start and write[0] > test[0]):
+            return None
+
+        initial = self.initialValue(loop, register)
+        if initial is None:
+            return None
+
+        step = 1 if write[1] == 'INC' else -1
+        compareWith = test[2].get('immediate', 0) if test[1] in ('CMI', 'CMIS') else 0
+        value = initial
+        for iteration in range(1, MAX_LOOP_ITERATIONS + 1):
+            value = (value + step) & 0xFF
+            if (value == compareWith) == (jump[1] == 'JNZ'):
+                return iteration
+        return None
+
+
+    def calleeWrites(self, entry, register):
+        # Whether a call to entry, or anything it calls, can change register
+        if entry is None:
+            return False
+        pending, seen = [entry], {entry}
+        while pending:
+            for node in self.routineBlocks(pending.pop()):
+                block = self.blocks[node]
+                if any(self.writesRegister(instruction, register) for instruction in block.instructions):
+                    return True
+                if block.call is not None and block.call not in seen:
+                    seen.add(block.call)
+                    pending.append(block.call)
+        return False
+
+
+    def initialValue(self, loop, register):
+        outside = [p for p in self.predecessors[loop['header']] if p not in loop['body']]
+        if len(outside) != 1:
+            return None
+        node, seen = outside[0], set()
+        while node not in seen:
+            seen.add(node)
+            # A CALL ends its block, so the callee runs after everything in it
+            if self.blocks[node].call is not None and self.calleeWrites(self.blocks[node].call, register):
+                return None
+            for instruction in reversed(self.blocks[node].instructions):
+                if self.writesRegister(instruction, register):
+                    return instruction[2].get('immediate') if instruction[1] == 'LDI' else None
+            predecessors = self.predecessors[node]
+            if len(predecessors) != 1:
+                return None
+            node = predecessors[0]
+        return None
+
+
+    def stackHighWater(self, entry):
+        # Deepest the stack gets below the depth on entry, in bytes; None
+        # if it can outgrow the RAM, round a loop or through recursion.
+        # An RTN reached with the stack not back at the entry depth, or in
+        # the program's entry routine, returns to an address the analysis
+        # can not know.
+        limit = self.ramSize + RETURN_ADDRESS_BYTES
+        seen = {(entry, 0)}
+        pending = [(entry, 0)]
+        highWater = 0
+        while pending:
+            node, depth = pending.pop()
+            block = self.blocks[node]
+            for _, mnemonic, _, _ in block.instructions:
+                depth += STACK_EFFECT.get(mnemonic, 0)
+                highWater = max(highWater, depth)
+            if block.last == 'RTN' and (depth != 0 or entry == self.entry):
+                self.unknownReturns.add(node)
+            if block.call is not None:
+                if block.call not in self.routineStack:
+                    self.routineStack[block.call] = None
+                    self.routineStack[block.call] = self.stackHighWater(block.call)
+                callee = self.routineStack[block.call]
+                if callee is None:
+                    return None
+                highWater = max(highWater, depth + RETURN_ADDRESS_BYTES + callee)
+            if highWater > limit or depth < -limit:
+                return None
+            for successor in block.successors:
+                if (successor, depth) not in seen:
+                    seen.add((successor, depth))
+                    pending.append((successor, depth))
+        return highWater
+
+
+    def heat(self, block):
+        executions = self.blockExecutions.get(block.start)
+        return (executions is None, block.cycles * (executions or 1))
+
+
+def formatAnalysis(result):
+    def bound(value):
+        return "unbounded" if value is None else str(value)
+
+    rom, stack = result['rom'], result['stack']
+    lines = [
+        f"ROM:   {rom['used']} of {rom['limit']} bytes used ({rom['free']} free), {rom['reachableCode']} bytes reachable code",
+        f"Stack: high-water {bound(stack['highWater'])} of {stack['limit']} bytes",
+        f"Worst case: {bound(result['worstCycles'])} cycles ({result['cycleSource']})",
+        "",
+        "Routines:",
+    ]
+    lines += [f"  0x{routine['entry']:04X}: {bound(routine['worstCycles'])} cycles, {routine['blocks']} blocks, "
+              f"stack {bound(routine['stackHighWater'])}" for routine in result['routines']]
+    if result['loops']:
+        lines.append("Loops:")
+        lines += [f"  0x{loop['header']:04X}: {bound(loop['bound'])} iterations" for loop in result['loops']]
+    lines.append("Hot blocks:")
+    lines += [f"  0x{block['start']:04X}-0x{block['end'] - 1:04X}: {block['cycles']} cycles x {bound(block['executions'])}"
+              for block in result['hotBlocks']]
+    lines += [f"Warning: {warning}" for warning in result['warnings']]
+    return "\n".join(lines)
@@ -0,0 +1,182 @@
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .loader import BinaryLoader
+
+
+DEFAULT_MAX_INSTRUCTIONS = 10000
+
+# One CPU per configuration per worker process, so the YAML config and
+# microcode banks are parsed once per worker instead of once per program
+_cpuCache = {}
+
+
+class BatchJob:
+    def __init__(self, program, mode = 'software', engine = 'interpreter', useAluTables = False,
+                 signedMode = True, maxInstructions = DEFAULT_MAX_INSTRUCTIONS, maxCycles = None,
+                 verifyEvery = None):
+        self.program = program
+        self.mode = mode
+        self.engine = engine
+        self.useAluTables = useAluTables
+        self.signedMode = signedMode
+        self.maxInstructions = maxInstructions
+        self.maxCycles = maxCycles
+        self.verifyEvery = verifyEvery  # Set to run the SoftwareCPU/HardwareCPU differential instead
+
+
+def collectPrograms(path):
+    # A directory yields its .bin files; a manifest is either a text file with
+    # one program per line or a JSON list of paths / {"program": ...} objects
+    # whose optional maxInstructions/maxCycles/mode override the defaults.
+    if os.path.isdir(path):
+        return [{'program': os.path.join(path, name)}
+                for name in sorted(os.listdir(path)) if name.lower().endswith('.bin')]
+
+    baseDir = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r') as f:
+        content = f.read()
+
+    if path.lower().endswith('.json'):
+        entries = json.loads(content)
+    else:
+        entries = [line.strip() for line in content.split("\n")]
+        entries = [line for line in entries if line and not line.startswith('#')]
+
+    programs = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'program': entry}
+        entry = dict(entry)
+        entry['program'] = os.path.join(baseDir, entry['program'])
+        programs.append(entry)
+    return programs
+
+
+def _getCpu(job):
+    key = (job.mode, job.engine, job.useAluTables, job.verifyEvery is not None)
+    if key not in _cpuCache:
+        if job.verifyEvery is not None:
+            from core.software_cpu import SoftwareCPU
+            from core.hardware_cpu import HardwareCPU
+            from .differential import DifferentialRunner
+            _cpuCache[key] = DifferentialRunner(SoftwareCPU(engine=job.engine, useAluTables=job.useAluTables),
+                                                HardwareCPU(enable_signal_logging=False, useAluTables=job.useAluTables))
+        elif job.mode == 'hardware':
+            from core.hardware_cpu import HardwareCPU
+            _cpuCache[key] = HardwareCPU(enable_signal_logging=False, useAluTables=job.useAluTables)
+        else:
+            from core.software_cpu import SoftwareCPU
+            _cpuCache[key] = SoftwareCPU(engine=job.engine, useAluTables=job.useAluTables)
+    return _cpuCache[key]
+
+
+def runJob(job):
+    # CPU diagnostics (e.g. unknown instructions) must not end up in the JSON stream
+    with contextlib.redirect_stdout(sys.stderr):
+        if job.verifyEvery is not None:
+            return _runVerifyJob(job)
+        return _runEmulatorJob(job)
+
+
+def _runVerifyJob(job):
+    result = {'program': job.program, 'mode': 'verify', 'engine': job.engine}
+
+    try:
+        binaryData, _ = BinaryLoader.loadFile(job.program)
+        runner = _getCpu(job)
+        runner.software.setSignedMode(job.signedMode)
+        runner.hardware.setSignedMode(job.signedMode)
+        runner.loadProgram(binaryData)
+
+        startTime = time.perf_counter()
+        result.update(runner.run(job.maxInstructions, job.verifyEvery))
+        result['wallTime'] = time.perf_counter() - startTime
+        result['error'] = None
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def _runEmulatorJob(job):
+    result = {
+        'program': job.program,
+        'mode'   : job.mode,
+        'engine' : job.engine if job.mode == 'software' else None,
+    }
+
+    try:
+        binaryData, _ = BinaryLoader.loadFile(job.program)
+
+        cpu = _getCpu(job)
+        cpu.memory.clearRom()  # Nothing from the previous program may survive
+        cpu.setSignedMode(job.signedMode)
+        cpu.loadProgram(binaryData)
+
+        maxInstructions = job.maxInstructions
+        maxCycles = job.maxCycles if job.maxCycles is not None else float('inf')
+
+        # Counted here rather than read from the CPU: RST resets the CPU's own
+        # counters, so a program that resets would never use up its budget
+        instructions = 0
+        cycles = 0
+
+        startTime = time.perf_counter()
+        while not cpu.halted:
+            # run() counts instructions in software mode and micro-cycles in
+            # hardware mode; neither can exceed either remaining budget
+            budget = min(maxInstructions - instructions, maxCycles - cycles)
+            if budget <= 0:
+                break
+            instructionsBefore = cpu.instructionCount
+            executed = cpu.run(int(budget))
+            if executed == 0:
+                break
+            if job.mode == 'hardware':
+                # RST is a microcode sequence there and leaves the counters alone
+                cycles += executed
+                instructions += cpu.instructionCount - instructionsBefore
+            else:
+                # SoftwareCPU counts one cycle per instruction
+                instructions += executed
+                cycles += executed
+        wallTime = time.perf_counter() - startTime
+
+        state = cpu.getState()
+        result.update({
+            'registers'           : state['registers'],
+            'ram'                 : state['ram'],
+            'sevenSegment'        : state['seven_segment'],
+            'halted'              : state['halted'],
+            'pc'                  : state['pc'],
+            'instructions'        : instructions,
+            'cycles'              : cycles,
+            'wallTime'            : wallTime,
+            'instructionsPerSecond': instructions / wallTime if wallTime > 0 else None,
+            'error'               : None,
+        })
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def runBatch(programs, jobs = None, **defaults):
+    batchJobs = []
+    for entry in programs:
+        options = dict(defaults)
+        options.update(entry)
+        batchJobs.append(BatchJob(**options))
+
+    if jobs == 1:
+        return [runJob(job) for job in batchJobs]
+
+    workers = jobs or os.cpu_count() or 1
+    chunkSize = max(1, len(batchJobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(runJob, batchJobs, chunksize=chunkSize))
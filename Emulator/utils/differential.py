@@ -0,0 +1,170 @@
+from collections import deque
+
+
+# A well-formed instruction retires (SqR) before the 4-bit sequence counter wraps
+MAX_CYCLES_PER_INSTRUCTION = 16
+DEFAULT_WINDOW_SIZE = 8
+
+COMPARED_FIELDS = ('registers', 'flags', 'ram', 'pc', 'sevenSegment', 'halted')
+
+
+def architecturalState(cpu):
+    return {
+        'registers'   : cpu.registers.getAllRegisters(),
+        'flags'       : cpu.alu.getFlags(),
+        'ram'         : cpu.memory.getRamDump(),
+        'pc'          : cpu.programCounter,
+        'sevenSegment': cpu.sevenSegmentValue,
+        'halted'      : cpu.halted,
+    }
+
+
+def compareStates(softwareState, hardwareState):
+    return {field: {'software': softwareState[field], 'hardware': hardwareState[field]}
+            for field in COMPARED_FIELDS if softwareState[field] != hardwareState[field]}
+
+
+class DifferentialRunner:
+    # Runs SoftwareCPU and HardwareCPU on the same ROM and compares their
+    # architectural state at instruction boundaries. every = 1 compares after
+    # each instruction; a larger value only compares every N instructions and
+    # at HLT, then replays in lock-step to pinpoint the first divergence; a
+    # divergence that converges again before the next checkpoint goes unseen.
+
+    def __init__(self, softwareCpu = None, hardwareCpu = None, windowSize = DEFAULT_WINDOW_SIZE):
+        if softwareCpu is None:
+            from core.software_cpu import SoftwareCPU
+            softwareCpu = SoftwareCPU()
+        if hardwareCpu is None:
+            from core.hardware_cpu import HardwareCPU
+            hardwareCpu = HardwareCPU(enable_signal_logging=False)
+
+        self.software = softwareCpu
+        self.hardware = hardwareCpu
+        self.windowSize = windowSize
+        self.binaryData = b''
+
+
+    def loadProgram(self, binaryData):
+        self.binaryData = bytes(binaryData)
+        for cpu in (self.software, self.hardware):
+            cpu.memory.clearRom()
+            cpu.loadProgram(self.binaryData)
+
+
+    def run(self, maxInstructions = 10000, every = 1):
+        self.loadProgram(self.binaryData)
+        if every <= 1:
+            return self._runLockStep(maxInstructions)
+
+        executed = 0
+        while executed < maxInstructions and not (self.software.halted and self.hardware.halted):
+            count = min(every, maxInstructions - executed)
+            softwareCount = self._runSoftware(count)
+            hardwareCount, retired = self._runHardware(count)
+            executed += softwareCount
+
+            divergence = compareStates(architecturalState(self.software), architecturalState(self.hardware))
+            if divergence or not retired or softwareCount != hardwareCount:
+                # Somewhere in the last stretch; replay it one instruction at a time
+                self.loadProgram(self.binaryData)
+                return self._runLockStep(executed + 1)
+
+        return self._result(executed, None)
+
+
+    def _runSoftware(self, count):
+        # SoftwareCPU.run() stops early at RST, which it counts, and at an
+        # instruction it rejects, which it does not; both take one slot here.
+        # RST leaves IR cleared by reset(), a rejected opcode leaves itself.
+        cpu = self.software
+        done = 0
+        while done < count and not cpu.halted:
+            requested = count - done
+            executed = cpu.run(requested)
+            done += executed
+            if executed < requested and not cpu.halted and cpu.instructionRegister != 0:
+                done += 1
+        return done
+
+
+    def _runHardware(self, count):
+        cpu = self.hardware
+        done = 0
+        while done < count and not cpu.halted:
+            before = cpu.instructionCount
+            cpu.runInstructions(1, MAX_CYCLES_PER_INSTRUCTION)
+            if cpu.instructionCount == before and not cpu.halted:
+                return done, False
+            done += 1
+        return done, True
+
+
+    def _runLockStep(self, maxInstructions):
+        software, hardware = self.software, self.hardware
+        window = deque(maxlen=self.windowSize)
+
+        for index in range(maxInstructions):
+            if software.halted and hardware.halted:
+                return self._result(index, None)
+
+            pc = software.programCounter
+            mnemonic, operands, _ = software.decoder.decode(software.memory.readRom(pc))
+            entry = {
+                'instruction': index,
+                'pc'         : pc,
+                'disassembly': software._formatInstructionForLog(mnemonic, operands),
+            }
+
+            if not software.halted:
+                software.step()
+            _, retired = self._runHardware(1)
+
+            softwareState = architecturalState(software)
+            hardwareState = architecturalState(hardware)
+            entry['software'] = softwareState
+            entry['hardware'] = hardwareState
+            window.append(entry)
+
+            divergence = compareStates(softwareState, hardwareState)
+            if not retired:
+                divergence['retired'] = {'software': True, 'hardware': False}
+            if divergence:
+                return self._result(index + 1, {
+                    'instruction': index,
+                    'pc'         : pc,
+                    'disassembly': entry['disassembly'],
+                    'fields'     : divergence,
+                    'window'     : list(window),
+                })
+
+        return self._result(maxInstructions, None)
+
+
+    def _result(self, instructions, divergence):
+        return {
+            'instructions'  : instructions,
+            'softwareCycles': self.software.cycleCount,
+            'hardwareCycles': self.hardware.cycleCount,
+            'matched'       : divergence is None,
+            'divergence'    : divergence,
+        }
+
+
+def formatDivergence(result):
+    divergence = result['divergence']
+    if divergence is None:
+        return f"No divergence in {result['instructions']} instructions"
+
+    lines = [f"First divergence at instruction {divergence['instruction']} "
+             f"(PC {divergence['pc']:04X}: {divergence['disassembly']})"]
+    for field, values in divergence['fields'].items():
+        lines.append(f"  {field}: software={values['software']} hardware={values['hardware']}")
+    lines.append("Trace window:")
+    for entry in divergence['window']:
+        marker = ">" if entry['instruction'] == divergence['instruction'] else " "
+        software, hardware = entry['software'], entry['hardware']
+        lines.append(f" {marker} #{entry['instruction']:<6} {entry['pc']:04X}: {entry['disassembly']:<12} "
+                     f"SW regs={list(software['registers'].values())} pc={software['pc']:04X} | "
+                     f"HW regs={list(hardware['registers'].values())} pc={hardware['pc']:04X}")
+    return "\n".join(lines)
@@ -3,7 +3,12 @@ import importlib
 import glob
 import logging
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 import MicrocodeConfig
 
@@ -14,8 +19,10 @@ UCODE_ORDER = [UCODE_0, UCODE_1, UCODE_2]
 OUTPUT_ROWS_PER_CHIP = 8
 EXPECTED_OUTPUT_ROW_COUNT = len(UCODE_ORDER) * OUTPUT_ROWS_PER_CHIP
 EXPECTED_INPUT_ADDRESS_ROW_COUNT = 15
+MICROCODE_SIZE = 32768
+UNCLAIMED_OWNER = -1
+SHARED_OWNER = -2
 
-MICRO_CODE_MAP_FILE = os.path.join("out", "microCodeMap.txt")
 LOGGER = logging.getLogger(__name__)
 
 
@@ -41,14 +48,191 @@ class ParsedInstructionData:
 
 @dataclass
 class GeneratedMicrocodeResult:
-    MicrocodeByChip: Dict[str, List[int]]
+    MicrocodeByChip: Dict[str, bytearray]
     LastMicroInstructionMatrix: ParsedMicroInstructionMatrix
+    AddressColumnsByInstruction: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict)
+    DataColumnsByInstruction: Dict[str, List[List[int]]] = field(default_factory=dict)
+    OwnerByAddress: List[int] = field(default_factory=list)
+
+
+def IterateFreeBitSubsets(freeMask: int) -> Iterator[int]:
+    """
+    Yield every subset of the free mask in ascending order, starting with 0.
+    `(subset - freeMask) & freeMask` steps to the next subset directly, so
+    only the 2^k combinations of the k free bits are ever visited.
+    """
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - freeMask) & freeMask
+        if subset == 0:
+            return
+
+
+def IterateColumnSlices(fixedValue: int, freeMask: int) -> Iterator[Tuple[slice, int]]:
+    """
+    Yield (slice, address count) pairs that together cover every address of
+    one (fixed value, free mask) column. The lowest run of consecutive free
+    bits becomes the stride of one slice, so only the remaining free bits
+    are enumerated.
+    """
+    if freeMask == 0:
+        yield slice(fixedValue, fixedValue + 1, 1), 1
+        return
+
+    runStart = (freeMask & -freeMask).bit_length() - 1
+    runLength = 0
+    while freeMask & (1 << (runStart + runLength)):
+        runLength += 1
+    runMask = ((1 << runLength) - 1) << runStart
+    stride, count = 1 << runStart, 1 << runLength
+    for subset in IterateFreeBitSubsets(freeMask & ~runMask):
+        base = fixedValue | subset
+        yield slice(base, base + stride * count, stride), count
+
+
+class MicrocodeImageBuilder:
+    def __init__(self, chipNames: List[str] = UCODE_ORDER, size: int = MICROCODE_SIZE):
+        """
+        Hold the EEPROM images of all microcode chips while instruction tables
+        are merged into them. With NumPy the images are one (chips, size) uint8
+        array and every instruction is applied as a single masked write;
+        without it they are one bytearray per chip, written slice by slice.
+        Each address remembers which instruction wrote it, or that several
+        did, so two writes of different data to the same address are reported
+        instead of the later one silently winning.
+        """
+        self.ChipNames = list(chipNames)
+        self.Size = size
+        self.OwnerNames: List[str] = []
+        self.AddressColumnsByInstruction: Dict[str, List[Tuple[int, int]]] = {}
+        self.DataColumnsByInstruction: Dict[str, List[List[int]]] = {}
+        if np is not None:
+            self.Images = np.zeros((len(self.ChipNames), size), dtype=np.uint8)
+            self.Owners = np.full(size, UNCLAIMED_OWNER, dtype=np.int32)
+        else:
+            self.Images = [bytearray(size) for _ in self.ChipNames]
+            self.Owners = [UNCLAIMED_OWNER] * size
+
+
+    def ApplyInstruction(self, instructionName: str, addressColumns: List[Tuple[int, int]],
+                         dataColumnsByChip: List[List[int]]):
+        """
+        Write one instruction table into the images. `addressColumns` holds a
+        (fixed value, free mask) pair per micro-instruction column and
+        `dataColumnsByChip` the encoded data byte of every column, per chip.
+        """
+        ownerIndex = len(self.OwnerNames)
+        self.OwnerNames.append(instructionName)
+        self.AddressColumnsByInstruction[instructionName] = list(addressColumns)
+        self.DataColumnsByInstruction[instructionName] = [list(dataColumns) for dataColumns in dataColumnsByChip]
+        if np is not None:
+            self._ApplyInstructionArray(ownerIndex, addressColumns, dataColumnsByChip)
+        else:
+            for columnIndex, (fixedValue, freeMask) in enumerate(addressColumns):
+                columnValues = [dataColumns[columnIndex] for dataColumns in dataColumnsByChip]
+                self._ApplyColumnSlices(ownerIndex, fixedValue, freeMask, columnValues)
+
+
+    def ChipImages(self) -> Dict[str, bytearray]:
+        """Return the finished image of every chip as a bytearray, keyed by chip name."""
+        return {chipName: bytearray(self.Images[chipIndex]) for chipIndex, chipName in enumerate(self.ChipNames)}
+
+
+    def AddressOwners(self) -> List[int]:
+        """
+        Return, per address, the index of the instruction that wrote it, in
+        application order, `SHARED_OWNER` if several instructions wrote the same
+        data there, or `UNCLAIMED_OWNER` if nothing did.
+        """
+        if np is not None:
+            return self.Owners.tolist()
+        return list(self.Owners)
+
+
+    def _ExpandAddressArray(self, fixedValue: int, freeMask: int):
+        """Build the ascending address array of one column, doubling it once per free bit."""
+        addresses = np.array([fixedValue], dtype=np.int64)
+        while freeMask:
+            bit = freeMask & -freeMask
+            addresses = np.concatenate((addresses, addresses | bit))
+            freeMask = freeMask ^ bit
+        return addresses
+
+
+    def _ApplyInstructionArray(self, ownerIndex: int, addressColumns: List[Tuple[int, int]],
+                               dataColumnsByChip: List[List[int]]):
+        """
+        Concatenate the addresses of all columns, check them against each other
+        and against earlier instructions, then store every chip in one write.
+        """
+        addressParts = [self._ExpandAddressArray(fixedValue, freeMask) for fixedValue, freeMask in addressColumns]
+        addresses = np.concatenate(addressParts)
+        columnIndexes = np.repeat(np.arange(len(addressParts)), [len(part) for part in addressParts])
+        values = np.array(dataColumnsByChip, dtype=np.uint8)[:, columnIndexes]
+
+        order = np.argsort(addresses, kind="stable")
+        sortedAddresses = addresses[order]
+        sortedValues = values[:, order]
+        clashes = (sortedAddresses[1:] == sortedAddresses[:-1]) & \
+            (sortedValues[:, 1:] != sortedValues[:, :-1]).any(axis=0)
+        if clashes.any():
+            position = int(np.argmax(clashes))
+            self._RaiseWriteConflict(int(sortedAddresses[position]), ownerIndex, ownerIndex,
+                                     sortedValues[:, position], sortedValues[:, position + 1])
+
+        previousOwners = self.Owners[addresses]
+        unclaimed = previousOwners == UNCLAIMED_OWNER
+        clashes = ~unclaimed & (self.Images[:, addresses] != values).any(axis=0)
+        if clashes.any():
+            position = int(np.argmax(clashes))
+            address = int(addresses[position])
+            self._RaiseWriteConflict(address, int(previousOwners[position]), ownerIndex,
+                                     self.Images[:, address], values[:, position])
+
+        self.Images[:, addresses] = values
+        self.Owners[addresses] = np.where(unclaimed | (previousOwners == ownerIndex), ownerIndex, SHARED_OWNER)
+
+
+    def _ApplyColumnSlices(self, ownerIndex: int, fixedValue: int, freeMask: int, columnValues: List[int]):
+        """
+        Write one column without NumPy, a strided slice at a time, checking
+        each slice against the addresses already claimed before it is written.
+        """
+        for addressSlice, count in IterateColumnSlices(fixedValue, freeMask):
+            previousOwners = self.Owners[addressSlice]
+            for position, owner in enumerate(previousOwners):
+                if owner == UNCLAIMED_OWNER:
+                    continue
+                address = addressSlice.start + position * addressSlice.step
+                previousValues = [image[address] for image in self.Images]
+                if previousValues != columnValues:
+                    self._RaiseWriteConflict(address, owner, ownerIndex, previousValues, columnValues)
+            for image, value in zip(self.Images, columnValues):
+                image[addressSlice] = bytes((value,)) * count
+            self.Owners[addressSlice] = [
+                ownerIndex if owner in (UNCLAIMED_OWNER, ownerIndex) else SHARED_OWNER for owner in previousOwners
+            ]
+
+
+    def _RaiseWriteConflict(self, address: int, previousOwner: int, owner: int, previousValues, values):
+        """Report the first chip whose byte at `address` two writes disagree on."""
+        for chipIndex, chipName in enumerate(self.ChipNames):
+            if int(previousValues[chipIndex]) != int(values[chipIndex]):
+                break
+        previousWriter = f"'{self.OwnerNames[previousOwner]}'" if previousOwner >= 0 else "several instructions"
+        raise Exception(
+            f"ERROR: Conflicting microcode writes at address 0x{address:04x} on chip '{chipName}': "
+            f"{previousWriter} wrote 0x{int(previousValues[chipIndex]):02x}, "
+            f"'{self.OwnerNames[owner]}' writes 0x{int(values[chipIndex]):02x}."
+        )
 
 
 class ParseInstructions:
-    def __init__(self):
+    def __init__(self, instructionNames: Optional[List[str]] = None):
         """
-        Load all autogenerated instruction modules from the autogen output directory.
+        Load all autogenerated instruction modules from the autogen output directory,
+        or only those of `instructionNames` for an incremental build.
         The modules are imported, sorted, and stored so later stages can parse
         them into structured address and output matrices.
         """
@@ -59,6 +243,8 @@ class ParseInstructions:
         for filePath in sorted(autogenFiles):
             moduleFilename = os.path.basename(filePath)
             moduleName = moduleFilename[:-3]
+            if instructionNames is not None and moduleName[len("Autogen_"):] not in instructionNames:
+                continue
 
             try:
                 module = importlib.import_module(f"out.autogen.{moduleName}")
@@ -159,29 +345,35 @@ class ParseInstructions:
             self.InstructionParsedData[instructionName] = parsedInstruction
 
 
-    def ExpandAddressColumn(self, bitColumn: List[str], reverseOrder: bool = False) -> List[int]:
+    def ResolveAddressColumn(self, bitColumn: List[str], reverseOrder: bool = False) -> Tuple[int, int]:
         """
-        Expand one address column into all concrete addresses it represents.
-        Literal `0` and `1` bits are fixed, while any other symbol is treated
-        as a don't-care bit and generates all matching address combinations.
+        Reduce one address column to a (fixed value, free mask) pair.
+        Literal `0` and `1` bits land in the fixed value, while every other
+        symbol is a don't-care bit and sets the matching bit of the free mask.
         """
         if reverseOrder:
             bitColumnValues = bitColumn[::-1]
         else:
             bitColumnValues = bitColumn
 
-        possibleValues: List[int] = []
-        maxValue = pow(2, len(bitColumnValues))
+        fixedValue = 0
+        freeMask = 0
+        for bitIndex, bitValue in enumerate(bitColumnValues):
+            if bitValue == "1":
+                fixedValue = fixedValue | (1 << bitIndex)
+            elif bitValue != "0":
+                freeMask = freeMask | (1 << bitIndex)
+        return fixedValue, freeMask
+
 
-        for candidateValue in range(maxValue):
-            resolvedValue = candidateValue
-            for bitIndex, bitValue in enumerate(bitColumnValues):
-                if bitValue in ["1", "0"]:
-                    resolvedValue = resolvedValue & ~(1 << bitIndex)
-                    resolvedValue = resolvedValue | (int(bitValue) << bitIndex)
-            if resolvedValue not in possibleValues:
-                possibleValues.append(resolvedValue)
-        return possibleValues
+    def ExpandAddressColumn(self, bitColumn: List[str], reverseOrder: bool = False) -> List[int]:
+        """
+        Expand one address column into all concrete addresses it represents.
+        Literal `0` and `1` bits are fixed, while any other symbol is treated
+        as a don't-care bit and generates all matching address combinations.
+        """
+        fixedValue, freeMask = self.ResolveAddressColumn(bitColumn, reverseOrder)
+        return [fixedValue | subset for subset in IterateFreeBitSubsets(freeMask)]
 
 
     def EncodeDataColumn(self, bitColumn: List[str], chipName: str = "") -> int:
@@ -215,78 +407,68 @@ class ParseInstructions:
         return transposedMatrix
 
 
-    def CreateEmptyMicrocodeMatrix(self) -> Dict[str, List[int]]:
-        """Create zero-filled EEPROM images for all configured microcode chips."""
-        microcodeMatrix = {UCODE_0: [], UCODE_1: [], UCODE_2: []}
-        microcodeSize = 32768
-        for chipName in microcodeMatrix:
-            for _ in range(microcodeSize):
-                microcodeMatrix[chipName].append(0)
-        return microcodeMatrix
+    def BuildInstructionTables(self, parsedInstruction: ParsedInstructionData) -> Tuple[List[Tuple[int, int]], List[List[int]]]:
+        """
+        Reduce one parsed instruction to what the images need: a (fixed value,
+        free mask) pair per address column and the encoded data byte of every
+        column, per chip in `UCODE_ORDER`.
+        """
+        addressColumns = [
+            self.ResolveAddressColumn(addressColumn, reverseOrder=True)
+            for addressColumn in self.TransposeMatrix(parsedInstruction.AddressMatrix)
+        ]
+        dataColumnsByChip = [
+            [
+                self.EncodeDataColumn(dataColumn, chipName)
+                for dataColumn in self.TransposeMatrix(parsedInstruction.OutputMatrixByChip[chipName])
+            ]
+            for chipName in UCODE_ORDER
+        ]
+        return addressColumns, dataColumnsByChip
 
 
     def GenerateAddressDataMap(self) -> GeneratedMicrocodeResult:
         """
         Expand parsed instruction tables into full EEPROM address/data images.
-        Each instruction column is converted into concrete addresses and byte
-        values, then written into per-chip microcode buffers and map output.
+        Each instruction column is reduced to an address mask and one byte per
+        chip and merged into the images by `MicrocodeImageBuilder`. The address
+        map files are an optional later stage, see `MicrocodeMap`.
         """
-        microcodeMatrix = self.CreateEmptyMicrocodeMatrix()
+        imageBuilder = MicrocodeImageBuilder()
         lastMicroInstructionMatrix = None
 
-        if os.path.exists(MICRO_CODE_MAP_FILE):
-            os.remove(MICRO_CODE_MAP_FILE)
-
         if not os.path.exists("out"):
             os.mkdir("out")
 
         totalInstructions = len(self.InstructionParsedData)
 
-        with open(MICRO_CODE_MAP_FILE, "w") as mapFilePointer:
-            doneCount = 0
-            for instruction in self.InstructionParsedData:
-                percent = (doneCount / totalInstructions) * 100
-                barLength = 40
-                filledLength = int(barLength * percent // 100)
-                bar = '#' * filledLength + '-' * (barLength - filledLength)
-                print(
-                    f"   Processing: {instruction:<8} "
-                    f"Overall Progress: [{bar}] {percent:6.2f}%{' ' * 40}",
-                    end="\r"
-                )
-                parsedInstruction = self.InstructionParsedData[instruction]
-                addressColumns = self.TransposeMatrix(parsedInstruction.AddressMatrix)
-                lastMicroInstructionMatrix = parsedInstruction.MicroInstructionMatrix
-
-                for chipName in microcodeMatrix:
-                    dataColumns = self.TransposeMatrix(parsedInstruction.OutputMatrixByChip[chipName])
-
-                    mapFilePointer.write(f"\n\nInstruction: {instruction}; Chip: {chipName}\n")
-                    mapFilePointer.write(f"------------------------------------------------------------------------------\n")
-                    mapFilePointer.write(f"                                   |       |  uu f ssss iiii iiii |  iiii iiii\n")
-                    mapFilePointer.write(f"                           Address |  Val  |  nn l qqqq nnnn nnnn |  oooo oooo\n")
-                    mapFilePointer.write(f"                                   |       |  01 g 3210 0123 4567 |  7654 3210\n")
-                    mapFilePointer.write(f"------------------------------------------------------------------------------\n")
-                    mapIndex = 1
-                    for columnIndex, addressColumn in enumerate(addressColumns):
-                        addresses = self.ExpandAddressColumn(addressColumn, reverseOrder=True)
-                        value = self.EncodeDataColumn(dataColumns[columnIndex], chipName)
-                        for address in addresses:
-                            microcodeMatrix[chipName][address] = value
-                            mapFilePointer.write(f"chip_{chipName}_ins_{instruction.lower()}_{mapIndex:04d} :: 0x{address:04x} => 0x{value:02x} //")
-                            strAdd = str(f"{address:015b}")
-                            strVal = str(f"{value:08b}")
-                            mapFilePointer.write(f" {strAdd[:2]}_{strAdd[2:3]}_{strAdd[3:7]}_{strAdd[7:11]}.{strAdd[11:15]} :: {strVal[:4]}.{strVal[4:8]}\n")
-                            mapIndex += 1
-
-                doneCount += 1
-                print(f"Completed: {instruction:<8}{' ' * 80}")
-
-            print(f"{' ' * 150}")
+        doneCount = 0
+        for instruction in self.InstructionParsedData:
+            percent = (doneCount / totalInstructions) * 100
+            barLength = 40
+            filledLength = int(barLength * percent // 100)
+            bar = '#' * filledLength + '-' * (barLength - filledLength)
+            print(
+                f"   Processing: {instruction:<8} "
+                f"Overall Progress: [{bar}] {percent:6.2f}%{' ' * 40}",
+                end="\r"
+            )
+            parsedInstruction = self.InstructionParsedData[instruction]
+            addressColumns, dataColumnsByChip = self.BuildInstructionTables(parsedInstruction)
+            lastMicroInstructionMatrix = parsedInstruction.MicroInstructionMatrix
+            imageBuilder.ApplyInstruction(instruction, addressColumns, dataColumnsByChip)
+
+            doneCount += 1
+            print(f"Completed: {instruction:<8}{' ' * 80}")
+
+        print(f"{' ' * 150}")
 
         return GeneratedMicrocodeResult(
-            MicrocodeByChip=microcodeMatrix,
-            LastMicroInstructionMatrix=lastMicroInstructionMatrix
+            MicrocodeByChip=imageBuilder.ChipImages(),
+            LastMicroInstructionMatrix=lastMicroInstructionMatrix,
+            AddressColumnsByInstruction=imageBuilder.AddressColumnsByInstruction,
+            DataColumnsByInstruction=imageBuilder.DataColumnsByInstruction,
+            OwnerByAddress=imageBuilder.AddressOwners(),
         )
 
 
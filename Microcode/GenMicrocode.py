@@ -1,3 +1,4 @@
+import argparse
 import logging
 import os
 import shutil
@@ -8,6 +9,9 @@ from typing import Dict, Optional
 import NormalizeInstructions
 import GenerateAutogenInstructions
 import CompileAutogenInstructions
+import IncrementalBuild
+import MicrocodeMap
+import ParallelBuild
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 LOGGER = logging.getLogger(__name__)
@@ -114,16 +118,42 @@ def GenMicrocode(chipName, data):
         filePointer.write(bytes(data))
 
 
-def Main():
-    """Run the full microcode generation pipeline from instruction sources to ROM images."""
-    previousSnapshots = LoadPreviousMicrocodeSnapshots()
+def ParseArguments():
+    parser = argparse.ArgumentParser(description="Generate the microcode EEPROM images")
+    parser.add_argument(
+        "--map",
+        nargs="+",
+        default=[],
+        choices=list(MicrocodeMap.MAP_FILE_NAMES),
+        metavar="FORMAT",
+        help="Also write the address map: text (microCodeMap.txt), csv (microCodeMap.csv) "
+             "and/or bin (microCodeMap.bin, memory-mapped by the Inspector)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild every instruction instead of patching the changed ones into the last build",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Build instructions in N worker processes (0: one per CPU, default: 1, serial)",
+    )
+    return parser.parse_args()
+
 
+def RunFullBuild(configPath, jobs=1):
+    """Normalize, autogen and compile every instruction into new images."""
     if os.path.exists("out"):
         shutil.rmtree("out")
 
+    if jobs != 1:
+        return ParallelBuild.RunParallelBuild(configPath, jobs)
+
     # Step 1: Normalize instruction files to match YAML configuration
     LOGGER.info("Step 1: Normalizing instruction files to match YAML configuration...")
-    configPath = os.path.join(os.path.dirname(__file__), "MicroCodeConfig.yaml")
     normalizer = NormalizeInstructions.InstructionNormalizer(configPath)
     normalizer.NormalizeAllInstructions(overwriteSource=True)
     LOGGER.info("")
@@ -138,16 +168,42 @@ def Main():
     LOGGER.info("Step 3: Compiling microcode...")
     insParser = CompileAutogenInstructions.ParseInstructions()
     insParser.ParseEachInstruction()
-    generationResult = insParser.GenerateAddressDataMap()
+    return insParser.GenerateAddressDataMap()
+
+
+def Main():
+    """Run the full microcode generation pipeline from instruction sources to ROM images."""
+    arguments = ParseArguments()
+    previousSnapshots = LoadPreviousMicrocodeSnapshots()
+    configPath = os.path.join(os.path.dirname(__file__), "MicroCodeConfig.yaml")
+
+    # Patch only the changed instructions into the last build when its manifest allows it
+    generationResult = None
+    if not arguments.full:
+        generationResult = IncrementalBuild.RunIncrementalBuild(configPath, previousSnapshots, arguments.jobs)
+        if generationResult is not None:
+            MicrocodeMap.RemoveMaps()
+    if generationResult is None:
+        generationResult = RunFullBuild(configPath, arguments.jobs)
+
     buildStatuses = []
     for chipName, eachChipMicrocode in generationResult.MicrocodeByChip.items():
         LOGGER.info(f"Creating Microcode for Chip: {chipName}")
-        if generationResult.LastMicroInstructionMatrix:
+        if generationResult.AddressColumnsByInstruction:
             chipData = bytes(eachChipMicrocode)
             GenMicrocode(chipName, chipData)
             buildStatuses.append(BuildMicrocodeStatus(chipName, chipData, previousSnapshots))
         else:
             LOGGER.warning("Microcode index is null!!")
+    if buildStatuses:
+        IncrementalBuild.SaveManifest(generationResult, configPath)
+
+    # Step 4: Optional address maps, built from the finished images
+    if arguments.map:
+        LOGGER.info("")
+        LOGGER.info("Step 4: Writing address maps...")
+        for mapPath in MicrocodeMap.WriteMaps(generationResult, arguments.map):
+            LOGGER.info(f"Created Map: {mapPath}")
 
     LogMicrocodeStatus(buildStatuses)
     LOGGER.info("Microcode generation completed successfully.")
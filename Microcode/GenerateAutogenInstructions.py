@@ -62,7 +62,7 @@ LOGGER = logging.getLogger(__name__)
 
 
 class GenAutoInstructions:
-    def __init__(self, useNormalized=False):
+    def __init__(self, useNormalized=False, instructionNames=None):
         """
         Load the microcode configuration and import all instruction source modules.
         The imported modules are sorted and validated early so generation fails
@@ -71,7 +71,10 @@ class GenAutoInstructions:
         Args:
             useNormalized: If True, use normalized instruction files from out/normalized.
                           If False, use original files from Instructions directory (default).
+            instructionNames: If given, only these instruction files are imported and
+                          checked, so parallel workers never read each other's files.
         """
+        self.RequestedInstructionNames = instructionNames
         self.UCodeConfig = MicrocodeConfig.ParseConfig(MICROCODE_CFG_FILE)
 
         self.InsObjects = []
@@ -89,6 +92,8 @@ class GenAutoInstructions:
         for filePath in sorted(instructionFiles):
             moduleFilename = os.path.basename(filePath)
             moduleName = moduleFilename[:-3]
+            if instructionNames is not None and moduleName[len("Ins"):] not in instructionNames:
+                continue
 
             try:
                 # Always use spec_from_file_location for consistent loading
@@ -197,11 +202,12 @@ class GenAutoInstructions:
             raise Exception(f"ERROR: Number of Output Control Signals exceeded {EXPECTED_OUTPUT_CONTROL_SIGNAL_LIMIT} in instruction '{instructionName}'.")
 
 
-    def AutogenEachInstruction(self):
+    def AutogenEachInstruction(self, instructionNames=None):
         """
         Generate normalized autogen instruction files from the handwritten
         instruction sources. This stage validates completeness, derives virtual
-        control rows, and emits output in physical chip order.
+        control rows, and emits output in physical chip order. With
+        `instructionNames` only those instructions are regenerated.
         """
         configuredInstructions = MicrocodeConfig.GetAllInstructions(self.UCodeConfig)
         parsedInstructionFlags = {instructionName: False for instructionName in configuredInstructions}
@@ -209,6 +215,8 @@ class GenAutoInstructions:
         for module in self.InsObjects:
             instructionFile = module.__file__
             instructionName = self.GetInstructionNameFromModule(module, configuredInstructions, parsedInstructionFlags)
+            if instructionNames is not None and instructionName not in instructionNames:
+                continue
             parsedSource = ParsedInstructionSource(
                 InstructionName=instructionName,
                 InstructionFile=instructionFile
@@ -250,6 +258,8 @@ class GenAutoInstructions:
             )
 
         for instructionName, isParsed in parsedInstructionFlags.items():
+            if instructionNames is not None and instructionName not in instructionNames:
+                continue
             if not isParsed:
                 raise Exception(f"ERROR: Instruction '{instructionName}' defined in configuration but not found in any instruction file.")
 
@@ -334,6 +344,8 @@ class GenAutoInstructions:
         if missingInConfig:
             raise Exception(f"ERROR: Instruction files found but not listed in configuration: {missingInConfig}")
 
+        if self.RequestedInstructionNames is not None:
+            configuredInstructions = configuredInstructions & set(self.RequestedInstructionNames)
         missingInstructionFiles = sorted(configuredInstructions - discoveredInstructions)
         if missingInstructionFiles:
             raise Exception(f"ERROR: Instructions listed in configuration but missing instruction files: {missingInstructionFiles}")
@@ -0,0 +1,324 @@
+import glob
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from hashlib import md5
+from typing import Dict, List, Optional, Tuple
+
+import NormalizeInstructions
+import GenerateAutogenInstructions
+import CompileAutogenInstructions
+import ParallelBuild
+from CompileAutogenInstructions import GeneratedMicrocodeResult, IterateColumnSlices, MICROCODE_SIZE, UCODE_ORDER
+
+LOGGER = logging.getLogger(__name__)
+
+MICROCODE_DIR = os.path.dirname(__file__)
+MANIFEST_FILE = os.path.join(MICROCODE_DIR, "out", "buildManifest.json")
+MANIFEST_VERSION = 1
+INSTRUCTION_DIR = os.path.join(MICROCODE_DIR, "Instructions")
+
+# A change to any of these can change every image, so it forces a full rebuild
+GENERATOR_SOURCES = [
+    "MicrocodeConfig.py",
+    "NormalizeInstructions.py",
+    "GenerateAutogenInstructions.py",
+    "CompileAutogenInstructions.py",
+    "IncrementalBuild.py",
+    "ParallelBuild.py",
+]
+
+
+@dataclass
+class InstructionBuildRecord:
+    SourceHash: str
+    AddressColumns: List[Tuple[int, int]]
+    DataColumnsByChip: List[List[int]]
+
+
+@dataclass
+class BuildManifest:
+    ConfigHash: str
+    GeneratorHash: str
+    ImageHashes: Dict[str, str]
+    Instructions: Dict[str, InstructionBuildRecord] = field(default_factory=dict)
+
+
+def CalculateFileMd5(filePath: str) -> str:
+    with open(filePath, "rb") as filePointer:
+        return md5(filePointer.read()).hexdigest()
+
+
+def CalculateGeneratorHash() -> str:
+    """Hash the generator sources together, in a fixed order."""
+    generatorHash = md5()
+    for fileName in GENERATOR_SOURCES:
+        with open(os.path.join(MICROCODE_DIR, fileName), "rb") as filePointer:
+            generatorHash.update(filePointer.read())
+    return generatorHash.hexdigest()
+
+
+def GetInstructionSourcePaths() -> Dict[str, str]:
+    """Map every instruction name to its handwritten `Instructions/Ins<Name>.py` source."""
+    sourcePaths = {}
+    for filePath in sorted(glob.glob(os.path.join(INSTRUCTION_DIR, "Ins*.py"))):
+        sourcePaths[os.path.basename(filePath)[len("Ins"):-len(".py")]] = filePath
+    return sourcePaths
+
+
+def LoadManifest() -> Optional[BuildManifest]:
+    """Read the manifest of the last build, or None if there is no usable one."""
+    if not os.path.exists(MANIFEST_FILE):
+        return None
+    try:
+        with open(MANIFEST_FILE, "r") as filePointer:
+            data = json.load(filePointer)
+        if data.get("Version") != MANIFEST_VERSION:
+            return None
+        return BuildManifest(
+            ConfigHash=data["ConfigHash"],
+            GeneratorHash=data["GeneratorHash"],
+            ImageHashes=data["ImageHashes"],
+            Instructions={
+                instructionName: InstructionBuildRecord(
+                    SourceHash=record["SourceHash"],
+                    AddressColumns=[tuple(column) for column in record["AddressColumns"]],
+                    DataColumnsByChip=record["DataColumnsByChip"],
+                )
+                for instructionName, record in data["Instructions"].items()
+            },
+        )
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        LOGGER.warning(f"Ignoring unreadable build manifest: {error}")
+        return None
+
+
+def SaveManifest(result: GeneratedMicrocodeResult, configPath: str):
+    """
+    Record what the images were built from: the config, the generator, every
+    instruction source (after normalization) and each instruction's resolved
+    address columns and data bytes, so the next build can patch the images.
+    """
+    sourcePaths = GetInstructionSourcePaths()
+    data = {
+        "Version": MANIFEST_VERSION,
+        "ConfigHash": CalculateFileMd5(configPath),
+        "GeneratorHash": CalculateGeneratorHash(),
+        "ImageHashes": {chipName: md5(bytes(image)).hexdigest() for chipName, image in result.MicrocodeByChip.items()},
+        "Instructions": {
+            instructionName: {
+                "SourceHash": CalculateFileMd5(sourcePaths[instructionName]),
+                "AddressColumns": [list(column) for column in addressColumns],
+                "DataColumnsByChip": result.DataColumnsByInstruction[instructionName],
+            }
+            for instructionName, addressColumns in result.AddressColumnsByInstruction.items()
+        },
+    }
+    with open(MANIFEST_FILE, "w") as filePointer:
+        json.dump(data, filePointer, separators=(",", ":"))
+
+
+def IntersectColumns(firstColumn: Tuple[int, int], secondColumn: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+    """
+    Return the (fixed value, free mask) column of the addresses two columns
+    share, or None if they share none. Two columns overlap when they agree on
+    every bit that is fixed in both.
+    """
+    firstFixed, firstFree = firstColumn
+    secondFixed, secondFree = secondColumn
+    if (firstFixed ^ secondFixed) & ~(firstFree | secondFree):
+        return None
+    return firstFixed | secondFixed, firstFree & secondFree
+
+
+class MicrocodeImagePatcher:
+    def __init__(self, imagesByChip: Dict[str, bytearray], manifest: BuildManifest):
+        """
+        Edit finished chip images one instruction at a time. Overlaps between
+        instructions are found by intersecting their address columns, so only
+        the addresses of the instructions being replaced are ever touched.
+        """
+        self.ImagesByChip = imagesByChip
+        self.Images = [imagesByChip[chipName] for chipName in UCODE_ORDER]
+        self.InstructionOrder = list(manifest.Instructions)
+        self.AddressColumnsByInstruction = {
+            instructionName: record.AddressColumns for instructionName, record in manifest.Instructions.items()
+        }
+        self.DataColumnsByInstruction = {
+            instructionName: record.DataColumnsByChip for instructionName, record in manifest.Instructions.items()
+        }
+
+
+    def IterateColumns(self, instructionName: str):
+        """Yield (address column, data byte per chip) for every column of one instruction."""
+        dataColumnsByChip = self.DataColumnsByInstruction[instructionName]
+        for columnIndex, addressColumn in enumerate(self.AddressColumnsByInstruction[instructionName]):
+            yield addressColumn, [dataColumns[columnIndex] for dataColumns in dataColumnsByChip]
+
+
+    def WriteColumn(self, addressColumn: Tuple[int, int], columnValues: List[int]):
+        for addressSlice, count in IterateColumnSlices(*addressColumn):
+            for image, value in zip(self.Images, columnValues):
+                image[addressSlice] = bytes((value,)) * count
+
+
+    def RemoveInstruction(self, instructionName: str):
+        """
+        Take one instruction out of the images: clear its addresses, then
+        write back what the remaining instructions store where they overlap.
+        """
+        oldColumns = [addressColumn for addressColumn, _ in self.IterateColumns(instructionName)]
+        del self.AddressColumnsByInstruction[instructionName]
+        del self.DataColumnsByInstruction[instructionName]
+
+        for addressColumn in oldColumns:
+            self.WriteColumn(addressColumn, [0] * len(self.Images))
+        for otherName in self.AddressColumnsByInstruction:
+            for otherColumn, otherValues in self.IterateColumns(otherName):
+                for addressColumn in oldColumns:
+                    overlap = IntersectColumns(addressColumn, otherColumn)
+                    if overlap is not None:
+                        self.WriteColumn(overlap, otherValues)
+
+
+    def AddInstruction(self, instructionName: str, addressColumns: List[Tuple[int, int]],
+                       dataColumnsByChip: List[List[int]]):
+        """
+        Write one instruction table into the images after checking it, column
+        against column, for addresses it would store different data at than
+        itself or any instruction already in the images.
+        """
+        self.AddressColumnsByInstruction[instructionName] = list(addressColumns)
+        self.DataColumnsByInstruction[instructionName] = dataColumnsByChip
+        newColumns = list(self.IterateColumns(instructionName))
+
+        for otherName in self.AddressColumnsByInstruction:
+            for otherColumn, otherValues in self.IterateColumns(otherName):
+                for addressColumn, columnValues in newColumns:
+                    if columnValues == otherValues:
+                        continue
+                    overlap = IntersectColumns(addressColumn, otherColumn)
+                    if overlap is not None:
+                        self.RaiseWriteConflict(overlap[0], otherName, otherValues, instructionName, columnValues)
+
+        for addressColumn, columnValues in newColumns:
+            self.WriteColumn(addressColumn, columnValues)
+
+
+    def RaiseWriteConflict(self, address: int, previousName: str, previousValues: List[int],
+                           instructionName: str, values: List[int]):
+        for chipIndex, chipName in enumerate(UCODE_ORDER):
+            if previousValues[chipIndex] != values[chipIndex]:
+                break
+        raise Exception(
+            f"ERROR: Conflicting microcode writes at address 0x{address:04x} on chip '{chipName}': "
+            f"'{previousName}' wrote 0x{previousValues[chipIndex]:02x}, "
+            f"'{instructionName}' writes 0x{values[chipIndex]:02x}."
+        )
+
+
+    def GetResult(self, lastMicroInstructionMatrix) -> GeneratedMicrocodeResult:
+        """Package the patched images the way a full build returns them, in full-build instruction order."""
+        return GeneratedMicrocodeResult(
+            MicrocodeByChip=self.ImagesByChip,
+            LastMicroInstructionMatrix=lastMicroInstructionMatrix,
+            AddressColumnsByInstruction={
+                instructionName: self.AddressColumnsByInstruction[instructionName] for instructionName in self.InstructionOrder
+            },
+            DataColumnsByInstruction={
+                instructionName: self.DataColumnsByInstruction[instructionName] for instructionName in self.InstructionOrder
+            },
+        )
+
+
+def GetFullRebuildReason(manifest: Optional[BuildManifest], configPath: str,
+                         previousSnapshots: Dict[str, bytes]) -> Optional[str]:
+    """Explain why the last build's images can not be patched, or return None if they can."""
+    if manifest is None:
+        return "no build manifest from a previous build"
+    if manifest.ConfigHash != CalculateFileMd5(configPath):
+        return "MicroCodeConfig.yaml changed"
+    if manifest.GeneratorHash != CalculateGeneratorHash():
+        return "the microcode generator changed"
+    if set(GetInstructionSourcePaths()) != set(manifest.Instructions):
+        return "instruction files were added or removed"
+    for chipName in UCODE_ORDER:
+        image = previousSnapshots.get(chipName)
+        if image is None or len(image) != MICROCODE_SIZE or md5(image).hexdigest() != manifest.ImageHashes.get(chipName):
+            return f"out/{chipName}.bin is missing or was modified"
+    return None
+
+
+def BuildChangedInstructions(changedInstructions: List[str], configPath: str):
+    """Normalize, autogen and parse the changed instructions in this process; yield their tables."""
+    LOGGER.info("Step 1: Normalizing changed instruction files...")
+    normalizer = NormalizeInstructions.InstructionNormalizer(configPath)
+    normalizer.NormalizeAllInstructions(overwriteSource=True, instructionNames=changedInstructions)
+    LOGGER.info("")
+
+    LOGGER.info("Step 2: Generating autogen instructions for changed instructions...")
+    autoGen = GenerateAutogenInstructions.GenAutoInstructions()
+    autoGen.AutogenEachInstruction(instructionNames=changedInstructions)
+    LOGGER.info("")
+
+    LOGGER.info("Step 3: Patching microcode images...")
+    insParser = CompileAutogenInstructions.ParseInstructions(instructionNames=changedInstructions)
+    insParser.ParseEachInstruction()
+    for instructionName in changedInstructions:
+        parsedInstruction = insParser.InstructionParsedData[instructionName]
+        addressColumns, dataColumnsByChip = insParser.BuildInstructionTables(parsedInstruction)
+        yield instructionName, addressColumns, dataColumnsByChip, parsedInstruction.MicroInstructionMatrix
+
+
+def RunIncrementalBuild(configPath: str, previousSnapshots: Dict[str, bytes],
+                        jobs: int = 1) -> Optional[GeneratedMicrocodeResult]:
+    """
+    Rebuild only the instructions whose source changed since the last build
+    and patch them into that build's images. With `jobs` other than 1 and
+    several changes, the changed instructions are built in a process pool.
+    Returns None when a full build is needed instead.
+    """
+    manifest = LoadManifest()
+    reason = GetFullRebuildReason(manifest, configPath, previousSnapshots)
+    if reason is not None:
+        LOGGER.info(f"Full rebuild: {reason}.")
+        LOGGER.info("")
+        return None
+
+    sourcePaths = GetInstructionSourcePaths()
+    changedInstructions = [
+        instructionName for instructionName, record in manifest.Instructions.items()
+        if CalculateFileMd5(sourcePaths[instructionName]) != record.SourceHash
+    ]
+    patcher = MicrocodeImagePatcher(
+        {chipName: bytearray(previousSnapshots[chipName]) for chipName in UCODE_ORDER}, manifest
+    )
+    if not changedInstructions:
+        LOGGER.info("Incremental build: no instruction changed since the last build.")
+        LOGGER.info("")
+        return patcher.GetResult(None)
+
+    LOGGER.info(f"Incremental build: {', '.join(changedInstructions)} changed since the last build.")
+
+    if jobs != 1 and len(changedInstructions) > 1:
+        LOGGER.info(f"Step 1: Building {len(changedInstructions)} changed instructions in parallel...")
+        builtInstructions = [
+            (result.InstructionName, result.AddressColumns, result.DataColumnsByChip, result.MicroInstructionMatrix)
+            for result in ParallelBuild.BuildInstructionsInParallel(changedInstructions, configPath, jobs)
+        ]
+        LOGGER.info("")
+        LOGGER.info("Step 2: Patching microcode images...")
+    else:
+        builtInstructions = list(BuildChangedInstructions(changedInstructions, configPath))
+
+    for instructionName in changedInstructions:
+        patcher.RemoveInstruction(instructionName)
+    lastMicroInstructionMatrix = None
+    for instructionName, addressColumns, dataColumnsByChip, microInstructionMatrix in builtInstructions:
+        patcher.AddInstruction(instructionName, addressColumns, dataColumnsByChip)
+        lastMicroInstructionMatrix = microInstructionMatrix
+        LOGGER.info(f"   Patched: {instructionName}")
+    LOGGER.info("")
+
+    return patcher.GetResult(lastMicroInstructionMatrix)
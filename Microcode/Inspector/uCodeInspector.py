@@ -5,6 +5,9 @@ import yaml
 from StyleSheet import StyleSheet
 from widgets import LedWidget, SignalWidget, BitCheckBox
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MicrocodeMap import MicrocodeMapFile
+
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QColor
 from PySide6.QtWidgets import (
@@ -43,6 +46,7 @@ class VerifyWindow(QWidget):
 
         self.yamlConfig = {}
         self.microcodeData = [[], [], []]
+        self.microcodeMap = None
 
         self.inputSignalMap = {}
         self.outputSignalMap = {}
@@ -173,12 +177,16 @@ class VerifyWindow(QWidget):
         ucode2Button = QPushButton("Load uCode2")
         ucode2Button.clicked.connect(lambda: self.LoadMicrocode(2))
 
+        mapButton = QPushButton("Load Map")
+        mapButton.clicked.connect(self.LoadMicrocodeMap)
+
         self.addressLabel = QLabel("Address: 0")
 
         fileLayout.addWidget(yamlButton)
         fileLayout.addWidget(ucode0Button)
         fileLayout.addWidget(ucode1Button)
         fileLayout.addWidget(ucode2Button)
+        fileLayout.addWidget(mapButton)
         fileLayout.addStretch()
         fileLayout.addWidget(self.addressLabel)
 
@@ -365,6 +373,36 @@ class VerifyWindow(QWidget):
 
     # ========================================================
 
+    def LoadMicrocodeMap(self):
+
+        filePath, _ = QFileDialog.getOpenFileName(
+            self,
+            "Load Map",
+            "",
+            "Microcode Map (microCodeMap.bin);;BIN Files (*.bin)"
+        )
+
+        if not filePath:
+            return
+
+        # All three chip images come from one memory-mapped file
+        microcodeMap = MicrocodeMapFile(filePath)
+
+        if self.microcodeMap:
+            self.microcodeMap.Close()
+
+        self.microcodeMap = microcodeMap
+
+        for index in range(3):
+
+            self.microcodeData[index] = microcodeMap.ChipImages[index]
+
+            self.UpdateMicrocodeView(index)
+
+        self.UpdateAddress()
+
+    # ========================================================
+
     def UpdateMicrocodeView(self, index):
 
         view = self.microcodeViews[index]
@@ -470,9 +508,12 @@ class VerifyWindow(QWidget):
 
         address = self.CalculateAddress()
 
-        self.addressLabel.setText(
-            f"Address: {address} (0x{address:04X})"
-        )
+        addressText = f"Address: {address} (0x{address:04X})"
+
+        if self.microcodeMap and address < self.microcodeMap.Size:
+            addressText += f"\nWritten by: {self.microcodeMap.GetOwner(address) or '-'}"
+
+        self.addressLabel.setText(addressText)
 
         self.HighlightAddress(address)
         self.DecodeSignals(address)
@@ -270,6 +270,26 @@ def GetAllInstructionSizes(config: Dict[str, Any]) -> Dict[str, int]:
     return sizeDict
 
 
+def GetAllInstructionMasks(config: Dict[str, Any]) -> Dict[str, str]:
+    """Get a dictionary mapping instruction names to their 8-character opcode masks
+
+    For '0bxxxx_0001' returns 'xxxx0001'; 'x' marks the operand bits.
+    """
+    insConfig = config.get(CFG_INS_CONFIG, {})
+    instructions = insConfig.get(CFG_INSTRUCTIONS, {})
+
+    maskDict = {}
+    if isinstance(instructions, dict):
+        for insName, insData in instructions.items():
+            if isinstance(insData, dict):
+                opcode = insData.get('opcode', -1)
+                if isinstance(opcode, str) and opcode.startswith('0b'):
+                    maskDict[insName] = opcode[2:].replace('_', '').zfill(8)
+                else:
+                    maskDict[insName] = f"{opcode:08b}"
+    return maskDict
+
+
 if __name__ == "__main__":
     import os
     configPath = os.path.join(os.path.dirname(__file__), "MicroCodeConfig.yaml")
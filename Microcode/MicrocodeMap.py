@@ -0,0 +1,228 @@
+import csv
+import mmap
+import os
+import struct
+from typing import List, Optional
+
+from CompileAutogenInstructions import (
+    GeneratedMicrocodeResult,
+    IterateFreeBitSubsets,
+    MicrocodeImageBuilder,
+    SHARED_OWNER,
+    UNCLAIMED_OWNER,
+)
+
+MAP_FORMAT_TEXT = "text"
+MAP_FORMAT_CSV = "csv"
+MAP_FORMAT_BINARY = "bin"
+MAP_FILE_NAMES = {
+    MAP_FORMAT_TEXT: "microCodeMap.txt",
+    MAP_FORMAT_CSV: "microCodeMap.csv",
+    MAP_FORMAT_BINARY: "microCodeMap.bin",
+}
+MAP_WRITE_BUFFER_SIZE = 1 << 20
+
+# Binary map: header, instruction name table, one plane per chip image, one owner plane
+MAP_MAGIC = b"UCMP"
+MAP_VERSION = 1
+MAP_HEADER = struct.Struct("<4sHBBHH")   # magic, version, chip count, name length, image size, instruction count
+MAP_NAME_LENGTH = 8
+MAP_OWNER_SHARED = 0xFE
+MAP_OWNER_UNCLAIMED = 0xFF
+MAP_SHARED_NAME = "shared"
+
+
+def WriteTextMap(result: GeneratedMicrocodeResult, filePath: str):
+    """
+    Write the human-readable address map: one section per instruction and
+    chip, one line per address the instruction writes. The lines are built
+    from the finished images and the instruction address masks, a column at
+    a time, and streamed through a large write buffer.
+    """
+    addressTexts = []
+    for address in range(len(result.OwnerByAddress)):
+        strAdd = f"{address:015b}"
+        addressTexts.append(
+            (f"0x{address:04x}", f"{strAdd[:2]}_{strAdd[2:3]}_{strAdd[3:7]}_{strAdd[7:11]}.{strAdd[11:15]}")
+        )
+    valueTexts = []
+    for value in range(256):
+        strVal = f"{value:08b}"
+        valueTexts.append((f"0x{value:02x}", f"{strVal[:4]}.{strVal[4:8]}"))
+
+    with open(filePath, "w", buffering=MAP_WRITE_BUFFER_SIZE) as mapFilePointer:
+        for instruction, addressColumns in result.AddressColumnsByInstruction.items():
+            for chipName, image in result.MicrocodeByChip.items():
+                mapFilePointer.write(f"\n\nInstruction: {instruction}; Chip: {chipName}\n")
+                mapFilePointer.write(f"------------------------------------------------------------------------------\n")
+                mapFilePointer.write(f"                                   |       |  uu f ssss iiii iiii |  iiii iiii\n")
+                mapFilePointer.write(f"                           Address |  Val  |  nn l qqqq nnnn nnnn |  oooo oooo\n")
+                mapFilePointer.write(f"                                   |       |  01 g 3210 0123 4567 |  7654 3210\n")
+                mapFilePointer.write(f"------------------------------------------------------------------------------\n")
+                linePrefix = f"chip_{chipName}_ins_{instruction.lower()}_"
+                mapIndex = 1
+                for fixedValue, freeMask in addressColumns:
+                    lines = []
+                    for subset in IterateFreeBitSubsets(freeMask):
+                        address = fixedValue | subset
+                        addressHex, addressBits = addressTexts[address]
+                        valueHex, valueBits = valueTexts[image[address]]
+                        lines.append(f"{linePrefix}{mapIndex:04d} :: {addressHex} => {valueHex} // {addressBits} :: {valueBits}\n")
+                        mapIndex += 1
+                    mapFilePointer.write("".join(lines))
+
+
+def WriteCsvMap(result: GeneratedMicrocodeResult, filePath: str):
+    """
+    Write one CSV row per address any instruction writes: the address, the
+    byte of every chip and the instruction that owns it, or `shared` for the
+    steps all instructions have in common.
+    """
+    instructionNames = list(result.AddressColumnsByInstruction)
+    chipNames = list(result.MicrocodeByChip)
+    images = list(result.MicrocodeByChip.values())
+    with open(filePath, "w", newline="", buffering=MAP_WRITE_BUFFER_SIZE) as csvFilePointer:
+        writer = csv.writer(csvFilePointer)
+        writer.writerow(["address"] + chipNames + ["instruction"])
+        for address, owner in enumerate(result.OwnerByAddress):
+            if owner == UNCLAIMED_OWNER:
+                continue
+            ownerName = MAP_SHARED_NAME if owner == SHARED_OWNER else instructionNames[owner]
+            writer.writerow([f"0x{address:04x}"] + [f"0x{image[address]:02x}" for image in images] + [ownerName])
+
+
+def WriteBinaryMap(result: GeneratedMicrocodeResult, filePath: str):
+    """
+    Write the compact map `MicrocodeMapFile` memory-maps: a header, the
+    instruction names, every chip image as one plane and one owner byte per
+    address (instruction index, `MAP_OWNER_SHARED` or `MAP_OWNER_UNCLAIMED`).
+    """
+    instructionNames = list(result.AddressColumnsByInstruction)
+    if len(instructionNames) >= MAP_OWNER_SHARED:
+        raise Exception(
+            f"ERROR: The binary microcode map holds at most {MAP_OWNER_SHARED - 1} instructions, "
+            f"found {len(instructionNames)}."
+        )
+
+    imageSize = len(result.OwnerByAddress)
+    ownerPlane = bytearray(imageSize)
+    for address, owner in enumerate(result.OwnerByAddress):
+        if owner == UNCLAIMED_OWNER:
+            ownerPlane[address] = MAP_OWNER_UNCLAIMED
+        elif owner == SHARED_OWNER:
+            ownerPlane[address] = MAP_OWNER_SHARED
+        else:
+            ownerPlane[address] = owner
+
+    with open(filePath, "wb") as mapFilePointer:
+        mapFilePointer.write(MAP_HEADER.pack(
+            MAP_MAGIC, MAP_VERSION, len(result.MicrocodeByChip), MAP_NAME_LENGTH, imageSize, len(instructionNames)
+        ))
+        for instructionName in instructionNames:
+            mapFilePointer.write(instructionName.encode("ascii")[:MAP_NAME_LENGTH].ljust(MAP_NAME_LENGTH, b"\0"))
+        for image in result.MicrocodeByChip.values():
+            mapFilePointer.write(image)
+        mapFilePointer.write(ownerPlane)
+
+
+MAP_WRITERS = {
+    MAP_FORMAT_TEXT: WriteTextMap,
+    MAP_FORMAT_CSV: WriteCsvMap,
+    MAP_FORMAT_BINARY: WriteBinaryMap,
+}
+
+
+def GetAddressOwners(result: GeneratedMicrocodeResult) -> List[int]:
+    """
+    Return the owner of every address. An incremental build does not track
+    owners, so they are recovered by merging the instruction tables again.
+    """
+    if result.OwnerByAddress:
+        return result.OwnerByAddress
+    imageBuilder = MicrocodeImageBuilder()
+    for instructionName, addressColumns in result.AddressColumnsByInstruction.items():
+        imageBuilder.ApplyInstruction(instructionName, addressColumns, result.DataColumnsByInstruction[instructionName])
+    return imageBuilder.AddressOwners()
+
+
+def RemoveMaps(outputDir: str = "out"):
+    """Delete the maps of an earlier build, so none is left describing older images."""
+    for fileName in MAP_FILE_NAMES.values():
+        filePath = os.path.join(outputDir, fileName)
+        if os.path.exists(filePath):
+            os.remove(filePath)
+
+
+def WriteMaps(result: GeneratedMicrocodeResult, mapFormats: List[str], outputDir: str = "out") -> List[str]:
+    """Write the requested map formats next to the chip images and return their paths."""
+    result.OwnerByAddress = GetAddressOwners(result)
+    writtenPaths = []
+    for mapFormat in mapFormats:
+        filePath = os.path.join(outputDir, MAP_FILE_NAMES[mapFormat])
+        MAP_WRITERS[mapFormat](result, filePath)
+        writtenPaths.append(filePath)
+    return writtenPaths
+
+
+class MicrocodeMapFile:
+    def __init__(self, filePath: str):
+        """
+        Memory-map a binary microcode map. The chip planes are exposed as
+        read-only views, so a viewer can index addresses without parsing or
+        copying the file.
+        """
+        self.FilePointer = open(filePath, "rb")
+        self.Map = mmap.mmap(self.FilePointer.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.ChipCount, nameLength, self.Size, instructionCount = MAP_HEADER.unpack_from(self.Map, 0)
+        if magic != MAP_MAGIC or version != MAP_VERSION:
+            self.Close()
+            raise Exception(f"ERROR: '{filePath}' is not a version {MAP_VERSION} binary microcode map.")
+
+        offset = MAP_HEADER.size
+        self.InstructionNames: List[str] = []
+        for _ in range(instructionCount):
+            self.InstructionNames.append(bytes(self.Map[offset:offset + nameLength]).rstrip(b"\0").decode("ascii"))
+            offset += nameLength
+
+        self.View = memoryview(self.Map)
+        self.ChipImages = [self.View[offset + chipIndex * self.Size:offset + (chipIndex + 1) * self.Size]
+                           for chipIndex in range(self.ChipCount)]
+        ownerOffset = offset + self.ChipCount * self.Size
+        self.Owners = self.View[ownerOffset:ownerOffset + self.Size]
+
+
+    def GetValues(self, address: int) -> List[int]:
+        """Return the byte of every chip at one address."""
+        return [chipImage[address] for chipImage in self.ChipImages]
+
+
+    def GetOwner(self, address: int) -> Optional[str]:
+        """Return the instruction that writes one address, `shared`, or None if nothing does."""
+        owner = self.Owners[address]
+        if owner == MAP_OWNER_UNCLAIMED:
+            return None
+        if owner == MAP_OWNER_SHARED:
+            return MAP_SHARED_NAME
+        return self.InstructionNames[owner]
+
+
+    def Close(self):
+        """Release the views and the mapping."""
+        for chipImage in getattr(self, "ChipImages", []):
+            chipImage.release()
+        for view in (getattr(self, "Owners", None), getattr(self, "View", None)):
+            if view is not None:
+                view.release()
+        self.ChipImages = []
+        self.Owners = None
+        self.View = None
+        self.Map.close()
+        self.FilePointer.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.Close()
@@ -287,12 +287,14 @@ class InstructionNormalizer:
 
         return '\n'.join(lines)
 
-    def NormalizeAllInstructions(self, outputDir: str = "", overwriteSource: bool = False):
+    def NormalizeAllInstructions(self, outputDir: str = "", overwriteSource: bool = False,
+                                 instructionNames: Optional[List[str]] = None):
         """Normalize all instruction files in YAML order.
 
         Args:
             outputDir: Output directory for normalized files. If empty, uses out/normalized.
             overwriteSource: If True, overwrites source files in Instructions/ directory.
+            instructionNames: If given, only these instructions are normalized (incremental build).
         """
         instructionDir = os.path.join(os.path.dirname(__file__), "Instructions")
 
@@ -308,6 +310,8 @@ class InstructionNormalizer:
 
         # Get instruction order from YAML config using MicrocodeConfig helper
         instructionOrder = MicrocodeConfig.GetAllInstructions(self.config)
+        if instructionNames is not None:
+            instructionOrder = [name for name in instructionOrder if name in instructionNames]
 
         LOGGER.info(f"Normalizing {len(instructionOrder)} instruction files in YAML order...")
 
@@ -0,0 +1,116 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import NormalizeInstructions
+import GenerateAutogenInstructions
+import CompileAutogenInstructions
+from CompileAutogenInstructions import GeneratedMicrocodeResult, MicrocodeImageBuilder, ParsedMicroInstructionMatrix
+
+LOGGER = logging.getLogger(__name__)
+
+# Per worker process: the normalizer, built once from the config
+WORKER_NORMALIZER = None
+
+
+@dataclass
+class InstructionBuildResult:
+    InstructionName: str
+    AddressColumns: List[Tuple[int, int]]
+    DataColumnsByChip: List[List[int]]
+    MicroInstructionMatrix: ParsedMicroInstructionMatrix
+
+
+def ResolveJobCount(jobs: int) -> int:
+    """`0` means one worker per CPU."""
+    if jobs <= 0:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def BuildInstruction(instructionName: str, configPath: str) -> InstructionBuildResult:
+    """
+    Run normalize, autogen and address expansion for one instruction, in a
+    worker process. Every stage reads and writes only this instruction's
+    files, so workers never see each other's half-written sources. Only the
+    compact tables travel back: a (fixed value, free mask) pair per column
+    and one data byte per column and chip.
+    """
+    global WORKER_NORMALIZER
+    if WORKER_NORMALIZER is None:
+        logging.getLogger().setLevel(logging.WARNING)
+        WORKER_NORMALIZER = NormalizeInstructions.InstructionNormalizer(configPath)
+
+    WORKER_NORMALIZER.NormalizeAllInstructions(overwriteSource=True, instructionNames=[instructionName])
+
+    autoGen = GenerateAutogenInstructions.GenAutoInstructions(instructionNames=[instructionName])
+    autoGen.AutogenEachInstruction(instructionNames=[instructionName])
+
+    insParser = CompileAutogenInstructions.ParseInstructions(instructionNames=[instructionName])
+    insParser.ParseEachInstruction()
+    parsedInstruction = insParser.InstructionParsedData[instructionName]
+    addressColumns, dataColumnsByChip = insParser.BuildInstructionTables(parsedInstruction)
+    return InstructionBuildResult(
+        InstructionName=instructionName,
+        AddressColumns=addressColumns,
+        DataColumnsByChip=dataColumnsByChip,
+        MicroInstructionMatrix=parsedInstruction.MicroInstructionMatrix,
+    )
+
+
+def BuildInstructionsInParallel(instructionNames: List[str], configPath: str, jobs: int) -> List[InstructionBuildResult]:
+    """
+    Fan the per-instruction pipeline out over a process pool. Results come
+    back sorted by instruction name, the order a serial build merges in,
+    however the workers were scheduled.
+    """
+    instructionNames = sorted(instructionNames)
+    workerCount = min(ResolveJobCount(jobs), len(instructionNames))
+
+    # Created up front so no two workers race to create it
+    os.makedirs(os.path.join("out", "autogen"), exist_ok=True)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workerCount) as executor:
+        for result in executor.map(BuildInstruction, instructionNames, [configPath] * len(instructionNames)):
+            LOGGER.info(f"   Completed: {result.InstructionName}")
+            results.append(result)
+    return results
+
+
+def MergeInstructionResults(results: List[InstructionBuildResult]) -> GeneratedMicrocodeResult:
+    """Merge per-instruction tables into the chip images, in order, with the builder's conflict checks."""
+    imageBuilder = MicrocodeImageBuilder()
+    lastMicroInstructionMatrix: Optional[ParsedMicroInstructionMatrix] = None
+    for result in results:
+        imageBuilder.ApplyInstruction(result.InstructionName, result.AddressColumns, result.DataColumnsByChip)
+        lastMicroInstructionMatrix = result.MicroInstructionMatrix
+
+    return GeneratedMicrocodeResult(
+        MicrocodeByChip=imageBuilder.ChipImages(),
+        LastMicroInstructionMatrix=lastMicroInstructionMatrix,
+        AddressColumnsByInstruction=imageBuilder.AddressColumnsByInstruction,
+        DataColumnsByInstruction=imageBuilder.DataColumnsByInstruction,
+        OwnerByAddress=imageBuilder.AddressOwners(),
+    )
+
+
+def RunParallelBuild(configPath: str, jobs: int) -> GeneratedMicrocodeResult:
+    """
+    Build every instruction in parallel and merge the results. The config and
+    the set of instruction files are validated once, up front, so a broken
+    tree fails with the same message as a serial build.
+    """
+    LOGGER.info("Step 1: Validating instruction files against YAML configuration...")
+    instructionNames = list(GenerateAutogenInstructions.GenAutoInstructions().InstructionModulesByName)
+    LOGGER.info("")
+
+    LOGGER.info(f"Step 2: Normalizing, generating and expanding {len(instructionNames)} instructions "
+                f"with {min(ResolveJobCount(jobs), len(instructionNames))} workers...")
+    results = BuildInstructionsInParallel(instructionNames, configPath, jobs)
+    LOGGER.info("")
+
+    LOGGER.info("Step 3: Merging instruction tables into microcode images...")
+    return MergeInstructionResults(results)
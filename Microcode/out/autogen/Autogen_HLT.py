@@ -0,0 +1,53 @@
+# Auto-generated Instruction File for HLT
+# Generated from /root/package/Microcode/Instructions/InsHLT.py
+
+INS = '''
+INSTRUCTION:    HLT
+=============================
+| X | CLOCK | - | 0 | 1 | 2 |
+=============================
+| I | Ukwn0 | 0 | 0 | 0 | 0 |
+| I | Reset | 1 | 0 | 0 | 0 |
+| I | Flag  | - | - | - | - |
+| I | Seqn3 | - | 0 | 0 | 0 |
+| I | Seqn2 | - | 0 | 0 | 0 |
+| I | Seqn1 | - | 0 | 0 | 1 |
+| I | Seqn0 | - | 0 | 1 | 0 |
+| I | InsR0 | - | - | - | 1 |
+| I | InsR1 | - | - | - | 1 |
+| I | InsR2 | - | - | - | 1 |
+| I | InsR3 | - | - | - | 1 |
+| I | InsR4 | - | - | - | 1 |
+| I | InsR5 | - | - | - | 0 |
+| I | InsR6 | - | - | - | 1 |
+| I | InsR7 | - | - | - | 0 |
+|===|=======|===|===|===|===|
+| O | FlSe2 | 0 | 0 | 0 | 0 |
+| O | FlSe1 | 0 | 0 | 0 | 0 |
+| O | FlSe0 | 0 | 0 | 0 | 0 |
+| O | T2IS0 | 0 | 0 | 0 | 0 |
+| O | T2IS1 | 0 | 0 | 0 | 0 |
+| O | FlgU  | 0 | 0 | 0 | 0 |
+| O | MdO   | 0 | 0 | 0 | 0 |
+| O | PCHI  | 1 | 0 | 0 | 0 |
+|---|-------|---|---|---|---|
+| O | ViInA | 1 | 0 | 0 | 1 |
+| O | ViInB | 1 | 0 | 0 | 1 |
+| O | ViInC | 1 | 0 | 1 | 1 |
+| O | ViInD | 1 | 1 | 0 | 1 |
+| O | ViOtA | 0 | 0 | 1 | 1 |
+| O | ViOtB | 1 | 0 | 1 | 1 |
+| O | ViOtC | 1 | 1 | 1 | 1 |
+| O | ViOtD | 1 | 0 | 1 | 1 |
+|---|-------|---|---|---|---|
+| O | PCL   | 1 | 0 | 0 | 0 |
+| O | PCLI  | 1 | 0 | 0 | 0 |
+| O | AdSu  | 0 | 0 | 0 | 0 |
+| O | HLT   | 0 | 0 | 0 | 1 |
+| O | SpUd  | 0 | 0 | 0 | 0 |
+| O | SpC   | 0 | 0 | 0 | 0 |
+| O | Cin   | 0 | 0 | 0 | 0 |
+| O | Sgn   | 0 | 0 | 0 | 0 |
+=============================
+
+'''
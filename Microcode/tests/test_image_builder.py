@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import CompileAutogenInstructions
+from CompileAutogenInstructions import MicrocodeImageBuilder, SHARED_OWNER, UNCLAIMED_OWNER
+
+BACKENDS = ["numpy", "bytearray"]
+
+
+@pytest.fixture(params=BACKENDS)
+def builder(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(CompileAutogenInstructions, "np", None)
+    return MicrocodeImageBuilder(chipNames=["uCode0", "uCode1"], size=64)
+
+
+def test_conflict_on_single_address_column(builder):
+    builder.ApplyInstruction("A", [(0x10, 0x3)], [[0x11], [0x22]])
+    with pytest.raises(Exception, match=r"address 0x0011 on chip 'uCode1': 'A' wrote 0x22, 'C' writes 0x33"):
+        builder.ApplyInstruction("C", [(0x11, 0)], [[0x11], [0x33]])
+
+
+def test_conflict_on_strided_column(builder):
+    builder.ApplyInstruction("A", [(0x04, 0)], [[0x01], [0x02]])
+    with pytest.raises(Exception, match=r"address 0x0004 on chip 'uCode0': 'A' wrote 0x01, 'B' writes 0x05"):
+        builder.ApplyInstruction("B", [(0x00, 0x0C)], [[0x05], [0x02]])
+
+
+def test_conflict_with_shared_address(builder):
+    builder.ApplyInstruction("A", [(0x20, 0x1)], [[0x07], [0x08]])
+    builder.ApplyInstruction("B", [(0x20, 0)], [[0x07], [0x08]])
+    with pytest.raises(Exception, match=r"address 0x0020 on chip 'uCode0': several instructions wrote 0x07"):
+        builder.ApplyInstruction("C", [(0x20, 0)], [[0x09], [0x08]])
+
+
+def test_equal_writes_share_addresses(builder):
+    builder.ApplyInstruction("A", [(0x10, 0x3)], [[0x11], [0x22]])
+    builder.ApplyInstruction("B", [(0x11, 0), (0x30, 0)], [[0x11, 0x44], [0x22, 0x55]])
+
+    images = builder.ChipImages()
+    assert list(images["uCode0"][0x10:0x14]) == [0x11] * 4
+    assert images["uCode0"][0x30] == 0x44
+    assert images["uCode1"][0x30] == 0x55
+    owners = list(builder.AddressOwners())
+    assert owners[0x10:0x14] == [0, SHARED_OWNER, 0, 0]
+    assert owners[0x30] == 1
+    assert owners[0x31] == UNCLAIMED_OWNER